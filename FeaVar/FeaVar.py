@@ -17,18 +17,108 @@ __maintainer__ = "R. Burke Squires"
 __email__ = "burkesquires (at) gmail.com"
 __status__ = "Beta"
 
+import logging
+import os
+import re
+import sys
+
+import numpy
 import pandas
 from Bio import AlignIO
 
+try:
+    from FeaVar.alignment_matrix import AlignmentMatrix, as_alignment_matrix, group_feature_rows
+    from FeaVar.coordinate_map import CoordinateMap
+    from FeaVar.id_index import SequenceIdIndex
+    from FeaVar import association, codon, columnar, epitope, fvaln, incremental, instrumentation, naming, \
+        parallel, plotting, result_cache, scan, streaming
+except ImportError:  # run as a script from inside the package directory
+    from alignment_matrix import AlignmentMatrix, as_alignment_matrix, group_feature_rows
+    from coordinate_map import CoordinateMap
+    from id_index import SequenceIdIndex
+    import association
+    import codon
+    import columnar
+    import epitope
+    import fvaln
+    import incremental
+    import instrumentation
+    import naming
+    import parallel
+    import plotting
+    import result_cache
+    import scan
+    import streaming
+
+# the number of metadata rows parsed at a time
+METADATA_CHUNK_SIZE = 100000
+
+# the format of the output tables, csv or a columnar dataset (see columnar); set by --output_format
+output_format = "csv"
+
+# the derived tables written in a columnar format (see columnar.DERIVED_TABLES); set by --tables
+output_tables = []
+
+# the directory the results are written to; set by configure_run (output/ in the working directory), results
+# of the pipeline functions called without a RunContext before that are not written
+output_dir = None
+
+# the largest number of variant types whose distance matrix is written (it grows with the square)
+DISTANCE_MATRIX_MAX_VARIANT_TYPES = 10000
+
+# the stage measurements of the functions called without a RunContext (see instrumentation)
+recorder = instrumentation.RunRecorder(__version__)
+
+
+class RunContext:
+    """
+    Where and how one analysis writes its results, and the recorder measuring it. The pipeline
+    functions take a RunContext (context=) instead of reading module state, so analyses with their
+    own contexts can run concurrently; without one they use default_context().
+
+    Parameters
+    ----------
+    output_dir : string
+        The directory the results are written to (created if missing); None to not write the results
+
+    output_format : string
+        The format of the output tables, csv or a columnar dataset (see columnar)
+
+    output_tables : list
+        The derived tables written in a columnar format (see columnar.DERIVED_TABLES)
+
+    recorder : RunRecorder
+        The stage measurements of the analysis; default is a new recorder
+    """
+
+    def __init__(self, output_dir: str = None, output_format: str = "csv", output_tables: list = (), recorder=None):
+
+        if output_format not in columnar.OUTPUT_FORMATS:
+            raise ValueError("Unknown output format: {}".format(output_format))
+
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.output_format = output_format
+        self.output_tables = list(output_tables)
+        self.recorder = recorder if recorder is not None else instrumentation.RunRecorder(__version__)
+
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+
+def default_context() -> RunContext:
+    """
+    The context of the pipeline functions called without one: the module configuration (see configure_run).
+    Before configure_run sets the output directory (e.g. in library use) the results are not written.
+    """
 
-# TODO Add ability to use native IEDB format (H25, H45, V46, N47, L496, S306, L307, P308, T333;
-# B: D363, G364, W365, Q382, T385, Q386, I389, D390, T393, V396, N397, I400
+    return RunContext(output_dir, output_format, output_tables, recorder)
 
 
 def parse_position_input(raw_positions: str) -> list:
     """
     Takes a string argument of positions and splits it out into individual start and stop positions.
     The positions can be one or more columns or integers and linear or non-linear.
+    Positions may use the native IEDB notation, e.g. "H25, H45, V46; B: D363" (see epitope.parse_epitope).
 
     Args:
         raw_positions : The raw positions of the reference sequence to assemble a sequence feature from.
@@ -38,30 +128,17 @@ def parse_position_input(raw_positions: str) -> list:
 
     """
 
-    logging.debug("parse_position_input raw positions: {0}".format(raw_positions))
-
-    position_coordinates = []
-
-    position_groupings = raw_positions.split(",")
-
-    if len(position_groupings) > 0:
-
-        for position_group in position_groupings:
-
-            positions = position_group.split("-")
-
-            if len(positions) == 2:
-
-                temp_list = list(range(int(positions[0]), int(positions[1]) + 1))
-                position_coordinates.extend(temp_list)
+    logging.debug("parse_position_input raw positions: %s", raw_positions)
 
-            elif len(positions) == 1:
+    residues = epitope.parse_epitope(raw_positions)
 
-                position_coordinates.append(int(positions[0]))
+    if len(epitope.epitope_chains(residues)) > 1:
+        logging.warning("Positions of several chains are all read against the one reference sequence: %s",
+                        raw_positions)
 
-    sorted_positions = sorted(position_coordinates)
+    sorted_positions = sorted(residue.position for residue in residues)
 
-    logging.debug("parse_position_input parsed positions: " + str(sorted_positions))
+    logging.debug("parse_position_input parsed positions: %s", sorted_positions)
 
     return sorted_positions
 
@@ -77,22 +154,12 @@ def create_index_offset_list(ref_seq) -> list:
         A list of offset values for each position in the alignment
     """
 
-    logging.debug("create_index_offset_list ref_seq: {0}".format(ref_seq))
-
-    seq_length = len(ref_seq)
-
-    dash_indices = [pos for pos, char in enumerate(ref_seq) if char == "-"]
-
     # NOTE: remember that the indices begin at 0 and the sequence feature positions begin at 1
 
-    index_correction_factor = [0] * seq_length
-
-    for dash_idx in dash_indices:
+    index_correction_factor = CoordinateMap(ref_seq).gap_offsets().tolist()
 
-        for idx in range(dash_idx, seq_length):
-            index_correction_factor[idx] += 1
-
-    logging.debug("create_index_offset_list index_correction_factor: {0}".format(str(index_correction_factor)))
+    logging.debug("create_index_offset_list: %d positions, %d reference gaps",
+                  len(index_correction_factor), index_correction_factor[-1] if index_correction_factor else 0)
 
     return index_correction_factor
 
@@ -108,25 +175,10 @@ def correct_index_dict(ref_seq: str) -> dict:
         A dictionary of original positions to new positions.
     """
 
-    corrected_index = {}
-
-    dash_count = 0
-    char_count = 1
-
-    for idx, char in enumerate(ref_seq):
-
-        if char == "-":
-            dash_count += 1
-            continue
-
-        corrected_index[char_count] = char_count + dash_count
-
-        char_count += 1
-
-    return corrected_index
+    return CoordinateMap(ref_seq).as_dict()
 
 
-def adjust_positions_for_insertions(ref_seq: str, positions: list) -> list:
+def adjust_positions_for_insertions(ref_seq: str, positions: list, coordinate_map: CoordinateMap = None) -> list:
     """
     Takes a string argument of positions and the aligned reference sequence and
     corrects the sequence feature positions for any insertions in the reference sequence.
@@ -140,6 +192,9 @@ def adjust_positions_for_insertions(ref_seq: str, positions: list) -> list:
         The reference sequence pulled from the alignment (with insertion dashes included (if applicable))
         :rtype: list
 
+    coordinate_map : CoordinateMap
+        The coordinate map of ref_seq, when it is already built (e.g. for a batch of features)
+
     """
     # SFVT      [   23  45   89   ]
     # Positions [--123--456-78901-]
@@ -155,9 +210,10 @@ def adjust_positions_for_insertions(ref_seq: str, positions: list) -> list:
 
         if ref_seq:
 
-            corrected_indices = correct_index_dict(ref_seq)
+            if coordinate_map is None:
+                coordinate_map = CoordinateMap(ref_seq)
 
-            return [corrected_indices[position] for position in positions]
+            return coordinate_map.to_aligned(positions).tolist()
 
         else:
 
@@ -168,6 +224,94 @@ def adjust_positions_for_insertions(ref_seq: str, positions: list) -> list:
         print("No positions to adjust.")
 
 
+def feature_columns(ref_seq: str, positions: list, coordinate_map: CoordinateMap = None) -> list:
+    """
+    The alignment columns (0-based indices) of the residues at the given reference positions; the
+    positions are corrected for insertions in the reference (see adjust_positions_for_insertions).
+    Every extraction engine reads the sequence features at these columns.
+
+    Parameters
+    ----------
+    ref_seq : string
+        The reference sequence as found in the alignment, with insertion dashes
+
+    positions : list
+        The ungapped reference positions (1-based) of the sequence feature
+
+    coordinate_map : CoordinateMap
+        The coordinate map of ref_seq, when it is already built (e.g. for a batch of features)
+
+    Raises
+    ------
+    ValueError
+        If a position is not in the reference sequence
+    """
+
+    if coordinate_map is None:
+        coordinate_map = CoordinateMap(ref_seq)
+
+    try:
+        return coordinate_map.to_columns(positions).tolist()
+    except KeyError as err:
+        raise ValueError("Position {} is not in the reference sequence".format(err.args[0]))
+
+
+def load_alignment(alignment_file_path: str, alignment_format: str = "clustal", binary_cache: bool = False):
+    """
+    Parse the multiple sequence alignment once so it can be shared by every stage of the pipeline.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the alignment
+
+    alignment_format : string
+        The format of the alignment, default is clustal; "fvaln" memory maps a binary alignment
+
+    binary_cache : bool
+        Convert a text alignment to a .fvaln binary file next to it on first use and
+        memory map that file on later runs instead of parsing the text again
+    """
+
+    if alignment_format == "fvaln" or alignment_file_path.endswith(fvaln.EXTENSION):
+        return fvaln.load_fvaln(alignment_file_path)
+
+    if binary_cache:
+
+        fvaln_file_path = fvaln.fvaln_path_for(alignment_file_path)
+
+        if not fvaln.fvaln_is_current(fvaln_file_path, alignment_file_path):
+            fvaln.convert_alignment(alignment_file_path, alignment_format, fvaln_file_path)
+
+        return fvaln.load_fvaln(fvaln_file_path)
+
+    return AlignIO.read(alignment_file_path, alignment_format)
+
+
+def find_reference_sequence(reference_identifier, alignment):
+    """
+    Resolves the reference identifier against the identifier index of the alignment
+    (exact id, accession, accession without version, accession prefix and finally substring).
+
+    Parameters
+    ----------
+    reference_identifier : string
+        The identifier (accession, gid) of the reference sequence
+
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    Returns
+    -------
+    A ReferenceMatch (see FeaVar.id_index); its row is None if nothing or more than one sequence matched
+    """
+
+    if isinstance(alignment, AlignmentMatrix):
+        return alignment.id_index.lookup(reference_identifier)
+
+    return SequenceIdIndex([record.id for record in alignment]).lookup(reference_identifier)
+
+
 def check_for_ref_seq_in_alignment(reference_identifier, alignment, msa_format="clustal"):
     """
     Tests to see if the reference identifier (accession, etc) can be found in
@@ -179,25 +323,35 @@ def check_for_ref_seq_in_alignment(reference_identifier, alignment, msa_format="
         The identifier (accession, gid) of the reference sequence
 
     alignment :
-        The multiple sequence alignment to be used for the SFVT analysis
+        The multiple sequence alignment to be used for the SFVT analysis, either already
+        loaded (see load_alignment) or the file path of the alignment
 
     msa_format : string
-        The msa_format of the alignment, default is clustal
+        The msa_format of the alignment, default is clustal; only used when a file path is given
     """
 
-    reference_sequence = ""
+    if isinstance(alignment, str):
+        alignment = load_alignment(alignment, msa_format)
 
-    test = False
+    match = find_reference_sequence(reference_identifier, alignment)
 
-    for alignment in AlignIO.parse(alignment, msa_format):
+    if match.row is None:
 
-        for record in alignment:
+        if match.candidates:
+            logging.error("Reference identifier %s is ambiguous (%s match), it matches: %s",
+                          reference_identifier, match.match, ", ".join(match.candidates))
+
+        return False, ""
+
+    if match.match != "exact":
+        logging.info("Reference identifier %s resolved to %s (%s match)", reference_identifier, match.sequence_id,
+                     match.match)
 
-            if reference_identifier in record.id:
-                test = True
-                reference_sequence = str(record.seq)
+    # only read the residues of the matching row, a memory mapped alignment is stored column by column
+    if isinstance(alignment, AlignmentMatrix):
+        return True, alignment.sequence(match.row)
 
-    return test, reference_sequence
+    return True, str(alignment[match.row].seq)
 
 
 def confirm_seq_feature_in_ref(reference_sequence: str, sequence_feature_positions: list) -> bool:
@@ -224,7 +378,7 @@ def confirm_seq_feature_in_ref(reference_sequence: str, sequence_feature_positio
         if position > length:
             test = False
 
-    logging.debug('Confirm seq feature in reference tests result: {}'.format(test))
+    logging.debug('Confirm seq feature in reference tests result: %s', test)
 
     return test
 
@@ -264,373 +418,1441 @@ def check_reference_positions(reference_sequence: str, positions: list) -> bool:
         return False
 
 
-def import_metadata(metadata_file_path: str) -> pandas.DataFrame:
+def import_metadata(metadata_file_path: str, fields: list = None, accessions=None,
+                    chunk_size: int = METADATA_CHUNK_SIZE, context=None) -> pandas.DataFrame:
     """
-    Import delimited file with metadata for each sequence by accession number
+    Import delimited file with metadata for each sequence by accession number.
+    The file is read in chunks of rows and only the accession column and the requested fields are parsed;
+    the fields are stored as categoricals.
 
     Parameters
     ----------
     metadata_file_path : string
         The file path of the metadata file to be imported.
+
+    fields : list
+        The metadata fields (columns) to load; default is every column
+
+    accessions :
+        Only keep the rows of these accessions (e.g. the sequences of the alignment); default is every row
+
+    chunk_size : int
+        The number of rows parsed at a time
+
+    context : RunContext
+        Where the metadata table is written in columnar output; default is default_context()
     """
 
     import pandas
 
-    df_metadata = pandas.read_table(metadata_file_path)  # , skiprows=[0,1,2], header=0)?
+    columns = list(pandas.read_table(metadata_file_path, nrows=0).columns)
 
-    df_metadata.to_csv(os.path.join(output_dir, "df_metadata.csv"))
+    if "accession" not in columns:
+        raise ValueError("No accession column in metadata file {}".format(metadata_file_path))
 
-    return df_metadata
+    if fields is None:
+        fields = [column for column in columns if column != "accession"]
 
+    missing_fields = [field for field in fields if field not in columns]
+    if missing_fields:
+        raise ValueError("Metadata fields not in {}: {}".format(metadata_file_path, ", ".join(missing_fields)))
 
-def vt_count(i):
-    vt_id = "VT-%03d" % (i,)
+    wanted = None if accessions is None else pandas.Index(accessions)
 
-    return vt_id
+    chunks = []
+
+    for chunk in pandas.read_table(metadata_file_path, usecols=["accession"] + list(fields), dtype=str,
+                                   chunksize=chunk_size):
+
+        if wanted is not None:
+            chunk = chunk[wanted.get_indexer(chunk["accession"]) >= 0]
+
+        chunks.append(chunk)
+
+    df_metadata = pandas.concat(chunks, ignore_index=True)[["accession"] + list(fields)]
+
+    for field in fields:
+        df_metadata[field] = df_metadata[field].astype("category")
+
+    logging.debug("Imported %d metadata rows with fields %s", len(df_metadata), fields)
 
+    write_derived_table(df_metadata, "metadata", "df_metadata.csv", csv_wanted=False, context=context)
+
+    return df_metadata
 
-#def compute_variant_differences_for_naming(dataframe: pandas.DataFrame):
-#    """
-#
-#    :param dataframe:
-#    :return:
-#    """
-#
-#    for i in range(len(a)):
-#        if a[i] != b[i]: print i, a[i], b[i]
-#
-#    4 M N
-#    8 Z X
 
-def count_seqs_per_variant_type(dataframe: pandas.DataFrame, file_path) ->pandas.DataFrame:
+def join_metadata(df_starter: pandas.DataFrame, df_metadata: pandas.DataFrame) -> pandas.DataFrame:
     """
-    Counts sequences per variant type
+    Adds the metadata fields of every sequence to the assignment table, looking the accessions up in an
+    index of the metadata. Sequences without metadata get missing values; metadata rows of accessions
+    that are not in the alignment are left out.
 
     Parameters
     ----------
-    dataframe : dataframe
-        The pandas dataframe with all data inti
+    df_starter : dataframe
+        The accession, variant_type table
 
-    file_path : string
-        The file path of the output file to be saved.
+    df_metadata : dataframe
+        The metadata, with an accession column
     """
-    import pandas
 
-    df_by_variant_type = pandas.DataFrame({'count': dataframe.groupby(["variant_type"]).size()}).reset_index()
-    df_by_variant_type.sort_values('count', ascending=False, inplace=True)
+    df_metadata = df_metadata.set_index("accession")
 
-    row_length = len(df_by_variant_type)
-    df_by_variant_type["VT"] = [vt_count(i) for i in range(1, row_length + 1)]
-    df_by_variant_type.reindex(index=["VT"])
+    if not df_metadata.index.is_unique:
+        logging.warning("Duplicate accessions in the metadata, using the first row of each")
+        df_metadata = df_metadata[~df_metadata.index.duplicated()]
 
-    df_by_variant_type.to_csv(os.path.join(output_dir, "feavar_{}.csv".format(file_path)))
-    report = df_by_variant_type.to_string()
-    logging.info("Sequences per variant type:\n{}".format(report))
+    rows = df_metadata.index.get_indexer(df_starter["accession"])
 
-    return df_by_variant_type
+    logging.info("Metadata found for %d of %d sequences", int((rows >= 0).sum()), len(rows))
+
+    df_all_data = df_starter[["accession", "variant_type"]].reset_index(drop=True)
+
+    for field in df_metadata.columns:
+        df_all_data[field] = df_metadata[field].reset_index(drop=True).reindex(rows).to_numpy()
+
+        if isinstance(df_metadata[field].dtype, pandas.CategoricalDtype):
+            df_all_data[field] = pandas.Categorical(df_all_data[field],
+                                                    categories=df_metadata[field].cat.categories)
+
+    return df_all_data
+
+
+def vt_count(i, width=3):
+    vt_id = "VT-%0*d" % (width, i)
+
+    return vt_id
 
 
-def plot_variant_type_data(df_all_data: pandas.DataFrame, field: str):
+def vt_labels(n_variant_types: int, width: int = None) -> list:
     """
+    The VT ids VT-001 ... of n variant types; by default the numbers widen past VT-999 (VT-0001 ... VT-1000 ...)
+    so that the ids of one run always sort in VT order. A fixed width keeps the ids of earlier runs (see
+    incremental); numbers beyond it are only written wider themselves.
+    """
+
+    if width is None:
+        width = incremental.vt_width(n_variant_types)
+
+    return [vt_count(i, width) for i in range(1, n_variant_types + 1)]
+
+
+def compute_variant_differences_for_naming(df_by_variant_type: pandas.DataFrame, positions: list = None,
+                                           reference_variant_type: str = None) -> pandas.DataFrame:
+    """
+    Names every variant type by its residue differences from its nearest more frequent variant type
+    ("VT-004 = VT-001 + K145N") and lists its differences from the variant type of the reference (see naming).
 
     Parameters
     ----------
-    df_all_data : df_all_data
-        The pandas df_all_data with all data inti
+    df_by_variant_type : dataframe
+        The variant type table (variant_type, count, VT), most frequent first
 
-    field : string
-        The metadata field to be plotted.
+    positions : list
+        The ungapped reference positions the feature was read at (see feature_columns), in feature order; the
+        labels of the differences; default is 1 .. feature length
+
+    reference_variant_type : string
+        The variant type of the reference sequence; default is VT-001
+
+    Returns
+    -------
+    The naming table: VT, variant_type, count, reference_VT, reference_distance, reference_mutations,
+    nearest_VT, nearest_distance, nearest_mutations and name
     """
-    df_all_data.to_csv(os.path.join(output_dir, "df_by_field.csv"))
-    df_by_one_field = df_all_data.groupby(['VT', field]).size()
-    df_by_one_field.to_csv("df_by_{}.csv".format(field))
 
-    unpacked = df_by_one_field.unstack(level=1)
-    plot = unpacked.plot(kind='bar', subplots=False)
-    fig = plot.get_figure()
-    fig.savefig("feavar_{}.svg".format(field))
+    vt_ids = df_by_variant_type["VT"].tolist()
+    encoded = naming.encode_variant_types(df_by_variant_type["variant_type"].tolist())
 
-    plot = unpacked.plot(kind='bar', stacked=True, subplots=False)
-    fig = plot.get_figure()
-    fig.set_size_inches(18.5, 10.5)
-    fig.savefig(os.path.join(output_dir, "feavar_stacked_{}.svg".format(field)), dpi=100)
+    if positions is None or len(positions) != encoded.shape[1]:
+        positions = list(range(1, encoded.shape[1] + 1))
 
+    variant_types = df_by_variant_type["variant_type"].astype(str).tolist()
+    reference_row = variant_types.index(reference_variant_type) if reference_variant_type in variant_types else 0
 
-def select_var_types_to_plot(df: pandas.DataFrame, count: int) -> pandas.DataFrame:
-    """
-    Selects top variant for plotting
+    parents, nearest_distances = naming.nearest_more_frequent(encoded)
+    nearest_mutations = naming.mutations(encoded, parents, positions)
 
-    """
+    reference_parents = numpy.full(len(encoded), reference_row)
+    reference_mutations = naming.mutations(encoded, reference_parents, positions)
 
-    vts_to_select = ["VT-%03d" % i for i in range(count)]
-    df_selected = df[df['VT'].isin(vts_to_select)]
-    return df_selected
+    names = []
 
+    for row, vt_id in enumerate(vt_ids):
 
-def set_output_directory(output_dir_path: str, output_file_name: str) -> str:
+        if parents[row] >= 0:
+            parent, changes = vt_ids[parents[row]], nearest_mutations[row]
+        elif row != reference_row:
+            parent, changes = vt_ids[reference_row], reference_mutations[row]
+        else:
+            names.append(vt_id)
+            continue
+
+        names.append("{} = {} + {}".format(vt_id, parent, " + ".join(changes.split())))
+
+    return pandas.DataFrame({"VT": vt_ids,
+                             "variant_type": variant_types,
+                             "count": df_by_variant_type["count"].to_numpy(),
+                             "reference_VT": vt_ids[reference_row] if vt_ids else None,
+                             "reference_distance": (encoded != encoded[reference_row]).sum(axis=1) if vt_ids else [],
+                             "reference_mutations": reference_mutations,
+                             "nearest_VT": [vt_ids[parent] if parent >= 0 else "" for parent in parents],
+                             "nearest_distance": nearest_distances,
+                             "nearest_mutations": nearest_mutations,
+                             "name": names})
+
+
+def variant_type_distance_matrix(df_by_variant_type: pandas.DataFrame) -> pandas.DataFrame:
     """
-    Create an OS independent path for output
+    The Hamming distances (the number of differing positions) between every pair of variant types, labeled by VT.
 
     Parameters
     ----------
-    output_dir_path : string
-        The directory to save output in
-
-    output_file_name : string
-        The name of the output file to save
+    df_by_variant_type : dataframe
+        The variant type table (variant_type, count, VT)
     """
 
-    import os
+    distances = naming.hamming_distances(naming.encode_variant_types(df_by_variant_type["variant_type"].tolist()))
 
-    dir_name = os.path.dirname(output_dir_path)
+    vt_ids = pandas.Index(df_by_variant_type["VT"].tolist(), name="VT")
 
-    return os.path.join(dir_name, output_file_name)
+    return pandas.DataFrame(distances, index=vt_ids, columns=vt_ids)
 
 
-def pre_flight_check(arguments):
+def find_reference_variant_type(df_starter: pandas.DataFrame, reference_identifier: str) -> str:
     """
-
-    :param arguments:
-    :return:
+    The variant type of the reference sequence in an assignment table, or None if it is not found.
     """
 
-    logging.info("Pre-flight starting.")
+    if df_starter is None:
+        return None
 
-    global checked_positions, parsed_positions, corrected_positions
+    match = SequenceIdIndex(df_starter["accession"].tolist()).lookup(reference_identifier)
 
-    ref_seq_in_alignment, reference_sequence = check_for_ref_seq_in_alignment(arguments.reference_identifier,
-                                                                              arguments.alignment)
+    if match.row is None:
+        return None
 
-    if ref_seq_in_alignment:
+    return str(df_starter["variant_type"].iloc[match.row])
 
-        logging.info("Reference sequence found in alignment: {}".format(arguments.reference_identifier))
 
-        parsed_positions = parse_position_input(arguments.positions)
+def write_variant_type_naming(df_by_variant_type: pandas.DataFrame, positions: list = None,
+                              reference_variant_type: str = None, feature: str = None, context=None):
+    """
+    Writes the variant type names (variant_type_names.csv) and the distance matrix between the variant types
+    (variant_type_distances.csv) next to variant_types.csv, or the variant_type_names and variant_type_distances
+    (VT pairs) tables of the columnar dataset. The distance matrix is skipped beyond
+    DISTANCE_MATRIX_MAX_VARIANT_TYPES variant types.
+
+    :param df_by_variant_type: the variant type table (variant_type, count, VT)
+    :param positions: the reference positions of the feature
+    :param reference_variant_type: the variant type of the reference sequence (see find_reference_variant_type)
+    :param feature: the name of the sequence feature, the partition of the tables in columnar output
+    :param context: where the results are written and the stages measured; default is default_context()
+    """
 
-        logging.info("Parsed positions: {}".format(parsed_positions))
+    context = context or default_context()
 
-        corrected_positions = adjust_positions_for_insertions(reference_sequence, parsed_positions)
+    if context.output_dir is None:
+        return
 
-        logging.info("Corrected positions: {}".format(corrected_positions))
+    df_names = compute_variant_differences_for_naming(df_by_variant_type, positions, reference_variant_type)
 
-        checked_positions = check_reference_positions(reference_sequence, corrected_positions)
+    df_distances = None
 
+    if len(df_by_variant_type) <= DISTANCE_MATRIX_MAX_VARIANT_TYPES:
+        df_distances = variant_type_distance_matrix(df_by_variant_type)
     else:
+        logging.warning("Not writing the distance matrix of %d variant types (more than %d)", len(df_by_variant_type),
+                        DISTANCE_MATRIX_MAX_VARIANT_TYPES)
 
-        logging.error("No reference identifier found: {}".format(arguments.reference_identifier))
+    if context.output_format == "csv":
 
-    rules = [ref_seq_in_alignment,
-             confirm_seq_feature_in_ref(reference_sequence, parsed_positions),
-             len(corrected_positions) > 0,
-             checked_positions]
+        df_names.to_csv(os.path.join(context.output_dir, "variant_type_names.csv"), index=False)
 
-    print("Analysis complete.")
+        if df_distances is not None:
+            df_distances.to_csv(os.path.join(context.output_dir, "variant_type_distances.csv"))
 
-    return corrected_positions, rules
+        return
 
+    dataset_dir = os.path.join(context.output_dir, columnar.DATASET_NAME)
 
-def compute_variant_types(alignment_file_path: str, alignment_format: str, vt_positions: list, log_level: str) -> pandas.DataFrame:
-    """
+    columnar.write_table(df_names, dataset_dir, "variant_type_names", context.output_format, feature)
 
-    :param alignment_file_path:
-    :param alignment_format:
-    :param vt_positions:
-    :param log_level:
-    :return:
-    """
-    global df_starter, df_by_variant_type
+    if df_distances is not None:
+        # every pair once, in the long form columnar tables use
+        rows, columns = numpy.triu_indices(len(df_distances), k=1)
+        vt_ids = df_distances.index.to_numpy()
+        df_pairs = pandas.DataFrame({"VT": vt_ids[rows], "other_VT": vt_ids[columns],
+                                     "distance": df_distances.to_numpy()[rows, columns]})
+        columnar.write_table(df_pairs, dataset_dir, "variant_type_distances", context.output_format, feature)
 
-    try:
 
-        alignment = AlignIO.read(alignment_file_path, alignment_format)
+def count_seqs_per_variant_type(dataframe: pandas.DataFrame, file_path, context=None) ->pandas.DataFrame:
+    """
+    Counts sequences per variant type
 
-        variants = []
-        for record in alignment:
-            sequence = record.seq
-            sequence_feature_temp = ''.join([sequence[index] for index in vt_positions])
-            variants.append([record.id, sequence_feature_temp])
+    Parameters
+    ----------
+    dataframe : dataframe
+        The pandas dataframe with all data inti
 
-        dir_name, file_name = os.path.split(alignment_file_path)
+    file_path : string
+        The file path of the output file to be saved; None to only count the sequences.
 
-        headers = ['accession', 'variant_type']
-        df_starter = pandas.DataFrame(variants, columns=headers)
+    context : RunContext
+        Where the results are written and the stages measured; default is default_context()
+    """
 
-        if log_level == 'debug':
-            df_starter.to_csv(os.path.join(output_dir, 'df_accession_index.csv'))
+    categories, codes = variant_type_codes(dataframe)
 
-        df_by_variant_type = count_seqs_per_variant_type(df_starter, file_name)
-        df_by_variant_type.to_csv(os.path.join(output_dir, "variant_types.csv"))
+    # integer counting on the dictionary codes; variant types no sequence has are dropped
+    counts = numpy.bincount(codes[codes >= 0], minlength=len(categories))
+    variant_type_counts = pandas.Series(counts, index=categories, dtype="int64")
 
-    except OSError as err:
+    return number_variant_types(variant_type_counts[variant_type_counts > 0], file_path, context=context)
 
-        print("OS error: {0}".format(err))
 
-    except ValueError:
+def variant_type_codes(dataframe: pandas.DataFrame) -> tuple:
+    """
+    The variant type dictionary and the integer code of the variant type of every row of an assignment table.
+    The variant_type column is dictionary encoded (categorical) by the extraction engines, other columns are
+    encoded here.
 
-        print("Could not load or read alignment.")
+    Parameters
+    ----------
+    dataframe : dataframe
+        The accession, variant_type table
 
-    except:
+    Returns
+    -------
+    A tuple of the variant types (an index) and the codes (-1 for rows without a variant type)
+    """
 
-        print("Unexpected error:", sys.exc_info()[0])
+    variant_type_column = dataframe["variant_type"]
 
-        raise
+    if not isinstance(variant_type_column.dtype, pandas.CategoricalDtype):
+        variant_type_column = variant_type_column.astype("category")
 
-    return df_by_variant_type, df_starter
+    return variant_type_column.cat.categories, variant_type_column.cat.codes.to_numpy()
 
 
-def process_metadata(metadata_file, df_by_variant_type, df_starter, no_of_vt_to_plot, log_level):
+def number_variant_types(variant_type_counts: pandas.Series, file_path, context=None) -> pandas.DataFrame:
     """
+    Numbers the variant types (VT-001 is the most frequent) from their sequence counts.
+    Variant types with the same count are numbered in lexicographic order of their residues, so the
+    numbering does not depend on the engine, the number of shards or the order of the sequences.
 
-    :param metadata_file: 
-    :param df_by_variant_type: 
-    :param df_starter: 
-    :param no_of_vt_to_plot: 
-    :param log_level: 
-    :return: 
+    Parameters
+    ----------
+    variant_type_counts : series
+        The number of sequences per variant type, indexed by variant type
+
+    file_path : string
+        The file path of the output file to be saved; None to only number the variant types.
+
+    context : RunContext
+        Where the results are written and the stages measured; default is default_context()
     """
     import pandas
-    import sys
 
-    try:
+    variant_type_counts = variant_type_counts.sort_index()
+    variant_type_counts.index.name = "variant_type"
 
-        logging.debug("Metadata file is present at: {}".format(metadata_file))
+    df_by_variant_type = pandas.DataFrame({'count': variant_type_counts}).reset_index()
 
-        df_metadata = import_metadata(metadata_file)
-        df_all_data = pandas.merge(df_starter, df_metadata, on='accession', how='outer')
+    # sort key: count descending, then variant type ascending (the stable sort keeps the lexicographic order of ties)
+    order = numpy.argsort(-df_by_variant_type['count'].to_numpy(), kind="stable")
+    df_by_variant_type = df_by_variant_type.take(order)
 
-        if log_level == 'debug':
-            df_all_data.to_csv(os.path.join(output_dir, "df_all_data.csv"))
+    df_by_variant_type["VT"] = vt_labels(len(df_by_variant_type))
 
-        df_all_data_with_variant_type = pandas.merge(df_all_data,
-                                                     df_by_variant_type,
-                                                     on='variant_type',
-                                                     how='outer')
+    if file_path is not None:
 
-        df_file_name = "df_all_data_with_variant_type.csv"
-        df_all_data_with_variant_type.to_csv(os.path.join(output_dir, df_file_name))
+        context = context or default_context()
 
-        # for large dataframes select the top X rows
-        df_top = select_var_types_to_plot(df_all_data_with_variant_type, no_of_vt_to_plot)
+        if context.output_format == "csv" and context.output_dir is not None:
+            df_by_variant_type.to_csv(os.path.join(context.output_dir, "feavar_{}.csv".format(file_path)))
 
-        if log_level == 'debug':
-            df_top.to_csv(os.path.join(output_dir, "df_top.csv"), index=False)
+    # the table is only formatted when it is logged
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info("Sequences per variant type:\n%s", df_by_variant_type.to_string())
 
-        columns = list(df_all_data.columns)
+    return df_by_variant_type
 
-        logging.debug("The columns in the {} dataframe are: {}".format("df_all_data", columns))
 
-        variant_types = list(pandas.unique(df_all_data.variant_type.ravel()))
+def record_variant_type_results(df_by_variant_type: pandas.DataFrame, top: int = 10, context=None):
+    """
+    Records the number of sequences and variant types, and the most frequent variant types, in the run report.
 
-        logging.debug("The variant types are: {}".format(variant_types))
+    Parameters
+    ----------
+    df_by_variant_type : dataframe
+        The variant type count table (variant_type, count, VT)
 
-        for field in columns[2:]:
-            logging.info("Now plotting graph for: {}".format(field))
-            plot_variant_type_data(df_top, field)
+    top : int
+        The number of variant types listed
 
-    except OSError as err:
-        print("OS error: {0}".format(err))
+    context : RunContext
+        Where the results are written and the stages measured; default is default_context()
+    """
 
-    except ValueError:
-        print("Could not convert data to an integer.")
+    context = context or default_context()
 
-    except:
-        print("Unexpected error:", sys.exc_info()[0])
-        raise
+    context.recorder.results["n_sequences"] = int(df_by_variant_type['count'].sum())
+    context.recorder.results["n_variant_types"] = len(df_by_variant_type)
+    context.recorder.results["top_variant_types"] = [
+        {"VT": vt, "variant_type": str(variant_type), "count": int(count)}
+        for vt, variant_type, count in df_by_variant_type[['VT', 'variant_type', 'count']].head(top).itertuples(
+            index=False)]
 
 
-def main(arguments):
+def plot_variant_type_data(df_all_data: pandas.DataFrame, field: str, context=None):
     """
-    Main method for the sequence feature variant type python script
 
+    Parameters
+    ----------
+    df_all_data : df_all_data
+        The pandas df_all_data with all data inti
+
+    field : string
+        The metadata field to be plotted.
+
+    context : RunContext
+        Where the results are written and the stages measured; default is default_context()
     """
 
-    # TODO add report of algorithm version, results, etc; look at importing pandas-html I think
+    context = context or default_context()
 
-    corrected_positions: list
-    corrected_positions, rules = pre_flight_check(arguments)
+    if context.output_dir is not None:
+        plotting.plot_fields(df_all_data, [field], context.output_dir)
 
-    if all(rules):
 
-        df_by_variant_type, df_starter = compute_variant_types(arguments.alignment,
-                                                               arguments.alignment_format,
-                                                               corrected_positions,
-                                                               arguments.log_level)
+def select_var_types_to_plot(df: pandas.DataFrame, count: int) -> pandas.DataFrame:
+    """
+    Selects the rows of the top count variant types (VT-001 to VT-<count>) for plotting
 
-        if arguments.metadata_file is not None:
-            process_metadata(arguments.metadata_file, df_by_variant_type, df_starter, arguments.top, arguments.log_level)
+    """
 
+    vt_numbers = pandas.to_numeric(df['VT'].str.slice(3), errors='coerce')
+    df_selected = df[vt_numbers <= int(count)]
+    return df_selected
 
-if __name__ == "__main__":
-    import os
-    import os.path
-    import logging
-    import datetime
-    import argparse
-    import pandas
-    import sys
 
-    PARSER = argparse.ArgumentParser()
-    PARSER.add_argument('-a', "--alignment",
-                        type=str,
-                        required=True,
-                        help="The name (and path) of the alignment file. "
-                             "Format: clustal")
-    PARSER.add_argument("-f", "--alignment_format",
-                        required=False,
-                        type=str,
-                        default="clustal",
-                        help="The alignment file format. Default = clustal")
-    PARSER.add_argument("-r", "--reference_identifier",
-                        required=True,
-                        type=str,
-                        help="The reference sequence identifier; "
-                             "An accession or gid: AB01223")
-    PARSER.add_argument("-p", "--positions",
-                        required=True,
-                        type=str,
-                        help="The position(s) of the sequence feature, enclosed in quotes, "
-                             "comma separated, dashes for ranges. "
-                             "Example: '100-110' or '100-110,120,130'")
-    PARSER.add_argument("-d", "--project_directory",
-                        required=False,
-                        type=str,
-                        help="The directory of the project.")
-    PARSER.add_argument("-m", "--metadata_file",
-                        required=False,
-                        type=str,
-                        help="The metadata file (tab delimited).")
-    PARSER.add_argument("-t", "--top",
-                        required=False,
-                        type=str,
-                        default=10,
-                        help="The number (top) of variant types to plot (default=10).")
-    PARSER.add_argument("-log", "--log_level",
-                        required=False,
-                        default="debug",
-                        help="What level of logging would you like to see? "
-                             "(info, debug, error; default=info).")
-    ARGS = PARSER.parse_args()
-
-    cwd = os.getcwd()
-    log_directory = os.path.join(cwd, "logs")
-    if not os.path.exists(log_directory):
-        os.makedirs(log_directory)
+def write_derived_table(df: pandas.DataFrame, table: str, csv_file_name: str, csv_wanted: bool = True, context=None,
+                        **csv_options):
+    """
+    Writes a derived table: as CSV (if csv_wanted) in csv output mode, otherwise into the columnar dataset,
+    but only if the table was requested with --tables.
 
-    output_dir = os.path.join(cwd, "output")
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    Parameters
+    ----------
+    df : dataframe
+        The table
 
-    D = datetime.date.today()
-    log_file_path = os.path.join(log_directory, '{}.log'.format(D.isoformat()))
-    f_handler = logging.FileHandler(log_file_path)
-    # logging.basicConfig(stream=sys.stdout, level=ARGS.log_level.upper())
-    logging.basicConfig(level=ARGS.log_level.upper(),
+    table : string
+        The table name (see columnar.DERIVED_TABLES)
+
+    csv_file_name : string
+        The file name of the table in csv output mode
+
+    csv_wanted : bool
+        Whether the table is written in csv output mode
+
+    csv_options :
+        Further arguments of to_csv
+
+    context : RunContext
+        Where the results are written and the stages measured; default is default_context()
+    """
+
+    context = context or default_context()
+
+    if context.output_dir is None:
+        return
+
+    if context.output_format == "csv":
+        if csv_wanted:
+            df.to_csv(os.path.join(context.output_dir, csv_file_name), **csv_options)
+        return
+
+    if table in context.output_tables:
+        columnar.write_table(df, os.path.join(context.output_dir, columnar.DATASET_NAME), table, context.output_format)
+
+
+def write_columnar_results(df_by_variant_type: pandas.DataFrame, df_starter: pandas.DataFrame, feature: str,
+                           context=None):
+    """
+    Writes the variant type counts and the assignments of one sequence feature into the columnar dataset.
+
+    Parameters
+    ----------
+    df_by_variant_type : dataframe
+        The variant type count table
+
+    df_starter : dataframe
+        The accession to variant type assignment table
+
+    feature : string
+        The name of the sequence feature, the partition of the tables
+
+    context : RunContext
+        Where the results are written and the stages measured; default is default_context()
+    """
+
+    context = context or default_context()
+
+    if context.output_dir is None:
+        return
+
+    dataset_dir = os.path.join(context.output_dir, columnar.DATASET_NAME)
+
+    columnar.write_table(df_by_variant_type, dataset_dir, "variant_types", context.output_format, feature)
+    columnar.write_table(columnar.assignment_table(df_starter, df_by_variant_type), dataset_dir, "assignments",
+                         context.output_format, feature)
+
+
+def set_output_directory(output_dir_path: str, output_file_name: str) -> str:
+    """
+    Create an OS independent path for output
+
+    Parameters
+    ----------
+    output_dir_path : string
+        The directory to save output in
+
+    output_file_name : string
+        The name of the output file to save
+    """
+
+    import os
+
+    dir_name = os.path.dirname(output_dir_path)
+
+    return os.path.join(dir_name, output_file_name)
+
+
+def streams_alignment(arguments) -> bool:
+    """
+    Tests whether a run reads the alignment file itself instead of loading it: the stream engine, and an
+    aligned FASTA file typed with a state file, which only reads the sequences appended since the last run.
+
+    :param arguments: the parsed command line arguments
+    """
+
+    if getattr(arguments, "features_file", None) is not None or getattr(arguments, "scan_window", None) is not None:
+        return False
+
+    return (getattr(arguments, "engine", None) == "stream" or
+            (getattr(arguments, "state_file", None) is not None and arguments.alignment_format == "fasta"))
+
+
+def pre_flight_check(arguments, alignment=None):
+    """
+
+    :param arguments:
+    :param alignment: the already loaded alignment; parsed from arguments.alignment if not given
+    :return:
+    """
+
+    logging.info("Pre-flight starting.")
+
+    if alignment is None and streams_alignment(arguments):
+
+        # the reference is only read up to the last feature position
+        ref_seq_in_alignment, reference_sequence = streaming.stream_reference_sequence(
+            arguments.reference_identifier, arguments.alignment, arguments.alignment_format,
+            max(parse_position_input(arguments.positions)))
+
+    else:
+
+        if alignment is None:
+            alignment = load_alignment(arguments.alignment, arguments.alignment_format, arguments.binary_cache)
+
+        ref_seq_in_alignment, reference_sequence = check_for_ref_seq_in_alignment(arguments.reference_identifier,
+                                                                                  alignment)
+
+    parsed_positions, corrected_positions, validation = [], [], {"valid": False}
+
+    if ref_seq_in_alignment:
+
+        logging.info("Reference sequence found in alignment: %s", arguments.reference_identifier)
+
+        parsed_positions = parse_position_input(arguments.positions)
+
+        logging.info("Parsed positions: %s", parsed_positions)
+
+        cds_start = getattr(arguments, "cds_start", None)
+
+        if cds_start is not None:
+
+            # protein positions and residues are checked against the translated reference
+            validation = epitope.validate_epitope(codon.translate_reference(reference_sequence, cds_start),
+                                                  arguments.positions)
+
+        else:
+
+            # every position and expected residue is checked against the reference in one pass
+            validation = epitope.validate_epitope(reference_sequence, arguments.positions)
+
+        if validation["valid"] and cds_start is not None:
+
+            corrected_positions = codon.codon_columns(CoordinateMap(reference_sequence), parsed_positions,
+                                                      cds_start).ravel().tolist()
+
+            logging.info("Codon columns: %s", corrected_positions)
+
+        elif validation["valid"]:
+
+            # the columns of the very residues validated above
+            corrected_positions = feature_columns(reference_sequence, parsed_positions)
+
+            logging.info("Feature columns: %s", corrected_positions)
+
+        else:
+
+            logging.error("Positions do not match the reference sequence: %s", validation["diagnostic"])
+
+    else:
+
+        logging.error("No reference identifier found: %s", arguments.reference_identifier)
+
+    rules = [ref_seq_in_alignment,
+             validation["valid"],
+             len(corrected_positions) > 0]
+
+    logging.info("Pre-flight complete.")
+
+    return corrected_positions, rules
+
+
+def extract_variant_types(alignment, vt_positions: list, engine: str = "numpy", processes: int = 1,
+                          progress=None, codons: bool = False) -> pandas.DataFrame:
+    """
+    Extract the sequence feature (variant type) of every sequence in the alignment.
+
+    Parameters
+    ----------
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    vt_positions : list
+        The alignment columns (0-based) of the sequence feature (see feature_columns)
+
+    engine : string
+        "numpy" slices all sequences at once from a uint8 alignment matrix,
+        "python" joins the residues of each SeqRecord one by one
+
+    processes : int
+        With the numpy engine, the number of worker processes to shard the sequences over
+
+    progress : callable
+        With worker processes, called with (shards done, number of shards)
+
+    codons : bool
+        vt_positions are the codon columns of protein positions (see codon.codon_columns) and the variant
+        types are the translated codons; every engine translates all sequences at once in one process
+    """
+
+    headers = ['accession', 'variant_type']
+
+    if codons:
+
+        alignment_matrix = as_alignment_matrix(alignment)
+
+        variant_types, inverse, counts = codon.codon_variant_types(alignment_matrix, vt_positions)
+
+        return pandas.DataFrame({headers[0]: alignment_matrix.ids,
+                                 headers[1]: pandas.Categorical.from_codes(inverse, categories=variant_types)})
+
+    if engine == "numpy":
+
+        alignment_matrix = as_alignment_matrix(alignment)
+
+        if processes > 1:
+            variant_types, inverse, counts = parallel.parallel_variant_types(alignment_matrix, vt_positions, processes,
+                                                                                progress)
+        else:
+            variant_types, inverse, counts = alignment_matrix.variant_types(vt_positions)
+
+        # the variant type of every sequence is stored as a code into the small dictionary of distinct variant types
+        variant_type_column = pandas.Categorical.from_codes(inverse, categories=variant_types)
+
+        return pandas.DataFrame({headers[0]: alignment_matrix.ids, headers[1]: variant_type_column})
+
+    elif engine == "python":
+
+        variants = []
+        for record in alignment:
+            sequence = record.seq
+            sequence_feature_temp = ''.join([sequence[index] for index in vt_positions])
+            variants.append([record.id, sequence_feature_temp])
+
+        df_variants = pandas.DataFrame(variants, columns=headers)
+        df_variants[headers[1]] = df_variants[headers[1]].astype("category")
+
+        return df_variants
+
+    raise ValueError("Unknown variant type engine: {}".format(engine))
+
+
+def compute_variant_types(alignment_file_path: str, alignment_format: str, vt_positions: list, log_level: str,
+                          alignment=None, engine: str = "numpy", processes: int = 1,
+                          feature: str = None, context=None, codons: bool = False) -> pandas.DataFrame:
+    """
+
+    :param alignment_file_path:
+    :param alignment_format:
+    :param vt_positions:
+    :param log_level:
+    :param alignment: the already loaded alignment; parsed from alignment_file_path if not given
+    :param engine: the feature extraction engine, "numpy" (default), "python" or "stream";
+                   "stream" never loads the alignment, writes the assignments straight to
+                   df_accession_index.csv and returns None in place of df_starter
+    :param processes: the number of worker processes for the numpy engine
+    :param feature: the name of the sequence feature in columnar output; default is a label of vt_positions
+    :param context: where the results are written and the stages measured; default is default_context()
+    :param codons: vt_positions are codon columns and the variant types their translation (see extract_variant_types)
+    :return:
+    """
+
+    context = context or default_context()
+
+    df_by_variant_type, df_starter = None, None
+
+    try:
+
+        dir_name, file_name = os.path.split(alignment_file_path)
+
+        if engine == "stream":
+
+            if context.output_dir is None:
+                raise ValueError("The stream engine writes the assignments to the output directory, there is none")
+
+            with context.recorder.stage("extraction") as stage, \
+                    open(os.path.join(context.output_dir, 'df_accession_index.csv'), 'w') as assignments_file:
+                counts = streaming.stream_variant_type_counts(alignment_file_path, alignment_format,
+                                                              vt_positions, assignments_file,
+                                                              context.recorder.stage_progress("extraction"))
+                stage["n_items"] = sum(counts.values())
+
+            df_starter = None
+
+            with context.recorder.stage("counting", len(counts)):
+                df_by_variant_type = number_variant_types(pandas.Series(counts, dtype="int64"), file_name,
+                                                          context=context)
+
+            record_variant_type_results(df_by_variant_type, context=context)
+
+            if context.output_format == "csv":
+                df_by_variant_type.to_csv(os.path.join(context.output_dir, "variant_types.csv"))
+                return df_by_variant_type, df_starter
+
+            assignments_path = os.path.join(context.output_dir, 'df_accession_index.csv')
+            df_starter = pandas.read_csv(assignments_path, index_col=0, keep_default_na=False,
+                                         dtype={'variant_type': 'category'})
+            os.remove(assignments_path)
+
+            write_columnar_results(df_by_variant_type, df_starter, feature or columnar.positions_label(vt_positions),
+                                   context=context)
+
+            return df_by_variant_type, df_starter
+
+        if alignment is None:
+            alignment = load_alignment(alignment_file_path, alignment_format)
+
+        with context.recorder.stage("extraction") as stage:
+            df_starter = extract_variant_types(alignment, vt_positions, engine, processes,
+                                               context.recorder.stage_progress("extraction"), codons)
+            stage["n_items"] = len(df_starter)
+
+        with context.recorder.stage("counting", len(df_starter)):
+            df_by_variant_type = count_seqs_per_variant_type(df_starter, file_name, context=context)
+
+        record_variant_type_results(df_by_variant_type, context=context)
+
+        if context.output_dir is None:
+            return df_by_variant_type, df_starter
+
+        if context.output_format != "csv":
+            write_columnar_results(df_by_variant_type, df_starter, feature or columnar.positions_label(vt_positions),
+                                   context=context)
+            return df_by_variant_type, df_starter
+
+        if log_level == 'debug':
+            df_starter.to_csv(os.path.join(context.output_dir, 'df_accession_index.csv'))
+
+        df_by_variant_type.to_csv(os.path.join(context.output_dir, "variant_types.csv"))
+
+    except OSError as err:
+
+        print("OS error: {0}".format(err))
+
+    except ValueError:
+
+        print("Could not load or read alignment.")
+
+    except:
+
+        print("Unexpected error:", sys.exc_info()[0])
+
+        raise
+
+    return df_by_variant_type, df_starter
+
+
+def read_features_file(features_file_path: str) -> dict:
+    """
+    Reads a file of sequence features (name, tab, positions per line); see epitope.read_features_file.
+
+    Parameters
+    ----------
+    features_file_path : string
+        The file path of the features file
+    """
+
+    return epitope.read_features_file(features_file_path)
+
+
+def parse_features_file(features_file_path: str) -> dict:
+    """
+    Reads a file of sequence features (see read_features_file) and parses the positions of every feature.
+
+    Parameters
+    ----------
+    features_file_path : string
+        The file path of the features file
+
+    Returns
+    -------
+    A dictionary of feature names to their parsed (sorted) positions, in file order
+    """
+
+    return {name: parse_position_input(raw_positions)
+            for name, raw_positions in read_features_file(features_file_path).items()}
+
+
+def write_variant_type_tables(alignment_file_path: str, df_by_variant_type: pandas.DataFrame,
+                              df_starter: pandas.DataFrame, log_level: str, feature: str = None, context=None):
+    """
+    Writes the tables compute_variant_types writes, for results that were not computed in this run (e.g. cached).
+
+    :param alignment_file_path:
+    :param df_by_variant_type:
+    :param df_starter:
+    :param log_level:
+    :param feature: the name of the sequence feature in columnar output
+    :param context: where the results are written and the stages measured; default is default_context()
+    :return:
+    """
+
+    context = context or default_context()
+
+    if context.output_dir is None:
+        return
+
+    if context.output_format != "csv":
+        write_columnar_results(df_by_variant_type, df_starter, feature, context=context)
+        return
+
+    dir_name, file_name = os.path.split(alignment_file_path)
+
+    if log_level == 'debug':
+        df_starter.to_csv(os.path.join(context.output_dir, 'df_accession_index.csv'))
+
+    df_by_variant_type.to_csv(os.path.join(context.output_dir, "feavar_{}.csv".format(file_name)))
+    df_by_variant_type.to_csv(os.path.join(context.output_dir, "variant_types.csv"))
+
+
+def update_variant_types(alignment_file_path: str, alignment_format: str, vt_positions: list, log_level: str,
+                         state_file_path: str, alignment=None, feature: str = None, context=None) -> pandas.DataFrame:
+    """
+    Like compute_variant_types, but keeps the assignments and counts in a state file so later runs on
+    the same alignment with new sequences appended only type the new sequences. VT ids are stable
+    across runs: existing variant types keep their VT id, new variant types get the next numbers.
+
+    :param alignment_file_path:
+    :param alignment_format:
+    :param vt_positions:
+    :param log_level:
+    :param state_file_path: the state file written by the previous run (created if missing)
+    :param alignment: the already loaded alignment; if not given an aligned FASTA file is read from the end of
+                      the sequences the state typed on, other formats are parsed from alignment_file_path
+    :param feature: the name of the sequence feature in columnar output; default is a label of vt_positions
+    :param context: where the results are written and the stages measured; default is default_context()
+    :return:
+    """
+
+    context = context or default_context()
+
+    with context.recorder.stage("extraction") as stage:
+
+        if alignment is None and alignment_format == "fasta":
+
+            state = incremental.update_fasta_state(alignment_file_path, vt_positions,
+                                                   incremental.load_state(state_file_path))
+
+        else:
+
+            if alignment is None:
+                alignment = load_alignment(alignment_file_path, alignment_format)
+
+            state = incremental.update_state(alignment, vt_positions, incremental.load_state(state_file_path))
+
+        incremental.save_state(state_file_path, state)
+        stage["n_items"] = state["n_new"]
+
+    if state["full"]:
+        logging.info("No matching state in %s, typed all %d sequences", state_file_path, state["n_new"])
+    else:
+        logging.info("Typed %d new sequences", state["n_new"])
+
+    variant_types = pandas.Series(state["variant_types"], dtype=object)
+
+    df_starter = pandas.DataFrame({'accession': state["ids"],
+                                   'variant_type': pandas.Categorical.from_codes(state["codes"],
+                                                                                 categories=state["variant_types"])})
+
+    df_by_variant_type = pandas.DataFrame({'variant_type': variant_types,
+                                           'count': state["counts"],
+                                           'VT': vt_labels(len(variant_types), state["vt_width"])})
+    df_by_variant_type.sort_values('count', ascending=False, kind='mergesort', inplace=True)
+
+    record_variant_type_results(df_by_variant_type, context=context)
+
+    if context.output_dir is None:
+        return df_by_variant_type, df_starter
+
+    if context.output_format != "csv":
+        write_columnar_results(df_by_variant_type, df_starter, feature or columnar.positions_label(vt_positions),
+                               context=context)
+        return df_by_variant_type, df_starter
+
+    dir_name, file_name = os.path.split(alignment_file_path)
+
+    if log_level == 'debug':
+        df_starter.to_csv(os.path.join(context.output_dir, 'df_accession_index.csv'))
+
+    df_by_variant_type.to_csv(os.path.join(context.output_dir, "feavar_{}.csv".format(file_name)))
+    df_by_variant_type.to_csv(os.path.join(context.output_dir, "variant_types.csv"))
+
+    return df_by_variant_type, df_starter
+
+
+def extract_feature_batch(alignment, features: dict, engine: str = "numpy") -> dict:
+    """
+    Extract the variant type of every sequence for many sequence features in one pass over the alignment.
+
+    Parameters
+    ----------
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    features : dict
+        Feature names to their alignment columns (see feature_columns)
+
+    engine : string
+        "numpy" slices the union of all feature columns once, "python" walks the SeqRecords once
+
+    Returns
+    -------
+    A dictionary of feature names to their accession / variant_type dataframes
+    """
+
+    headers = ['accession', 'variant_type']
+
+    if engine == "numpy":
+
+        alignment_matrix = as_alignment_matrix(alignment)
+
+        # every column any feature needs is read exactly once
+        union_positions = sorted(set(position for positions in features.values() for position in positions))
+        union_columns = {position: column for column, position in enumerate(union_positions)}
+        union_block = alignment_matrix.feature_matrix(union_positions)
+
+        feature_tables = {}
+
+        for name, positions in features.items():
+
+            block_columns = [union_columns[position] for position in positions]
+            variant_types, inverse, counts = group_feature_rows(union_block[:, block_columns])
+
+            # a code per sequence into the distinct variant types of the feature, as in extract_variant_types
+            feature_tables[name] = pandas.DataFrame({headers[0]: alignment_matrix.ids,
+                                                     headers[1]: pandas.Categorical.from_codes(inverse, variant_types)})
+
+        return feature_tables
+
+    elif engine == "python":
+
+        variants = {name: [] for name in features}
+
+        for record in alignment:
+            sequence = record.seq
+            for name, positions in features.items():
+                variants[name].append([record.id, ''.join([sequence[index] for index in positions])])
+
+        feature_tables = {name: pandas.DataFrame(rows, columns=headers) for name, rows in variants.items()}
+
+        for df_feature in feature_tables.values():
+            df_feature[headers[1]] = df_feature[headers[1]].astype("category")
+
+        return feature_tables
+
+    raise ValueError("Unknown variant type engine: {}".format(engine))
+
+
+def feature_file_label(name: str) -> str:
+    """
+    Makes a feature name safe to use in an output file name.
+    """
+
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def compute_feature_batch(alignment_file_path: str, alignment_format: str, features: dict, log_level: str,
+                          alignment=None, engine: str = "numpy", context=None) -> dict:
+    """
+    Computes the variant types of many sequence features with a single traversal of the alignment
+    and writes one count table per feature (feavar_<alignment>_<feature>.csv).
+
+    :param alignment_file_path:
+    :param alignment_format:
+    :param features: feature names to their alignment columns (see feature_columns)
+    :param log_level:
+    :param alignment: the already loaded alignment; parsed from alignment_file_path if not given
+    :param engine: the feature extraction engine, "numpy" (default) or "python"
+    :param context: where the results are written and the stages measured; default is default_context()
+    :return: a dictionary of feature names to (df_by_variant_type, df_starter)
+    """
+
+    context = context or default_context()
+
+    if alignment is None:
+        alignment = load_alignment(alignment_file_path, alignment_format)
+
+    dir_name, file_name = os.path.split(alignment_file_path)
+
+    with context.recorder.stage("extraction") as stage:
+        feature_tables = extract_feature_batch(alignment, features, engine)
+        stage["n_items"] = len(next(iter(feature_tables.values()))) if feature_tables else 0
+
+    results = {}
+
+    with context.recorder.stage("counting", len(feature_tables)):
+
+        for done, (name, df_feature) in enumerate(feature_tables.items(), 1):
+
+            df_feature_by_variant_type = count_seqs_per_variant_type(df_feature, "{}_{}".format(
+                file_name, feature_file_label(name)), context=context)
+            results[name] = (df_feature_by_variant_type, df_feature)
+
+            if context.output_format != "csv":
+                write_columnar_results(df_feature_by_variant_type, df_feature, name, context=context)
+
+            context.recorder.progress("counting", done, len(feature_tables))
+
+    context.recorder.results["n_features"] = len(results)
+    context.recorder.results["n_variant_types"] = {name: len(df_feature_by_variant_type)
+                                                   for name, (df_feature_by_variant_type, _) in results.items()}
+
+    if log_level == 'debug' and feature_tables and context.output_format == "csv" and context.output_dir is not None:
+
+        df_batch = pandas.DataFrame({name: df_feature['variant_type'] for name, df_feature in feature_tables.items()})
+        df_batch.insert(0, 'accession', next(iter(feature_tables.values()))['accession'])
+        df_batch.to_csv(os.path.join(context.output_dir, 'df_batch_accession_index.csv'))
+
+    return results
+
+
+def pre_flight_check_batch(arguments, alignment) -> dict:
+    """
+    Resolves the reference sequence and the insertion corrections once and checks every
+    feature of the features file against them.
+
+    :param arguments:
+    :param alignment: the already loaded alignment
+    :return: a dictionary of the names of the features that passed to their alignment columns
+    """
+
+    logging.info("Batch pre-flight starting.")
+
+    ref_seq_in_alignment, reference_sequence = check_for_ref_seq_in_alignment(arguments.reference_identifier,
+                                                                              alignment)
+
+    if not ref_seq_in_alignment:
+        logging.error("No reference identifier found: %s", arguments.reference_identifier)
+        return {}
+
+    coordinate_map = CoordinateMap(reference_sequence)
+
+    raw_features = read_features_file(arguments.features_file)
+
+    # all features are validated against the reference in one vectorized pass
+    validation = epitope.validate_epitopes(reference_sequence, raw_features)
+
+    checked_features = {}
+
+    for name, raw_positions in raw_features.items():
+
+        if not validation.at[name, "valid"]:
+            logging.warning("Skipping feature %s: %s", name, validation.at[name, "diagnostic"] or "no positions")
+            continue
+
+        checked_features[name] = feature_columns(reference_sequence, parse_position_input(raw_positions),
+                                                 coordinate_map)
+
+    logging.info("%d of the features passed the pre-flight check", len(checked_features))
+
+    return checked_features
+
+
+def scan_variant_types(alignment, reference_sequence: str, window_size: int, step: int = 1) -> pandas.DataFrame:
+    """
+    Computes the variant type diversity of every window of window_size consecutive reference positions.
+
+    Parameters
+    ----------
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    reference_sequence : string
+        The aligned reference sequence (with insertion dashes included (if applicable))
+
+    window_size : int
+        The number of reference positions per window (k)
+
+    step : int
+        The number of reference positions between the starts of consecutive windows
+
+    Returns
+    -------
+    A dataframe with one row per window: the first and last reference position, the number of
+    variant types, the count and frequency of the most frequent variant type and the entropy (bits)
+    """
+
+    alignment_matrix = as_alignment_matrix(alignment)
+
+    reference_positions = list(range(1, len(reference_sequence.replace("-", "")) + 1))
+    columns = feature_columns(reference_sequence, reference_positions)
+
+    # windows can only cover reference positions that map inside the alignment (0-based columns)
+    alignment_length = alignment_matrix.get_alignment_length()
+    columns = [column for column in columns if column < alignment_length]
+
+    n_sequences = len(alignment_matrix)
+
+    rows = [[start + 1, start + window_size, variant_types, top_count, top_count / n_sequences, entropy]
+            for start, variant_types, top_count, entropy in scan.scan_windows(alignment_matrix, columns,
+                                                                              window_size, step)]
+
+    return pandas.DataFrame(rows, columns=['start', 'end', 'variant_types', 'top_vt_count',
+                                           'top_vt_frequency', 'entropy'])
+
+
+def join_variant_type_table(df_all_data: pandas.DataFrame, df_by_variant_type: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Adds the count and VT columns of the variant type table to every row, joining on the integer variant type
+    codes instead of the variant type strings. Rows come out ordered by variant type (rows without one last)
+    like the outer merge on variant_type this replaces.
+
+    Parameters
+    ----------
+    df_all_data : dataframe
+        The assignments joined with the metadata
+
+    df_by_variant_type : dataframe
+        The variant type table (variant_type, count, VT)
+    """
+
+    categories, codes = variant_type_codes(df_all_data)
+
+    # the variant type table row of every code
+    table_rows = pandas.Index(df_by_variant_type["variant_type"]).get_indexer(categories)
+    rows = numpy.where(codes >= 0, table_rows[codes], -1)
+
+    category_ranks = numpy.argsort(numpy.argsort(numpy.asarray(categories, dtype=object)))
+    order = numpy.argsort(numpy.where(codes >= 0, category_ranks[codes], len(categories)), kind="stable")
+
+    df_joined = df_all_data.take(order).reset_index(drop=True)
+    rows = rows[order]
+
+    for column in df_by_variant_type.columns.drop("variant_type"):
+        df_joined[column] = df_by_variant_type[column].reset_index(drop=True).reindex(rows).to_numpy()
+
+    return df_joined
+
+
+def compute_associations(df_all_data: pandas.DataFrame, df_by_variant_type: pandas.DataFrame, fields: list) -> tuple:
+    """
+    Tests the association of the variant types with every metadata field (see association.associate).
+
+    Parameters
+    ----------
+    df_all_data : dataframe
+        The assignments joined with the metadata (see join_metadata)
+
+    df_by_variant_type : dataframe
+        The variant type table (variant_type, count, VT)
+
+    fields : list
+        The metadata fields to test
+
+    Returns
+    -------
+    A tuple of the per field and the per VT and value test tables
+    """
+
+    categories, codes = variant_type_codes(df_all_data)
+
+    # the VT (row of the variant type table) of every sequence, as integer codes
+    table_rows = pandas.Index(df_by_variant_type["variant_type"]).get_indexer(categories)
+    vt_codes = numpy.where(codes >= 0, table_rows[codes], -1)
+
+    field_codes = {}
+
+    for field in fields:
+        values = df_all_data[field]
+        if not isinstance(values.dtype, pandas.CategoricalDtype):
+            values = values.astype("category")
+        field_codes[field] = (values.cat.codes.to_numpy(), list(values.cat.categories))
+
+    return association.associate(vt_codes, df_by_variant_type["VT"].tolist(), field_codes)
+
+
+def write_association_tables(df_fields: pandas.DataFrame, df_cells: pandas.DataFrame, feature: str = None,
+                             context=None):
+    """
+    Writes the association test tables: feavar_field_associations.csv and feavar_associations.csv, or the
+    field_associations and associations tables of the columnar dataset.
+
+    :param df_fields: the per field tests
+    :param df_cells: the per VT and value tests
+    :param feature: the name of the sequence feature, a column of the tables (the partition in columnar output)
+    :param context: where the results are written and the stages measured; default is default_context()
+    """
+
+    context = context or default_context()
+
+    if context.output_dir is None:
+        return
+
+    if context.output_format == "csv":
+        if feature is not None:
+            df_fields = df_fields.assign(feature=feature)
+            df_cells = df_cells.assign(feature=feature)
+        df_fields.to_csv(os.path.join(context.output_dir, "feavar_field_associations.csv"), index=False)
+        df_cells.to_csv(os.path.join(context.output_dir, "feavar_associations.csv"), index=False)
+        return
+
+    dataset_dir = os.path.join(context.output_dir, columnar.DATASET_NAME)
+
+    columnar.write_table(df_fields, dataset_dir, "field_associations", context.output_format, feature)
+    columnar.write_table(df_cells, dataset_dir, "associations", context.output_format, feature)
+
+
+def compute_batch_associations(metadata_file, feature_results: dict, fields: list = None, context=None) -> tuple:
+    """
+    Tests the association of the variant types of every feature of a batch with the metadata fields;
+    the metadata is read and indexed once for all features.
+
+    :param metadata_file: the metadata file (tab delimited)
+    :param feature_results: feature names to (df_by_variant_type, df_starter), see compute_feature_batch
+    :param fields: the metadata fields to test; default is every column of the metadata file
+    :param context: where the results are written and the stages measured; default is default_context()
+    :return: the per field and the per VT and value test tables of all features, with a feature column
+    """
+
+    context = context or default_context()
+
+    if not feature_results:
+        return None, None
+
+    accessions = next(iter(feature_results.values()))[1]['accession']
+    df_metadata = import_metadata(metadata_file, fields, accessions=accessions, context=context)
+    fields = list(df_metadata.columns.drop("accession"))
+
+    field_tables, cell_tables = [], []
+
+    for name, (df_by_variant_type, df_starter) in feature_results.items():
+
+        df_fields, df_cells = compute_associations(join_metadata(df_starter, df_metadata), df_by_variant_type, fields)
+
+        field_tables.append(df_fields.assign(feature=name))
+        cell_tables.append(df_cells.assign(feature=name))
+
+    df_fields = pandas.concat(field_tables, ignore_index=True)
+    df_cells = pandas.concat(cell_tables, ignore_index=True)
+
+    # the q-values control the false discovery rate over every test of the batch
+    df_fields["q_value"] = association.benjamini_hochberg(df_fields["p_value"].to_numpy(dtype=float))
+    df_cells["q_value"] = association.benjamini_hochberg(df_cells["p_value"].to_numpy(dtype=float))
+
+    if context.output_format == "csv":
+        write_association_tables(df_fields, df_cells, context=context)
+    else:
+        for name in feature_results:
+            write_association_tables(df_fields[df_fields["feature"] == name].drop(columns="feature"),
+                                     df_cells[df_cells["feature"] == name].drop(columns="feature"), name,
+                                     context=context)
+
+    return df_fields, df_cells
+
+
+def process_metadata(metadata_file, df_by_variant_type, df_starter, no_of_vt_to_plot, log_level, fields=None,
+                     processes=1, statistics=False, feature=None, context=None):
+    """
+
+    :param metadata_file: 
+    :param df_by_variant_type: 
+    :param df_starter: 
+    :param no_of_vt_to_plot: 
+    :param log_level: 
+    :param fields: the metadata fields to load and plot; default is every column of the metadata file
+    :param processes: the number of worker processes rendering plots
+    :param statistics: whether to test the association of the variant types with every field
+    :param feature: the name of the sequence feature in the association tables
+    :param context: where the results are written and the stages measured; default is default_context()
+    :return: 
+    """
+    import pandas
+    import sys
+
+    context = context or default_context()
+
+    try:
+
+        logging.debug("Metadata file is present at: %s", metadata_file)
+
+        with context.recorder.stage("metadata_join", len(df_starter)):
+            df_metadata = import_metadata(metadata_file, fields, accessions=df_starter['accession'], context=context)
+            df_all_data = join_metadata(df_starter, df_metadata)
+
+        write_derived_table(df_all_data, "all_data", "df_all_data.csv", csv_wanted=log_level == 'debug',
+                            context=context)
+
+        if statistics:
+
+            with context.recorder.stage("associations", len(df_all_data.columns) - 2):
+                df_fields, df_cells = compute_associations(df_all_data, df_by_variant_type,
+                                                           list(df_all_data.columns[2:]))
+                write_association_tables(df_fields, df_cells, feature, context=context)
+
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info("Variant type associations:\n%s", df_fields.to_string())
+
+        df_all_data_with_variant_type = join_variant_type_table(df_all_data, df_by_variant_type)
+
+        write_derived_table(df_all_data_with_variant_type, "all_data_with_variant_type",
+                            "df_all_data_with_variant_type.csv", context=context)
+
+        # for large dataframes select the top X rows
+        df_top = select_var_types_to_plot(df_all_data_with_variant_type, no_of_vt_to_plot)
+
+        write_derived_table(df_top, "top", "df_top.csv", csv_wanted=log_level == 'debug', index=False, context=context)
+
+        columns = list(df_all_data.columns)
+
+        logging.debug("The columns in the %s dataframe are: %s", "df_all_data", columns)
+
+        # listing every variant type is only worth it when it is logged
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("The variant types are: %s", list(df_all_data.variant_type.unique()))
+
+        write_derived_table(df_top, "by_field", "df_by_field.csv", context=context)
+
+        if context.output_dir is None:
+            return
+
+        logging.info("Now plotting graphs for: %s", ", ".join(columns[2:]))
+
+        with context.recorder.stage("plotting", len(columns) - 2) as stage:
+            rendered = plotting.plot_fields(df_top, columns[2:], context.output_dir, processes, feature,
+                                            no_of_vt_to_plot)
+            stage["rendered"] = len(rendered)
+
+        logging.info("Rendered %d of %d plots, the others are unchanged", len(rendered), len(columns[2:]))
+
+    except OSError as err:
+        print("OS error: {0}".format(err))
+
+    except ValueError:
+        print("Could not convert data to an integer.")
+
+    except:
+        print("Unexpected error:", sys.exc_info()[0])
+        raise
+
+
+def metadata_fields(arguments):
+    """
+    The metadata fields given with --fields, or None for every field.
+    """
+
+    if not getattr(arguments, "fields", None):
+        return None
+
+    return [field.strip() for field in arguments.fields.split(",") if field.strip()]
+
+
+def configure_run(arguments, working_directory: str = None):
+    """
+    Sets up a run from its arguments: the output format and tables, the output directory
+    (output/ in the working directory) and logging (logs/<date>.log in the working directory).
+
+    Parameters
+    ----------
+    arguments :
+        The parsed command line arguments (output_format, tables and log_level are used)
+
+    working_directory : string
+        The directory holding the output and logs directories; default is the current directory
+    """
+    import datetime
+    global output_dir, output_format, output_tables
+
+    tables = [table.strip() for table in (arguments.tables or "").split(",") if table.strip()]
+
+    unknown_tables = set(tables) - set(columnar.DERIVED_TABLES)
+    if unknown_tables:
+        raise ValueError("unknown --tables: {}".format(", ".join(sorted(unknown_tables))))
+
+    if arguments.output_format != "csv":
+        columnar.require_pyarrow()
+
+    cds_start = getattr(arguments, "cds_start", None)
+
+    if cds_start is not None:
+
+        if cds_start < 1:
+            raise ValueError("--cds_start must be a position of the reference sequence, not {}".format(cds_start))
+
+        if arguments.positions is None or arguments.state_file is not None or arguments.engine == "stream":
+            raise ValueError("--cds_start types a single feature (--positions) with the numpy or python engine, "
+                             "without --state_file")
+
+    output_format = arguments.output_format
+    output_tables = tables
+
+    cwd = working_directory or os.getcwd()
+    log_directory = os.path.join(cwd, "logs")
+    if not os.path.exists(log_directory):
+        os.makedirs(log_directory)
+
+    output_dir = os.path.join(cwd, "output")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    D = datetime.date.today()
+    log_file_path = os.path.join(log_directory, '{}.log'.format(D.isoformat()))
+    f_handler = logging.FileHandler(log_file_path)
+    # logging.basicConfig(stream=sys.stdout, level=arguments.log_level.upper())
+    logging.basicConfig(level=arguments.log_level.upper(),
                         format='%(name)s - %(levelname)s - %(message)s',
                         datefmt='%m-%d %H:%M',
-                        filename=os.path.join(log_directory, '{}.log'.format(D.isoformat())),
+                        filename=log_file_path,
                         filemode='w')
     logging.info("Logging started")
-    logging.debug("Arguments:{0}".format(str(ARGS)))
+    logging.debug("Arguments: %s", arguments)
 
     # Create a custom logger
     logger = logging.getLogger(__name__)
@@ -651,4 +1873,253 @@ if __name__ == "__main__":
     logger.addHandler(c_handler)
     logger.addHandler(f_handler)
 
-    main(ARGS)
+
+def run_inputs(arguments) -> dict:
+    """
+    The inputs of a run for the run report: the arguments, and the size and modification time of the input files.
+    """
+
+    inputs = {key: value for key, value in vars(arguments).items()}
+
+    for argument in ["alignment", "features_file", "metadata_file"]:
+
+        file_path = inputs.get(argument)
+
+        if file_path and os.path.isfile(file_path):
+            inputs[argument + "_bytes"] = os.path.getsize(file_path)
+            inputs[argument + "_modified"] = os.path.getmtime(file_path)
+
+    return inputs
+
+
+def main(arguments, context=None):
+    """
+    Main method for the sequence feature variant type python script; measures the run and writes the
+    run report (see instrumentation) even when the run stops early.
+
+    :param arguments: the parsed command line arguments
+    :param context: where the run writes its results; default is the configuration of configure_run
+    :return: the status of the run, complete or failed (an error, or the pre-flight check failed)
+    """
+
+    progress = instrumentation.print_progress if getattr(arguments, "progress", False) else None
+    run_recorder = instrumentation.RunRecorder(__version__, progress, getattr(arguments, "trace_memory", False))
+
+    if context is None:
+        context = RunContext(output_dir, output_format, output_tables, run_recorder)
+    else:
+        context = RunContext(context.output_dir, context.output_format, context.output_tables, run_recorder)
+
+    report_path = getattr(arguments, "report", None)
+
+    if report_path is None and context.output_dir is not None:
+        report_path = os.path.join(context.output_dir, instrumentation.REPORT_FILE)
+
+    status = "failed"
+
+    try:
+        run_analysis(arguments, context=context)
+
+        # a failed pre-flight check is logged and stops the analysis without raising
+        if run_recorder.results.get("pre_flight_passed", True):
+            status = "complete"
+    finally:
+        if report_path is not None:
+            report = run_recorder.write_report(report_path, run_inputs(arguments), {"status": status})
+        else:
+            report = run_recorder.report(run_inputs(arguments), {"status": status})
+
+    summary = ", ".join("{} {:.2f} s".format(stage["stage"], stage["wall_seconds"]) for stage in report["stages"])
+    print("Analysis {} in {:.2f} s ({}); run report: {}".format(status, report["wall_seconds"], summary, report_path))
+
+    return status
+
+
+def cached_residues(residues: list) -> list:
+    """
+    The validated residues of a feature as stored with a cached result: chain, residue code and position.
+
+    :param residues: the parsed residues of the feature (see epitope.parse_epitope)
+    """
+
+    return [[residue.chain, residue.residue, int(residue.position)] for residue in residues]
+
+
+def run_analysis(arguments, context=None):
+    """
+    Runs the analysis the arguments ask for: a single feature, a features file batch or a scan.
+
+    :param arguments: the parsed command line arguments
+    :param context: where the results are written and the stages measured; default is default_context()
+    """
+
+    context = context or default_context()
+
+    # a cached result for the same alignment content, format, reference and positions skips parsing entirely
+    cache, cache_key, cached = None, None, None
+
+    if arguments.cache_dir is not None and arguments.positions is not None and arguments.state_file is None:
+
+        # the residue codes of the feature are part of the key: a run is only cached once they matched the reference
+        residues = epitope.parse_epitope(arguments.positions)
+
+        cache = result_cache.ResultCache(arguments.cache_dir, arguments.cache_size * 1024 ** 2)
+        cache_key = cache.key_for(arguments.alignment, arguments.alignment_format, arguments.reference_identifier,
+                                  parse_position_input(arguments.positions), __version__,
+                                  getattr(arguments, "cds_start", None), residues)
+        cached = cache.get(cache_key, {"residues": cached_residues(residues)})
+
+    if cached is not None:
+
+        logging.info("Using cached result %s", cache_key)
+
+        df_by_variant_type, df_starter = cached
+        context.recorder.results["cached"] = True
+        record_variant_type_results(df_by_variant_type, context=context)
+        feature = columnar.positions_label(parse_position_input(arguments.positions))
+        write_variant_type_tables(arguments.alignment, df_by_variant_type, df_starter, arguments.log_level,
+                                  feature=feature, context=context)
+
+        with context.recorder.stage("naming", len(df_by_variant_type)):
+            write_variant_type_naming(df_by_variant_type, parse_position_input(arguments.positions),
+                                      find_reference_variant_type(df_starter, arguments.reference_identifier),
+                                      feature, context=context)
+
+        if arguments.metadata_file is not None:
+            process_metadata(arguments.metadata_file, df_by_variant_type, df_starter, arguments.top,
+                             arguments.log_level, metadata_fields(arguments), arguments.processes,
+                             arguments.statistics, feature, context=context)
+
+        return
+
+    # the alignment is parsed exactly once and shared by every stage below
+    streamed = streams_alignment(arguments)
+
+    alignment = None
+
+    if not streamed:
+
+        with context.recorder.stage("parse") as stage:
+            alignment = load_alignment(arguments.alignment, arguments.alignment_format, arguments.binary_cache)
+            stage["n_items"] = len(alignment)
+
+    if arguments.scan_window is not None:
+
+        ref_seq_in_alignment, reference_sequence = check_for_ref_seq_in_alignment(arguments.reference_identifier,
+                                                                                  alignment)
+
+        context.recorder.results["pre_flight_passed"] = ref_seq_in_alignment
+
+        if not ref_seq_in_alignment:
+            logging.error("No reference identifier found: %s", arguments.reference_identifier)
+            return
+
+        with context.recorder.stage("scan") as stage:
+            df_scan = scan_variant_types(alignment, reference_sequence, arguments.scan_window, arguments.step)
+            stage["n_items"] = len(df_scan)
+
+        context.recorder.results["n_windows"] = len(df_scan)
+
+        if context.output_dir is None:
+            return
+
+        dir_name, file_name = os.path.split(arguments.alignment)
+        df_scan.to_csv(os.path.join(context.output_dir,
+                                    "feavar_scan_{}_k{}.csv".format(file_name, arguments.scan_window)), index=False)
+
+        return
+
+    if arguments.features_file is not None:
+
+        with context.recorder.stage("pre_flight"):
+            checked_features = pre_flight_check_batch(arguments, alignment)
+
+        context.recorder.results["pre_flight_passed"] = len(checked_features) > 0
+
+        if not checked_features:
+            return
+
+        feature_results = compute_feature_batch(arguments.alignment,
+                                                arguments.alignment_format,
+                                                checked_features,
+                                                arguments.log_level,
+                                                alignment=alignment,
+                                                engine=arguments.engine, context=context)
+
+        if arguments.metadata_file is not None and arguments.statistics:
+            with context.recorder.stage("associations", len(feature_results)):
+                compute_batch_associations(arguments.metadata_file, feature_results, metadata_fields(arguments),
+                                           context=context)
+
+        return
+
+    corrected_positions: list
+    with context.recorder.stage("pre_flight"):
+        corrected_positions, rules = pre_flight_check(arguments, alignment)
+
+    context.recorder.results["pre_flight_passed"] = all(rules)
+    context.recorder.results["corrected_positions"] = corrected_positions
+
+    if not all(rules):
+        return
+
+    feature = columnar.positions_label(parse_position_input(arguments.positions))
+
+    if arguments.state_file is not None:
+
+        df_by_variant_type, df_starter = update_variant_types(arguments.alignment,
+                                                              arguments.alignment_format,
+                                                              corrected_positions,
+                                                              arguments.log_level,
+                                                              arguments.state_file,
+                                                              alignment=alignment,
+                                                              feature=feature, context=context)
+
+    else:
+
+        df_by_variant_type, df_starter = compute_variant_types(arguments.alignment,
+                                                               arguments.alignment_format,
+                                                               corrected_positions,
+                                                               arguments.log_level,
+                                                               alignment=alignment,
+                                                               engine=arguments.engine,
+                                                               processes=arguments.processes,
+                                                               feature=feature, context=context,
+                                                               codons=getattr(arguments, "cds_start", None) is not None)
+
+    if df_starter is None and (arguments.metadata_file is not None or cache is not None):
+        df_starter = pandas.read_csv(os.path.join(context.output_dir, 'df_accession_index.csv'), index_col=0,
+                                     keep_default_na=False, dtype={'variant_type': 'category'})
+
+    if df_by_variant_type is not None:
+        with context.recorder.stage("naming", len(df_by_variant_type)):
+            write_variant_type_naming(df_by_variant_type, parse_position_input(arguments.positions),
+                                      find_reference_variant_type(df_starter, arguments.reference_identifier),
+                                      feature, context=context)
+
+    # a failed run (its error was reported above) is not cached
+    if cache is not None and df_by_variant_type is not None and df_starter is not None:
+        cache.put(cache_key, df_by_variant_type, df_starter,
+                  {"alignment": os.path.abspath(arguments.alignment),
+                   "alignment_format": arguments.alignment_format,
+                   "reference_identifier": arguments.reference_identifier,
+                   "positions": arguments.positions,
+                   "residues": cached_residues(epitope.parse_epitope(arguments.positions)),
+                   "cds_start": getattr(arguments, "cds_start", None)})
+
+    if arguments.metadata_file is not None:
+
+        process_metadata(arguments.metadata_file, df_by_variant_type, df_starter, arguments.top, arguments.log_level,
+                         metadata_fields(arguments), arguments.processes, arguments.statistics, feature,
+                         context=context)
+
+
+if __name__ == "__main__":
+
+    # the command line is defined once, in cli
+    try:
+        from FeaVar import cli
+    except ImportError:  # run as a script from inside the package directory
+        import cli
+
+    cli.script_main()
@@ -0,0 +1,7 @@
+"""python -m FeaVar runs the feavar command (see FeaVar.cli)."""
+
+import sys
+
+from FeaVar.cli import main
+
+sys.exit(main(prog_name="feavar"))
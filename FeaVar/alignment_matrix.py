@@ -0,0 +1,188 @@
+"""
+FeaVar alignment matrix
+
+This module holds a multiple sequence alignment as a two dimensional uint8 array
+(sequences x columns) so sequence features can be extracted and grouped with
+vectorized numpy operations instead of per residue python indexing.
+
+"""
+
+import numpy
+
+
+class AlignmentMatrix:
+    """
+    A multiple sequence alignment stored as one byte per residue.
+
+    Parameters
+    ----------
+    ids : list
+        The sequence identifiers, one per row of the matrix
+
+    matrix : numpy.ndarray
+        The residues of the alignment as a (sequences x columns) uint8 array
+    """
+
+    def __init__(self, ids: list, matrix: numpy.ndarray):
+
+        if matrix.ndim != 2 or len(ids) != matrix.shape[0]:
+            raise ValueError("The alignment matrix must have one row per sequence identifier.")
+
+        self.ids = ids
+        self.matrix = matrix
+
+        self._id_index = None
+
+    @classmethod
+    def from_alignment(cls, alignment):
+        """
+        Build the matrix from a Bio.Align.MultipleSeqAlignment (or any iterable of SeqRecords).
+
+        Parameters
+        ----------
+        alignment :
+            The loaded multiple sequence alignment
+        """
+
+        ids = []
+        rows = []
+
+        for record in alignment:
+            ids.append(record.id)
+            rows.append(bytes(record.seq))
+
+        if not rows:
+            return cls(ids, numpy.empty((0, 0), dtype=numpy.uint8))
+
+        alignment_length = len(rows[0])
+
+        if any(len(row) != alignment_length for row in rows):
+            raise ValueError("Sequences in the alignment are not all the same length.")
+
+        matrix = numpy.frombuffer(b"".join(rows), dtype=numpy.uint8).reshape(len(rows), alignment_length)
+
+        return cls(ids, matrix)
+
+    def __len__(self) -> int:
+
+        return self.matrix.shape[0]
+
+    def __iter__(self):
+
+        from Bio.Seq import Seq
+        from Bio.SeqRecord import SeqRecord
+
+        for row, sequence_id in enumerate(self.ids):
+            yield SeqRecord(Seq(self.sequence(row)), id=sequence_id)
+
+    @property
+    def id_index(self):
+        """
+        The SequenceIdIndex of the sequence identifiers, built on first use.
+        """
+
+        if self._id_index is None:
+
+            try:
+                from FeaVar.id_index import SequenceIdIndex
+            except ImportError:  # run as a script from inside the package directory
+                from id_index import SequenceIdIndex
+
+            self._id_index = SequenceIdIndex(self.ids)
+
+        return self._id_index
+
+    def get_alignment_length(self) -> int:
+        """
+        The number of columns in the alignment (same name as on MultipleSeqAlignment).
+        """
+
+        return self.matrix.shape[1]
+
+    def sequence(self, row: int) -> str:
+        """
+        The aligned sequence of one row as a string.
+
+        Parameters
+        ----------
+        row : int
+            The row (sequence) number
+        """
+
+        return self.matrix[row].tobytes().decode("ascii")
+
+    def feature_matrix(self, positions: list) -> numpy.ndarray:
+        """
+        Slice the columns of a sequence feature out of every sequence at once.
+
+        Parameters
+        ----------
+        positions : list
+            The column indices of the sequence feature, in the same indexing used to build variant types
+        """
+
+        return self.matrix[:, numpy.asarray(positions, dtype=numpy.intp)]
+
+    def variant_types(self, positions: list):
+        """
+        Group the sequences by the residues found at the sequence feature positions.
+
+        Parameters
+        ----------
+        positions : list
+            The column indices of the sequence feature
+
+        Returns
+        -------
+        A tuple of the distinct variant types (as strings), the index of the variant type of every
+        sequence and the number of sequences per variant type.
+        """
+
+        return group_feature_rows(self.feature_matrix(positions))
+
+
+def group_feature_rows(features: numpy.ndarray):
+    """
+    Group the rows of a (sequences x feature positions) uint8 array by their bytes.
+
+    Parameters
+    ----------
+    features : numpy.ndarray
+        The extracted sequence feature residues of every sequence
+
+    Returns
+    -------
+    A tuple of the distinct variant types (as strings, sorted), the index of the variant type of every
+    sequence and the number of sequences per variant type.
+    """
+
+    features = numpy.ascontiguousarray(features, dtype=numpy.uint8)
+    width = features.shape[1]
+
+    if width == 0:
+        raise ValueError("No sequence feature positions to group on.")
+
+    # view every row as one opaque value so numpy.unique compares whole rows at C speed
+    rows = features.view(numpy.dtype((numpy.void, width))).ravel()
+
+    unique_rows, inverse, counts = numpy.unique(rows, return_inverse=True, return_counts=True)
+
+    variant_types = [row.tobytes().decode("ascii") for row in unique_rows]
+
+    return variant_types, inverse.ravel(), counts
+
+
+def as_alignment_matrix(alignment) -> AlignmentMatrix:
+    """
+    Return the alignment as an AlignmentMatrix, converting a loaded Bio alignment if necessary.
+
+    Parameters
+    ----------
+    alignment :
+        An AlignmentMatrix or a loaded multiple sequence alignment
+    """
+
+    if isinstance(alignment, AlignmentMatrix):
+        return alignment
+
+    return AlignmentMatrix.from_alignment(alignment)
@@ -0,0 +1,348 @@
+"""
+FeaVar variant type association statistics
+
+This module tests the variant types of a sequence feature for association with metadata fields
+(host, year, country, ...), as in the sequence feature variant type (SFVT) studies cited in the
+README.
+
+Every VT x value contingency table of every field is counted in one numpy.bincount over the
+integer codes of the assignment table. From these tables the module computes
+
+    per field           the chi-square test of independence of VT and value, and Cramer's V
+    per VT and value    the odds ratio of the value among the sequences of the VT against all
+                        other sequences, tested with the chi-square test on the 2x2 table, or
+                        Fisher's exact test when an expected count is below 5
+
+and Benjamini-Hochberg q-values over all the tests of a kind. Everything is computed with numpy
+on whole arrays of tables; sequences without a VT or without a value for a field are left out
+of that field's tables.
+
+"""
+
+import math
+
+import numpy
+
+# cells with an expected count below this are tested with Fisher's exact test
+FISHER_EXPECTED_COUNT = 5
+
+# the most 2x2 tables x support values handled at once by the vectorized Fisher's exact test
+_FISHER_BLOCK = 1 << 22
+
+
+def contingency_tables(vt_codes: numpy.ndarray, n_variant_types: int, field_codes: list, field_sizes: list) -> list:
+    """
+    Counts the VT x value contingency table of every field in one pass.
+
+    Parameters
+    ----------
+    vt_codes : numpy.ndarray
+        The VT code (0 .. n_variant_types - 1, or -1 if none) of every sequence
+
+    n_variant_types : int
+        The number of variant types
+
+    field_codes : list
+        For every field, the value code (0 .. field size - 1, or -1 if missing) of every sequence
+
+    field_sizes : list
+        The number of values of every field
+
+    Returns
+    -------
+    A list of (n_variant_types x field size) count arrays, one per field
+    """
+
+    vt_codes = numpy.asarray(vt_codes, dtype=numpy.int64)
+    offsets = numpy.concatenate([[0], numpy.cumsum(field_sizes)]).astype(numpy.int64)
+    n_columns = int(offsets[-1])
+
+    # one flat cell index per (sequence, field): VT row times all value columns plus the field's column
+    cells = []
+
+    for codes, offset in zip(field_codes, offsets[:-1]):
+
+        codes = numpy.asarray(codes, dtype=numpy.int64)
+        present = (vt_codes >= 0) & (codes >= 0)
+
+        cells.append(vt_codes[present] * n_columns + offset + codes[present])
+
+    flat_cells = numpy.concatenate(cells) if cells else numpy.zeros(0, dtype=numpy.int64)
+    counts = numpy.bincount(flat_cells, minlength=n_variant_types * n_columns).reshape(n_variant_types, n_columns)
+
+    return [counts[:, start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def _regularized_gamma_q(a: float, x: float) -> float:
+    """
+    The regularized upper incomplete gamma function Q(a, x), by its series or continued fraction.
+    """
+
+    if x <= 0:
+        return 1.0
+
+    log_prefactor = a * math.log(x) - x - math.lgamma(a)
+
+    if x < a + 1:
+
+        term = total = 1.0 / a
+        denominator = a
+
+        for _ in range(10000):
+            denominator += 1
+            term *= x / denominator
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+
+        return max(0.0, 1.0 - total * math.exp(log_prefactor))
+
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    fraction = d
+
+    for i in range(1, 10000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        fraction *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+
+    return min(1.0, math.exp(log_prefactor) * fraction)
+
+
+_erfc = numpy.frompyfunc(math.erfc, 1, 1)
+
+
+def chi2_sf(statistics, dof) -> numpy.ndarray:
+    """
+    The chi-square survival function (p-value) of statistics with dof degrees of freedom; NaN where dof < 1.
+    """
+
+    statistics, dof = numpy.broadcast_arrays(numpy.asarray(statistics, dtype=float), numpy.asarray(dof, dtype=float))
+
+    flat_statistics, flat_dof = statistics.ravel(), dof.ravel()
+    p_values = numpy.full(flat_statistics.shape, numpy.nan)
+
+    finite = numpy.isfinite(flat_statistics) & (flat_statistics >= 0)
+
+    # closed forms for the 2x2 tables (1 degree of freedom) and 2 degrees of freedom
+    one = finite & (flat_dof == 1)
+    p_values[one] = _erfc(numpy.sqrt(flat_statistics[one] / 2)).astype(float)
+
+    two = finite & (flat_dof == 2)
+    p_values[two] = numpy.exp(-flat_statistics[two] / 2)
+
+    for index in numpy.flatnonzero(finite & (flat_dof >= 3)):
+        p_values[index] = _regularized_gamma_q(flat_dof[index] / 2, flat_statistics[index] / 2)
+
+    return p_values.reshape(statistics.shape)
+
+
+def fisher_exact(a, b, c, d) -> numpy.ndarray:
+    """
+    Two-sided Fisher's exact test p-values of many 2x2 tables [[a, b], [c, d]].
+
+    All tables are evaluated together: the hypergeometric probabilities of the whole support of
+    every table are computed from one table of log factorials.
+    """
+
+    a, b, c, d = (numpy.asarray(values, dtype=numpy.int64).ravel() for values in (a, b, c, d))
+
+    p_values = numpy.ones(len(a))
+
+    if len(a) == 0:
+        return p_values
+
+    row_totals, column_totals, totals = a + b, a + c, a + b + c + d
+
+    log_factorials = numpy.concatenate([[0.0], numpy.cumsum(numpy.log(numpy.arange(1, totals.max() + 1)))])
+
+    low = numpy.maximum(0, row_totals + column_totals - totals)
+    high = numpy.minimum(row_totals, column_totals)
+
+    def log_probabilities(k, rows):
+        return (log_factorials[row_totals[rows, None]] + log_factorials[totals[rows, None] - row_totals[rows, None]] +
+                log_factorials[column_totals[rows, None]] +
+                log_factorials[totals[rows, None] - column_totals[rows, None]] -
+                log_factorials[totals[rows, None]] - log_factorials[k] - log_factorials[row_totals[rows, None] - k] -
+                log_factorials[column_totals[rows, None] - k] -
+                log_factorials[totals[rows, None] - row_totals[rows, None] - column_totals[rows, None] + k])
+
+    support_length = int((high - low).max()) + 1
+    block = max(1, _FISHER_BLOCK // support_length)
+
+    for start in range(0, len(a), block):
+
+        rows = numpy.arange(start, min(start + block, len(a)))
+
+        k = low[rows, None] + numpy.arange(support_length)[None, :]
+        in_support = k <= high[rows, None]
+        k = numpy.where(in_support, k, low[rows, None])
+
+        probabilities = numpy.where(in_support, numpy.exp(log_probabilities(k, rows)), 0.0)
+        observed = numpy.exp(log_probabilities(a[rows, None], rows))
+
+        # tables as or less likely than the observed one, with a relative tolerance for rounding
+        p_values[rows] = numpy.where(probabilities <= observed * (1 + 1e-7), probabilities, 0.0).sum(axis=1)
+
+    return numpy.minimum(p_values, 1.0)
+
+
+def benjamini_hochberg(p_values) -> numpy.ndarray:
+    """
+    Benjamini-Hochberg q-values (false discovery rate adjusted p-values); NaN p-values are left out.
+    """
+
+    p_values = numpy.asarray(p_values, dtype=float)
+    q_values = numpy.full(p_values.shape, numpy.nan)
+
+    tested = numpy.flatnonzero(~numpy.isnan(p_values))
+
+    if len(tested) == 0:
+        return q_values
+
+    order = tested[numpy.argsort(p_values[tested], kind="stable")]
+    ranked = p_values[order] * len(tested) / numpy.arange(1, len(tested) + 1)
+
+    q_values[order] = numpy.minimum(numpy.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+
+    return q_values
+
+
+def field_statistics(table: numpy.ndarray) -> dict:
+    """
+    The chi-square test of independence of a VT x value table (empty rows and columns left out).
+
+    Returns
+    -------
+    A dictionary of the number of sequences, chi2, dof, p_value and cramers_v
+    """
+
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0].astype(float)
+
+    total = table.sum()
+    dof = (table.shape[0] - 1) * (table.shape[1] - 1)
+
+    if dof < 1:
+        return {"sequences": int(total), "chi2": numpy.nan, "dof": dof, "p_value": numpy.nan, "cramers_v": numpy.nan}
+
+    expected = numpy.outer(table.sum(axis=1), table.sum(axis=0)) / total
+    chi2 = float(((table - expected) ** 2 / expected).sum())
+
+    return {"sequences": int(total), "chi2": chi2, "dof": dof, "p_value": float(chi2_sf(chi2, dof)),
+            "cramers_v": math.sqrt(chi2 / (total * (min(table.shape) - 1)))}
+
+
+def cell_statistics(table: numpy.ndarray) -> dict:
+    """
+    Tests every VT x value cell of a table: the value among the sequences of the VT against the
+    value among all other sequences.
+
+    Returns
+    -------
+    A dictionary of arrays shaped like the table: the VT total, value total, odds ratio (with 0.5
+    added to every cell of 2x2 tables with a zero), p_value and test ("chi2" or "fisher")
+    """
+
+    table = numpy.asarray(table, dtype=numpy.int64)
+
+    vt_totals = numpy.broadcast_to(table.sum(axis=1, keepdims=True), table.shape)
+    value_totals = numpy.broadcast_to(table.sum(axis=0, keepdims=True), table.shape)
+    total = table.sum()
+
+    a = table
+    b = vt_totals - a
+    c = value_totals - a
+    d = total - a - b - c
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+
+        has_zero = (a == 0) | (b == 0) | (c == 0) | (d == 0)
+        correction = numpy.where(has_zero, 0.5, 0.0)
+        odds_ratios = ((a + correction) * (d + correction)) / ((b + correction) * (c + correction))
+
+        expected = numpy.stack([vt_totals * value_totals, vt_totals * (total - value_totals),
+                                (total - vt_totals) * value_totals,
+                                (total - vt_totals) * (total - value_totals)]) / max(total, 1)
+
+        observed = numpy.stack([a, b, c, d]).astype(float)
+        chi2 = ((observed - expected) ** 2 / expected).sum(axis=0)
+
+    # a VT or value that covers no or all sequences can not be tested
+    testable = (vt_totals > 0) & (vt_totals < total) & (value_totals > 0) & (value_totals < total)
+    use_fisher = testable & (expected.min(axis=0) < FISHER_EXPECTED_COUNT)
+
+    p_values = numpy.full(table.shape, numpy.nan)
+
+    chi2_cells = testable & ~use_fisher
+    p_values[chi2_cells] = chi2_sf(chi2[chi2_cells], 1)
+    p_values[use_fisher] = fisher_exact(a[use_fisher], b[use_fisher], c[use_fisher], d[use_fisher])
+
+    tests = numpy.where(use_fisher, "fisher", numpy.where(testable, "chi2", ""))
+
+    return {"vt_total": vt_totals, "value_total": value_totals, "odds_ratio": odds_ratios,
+            "p_value": p_values, "test": tests}
+
+
+def associate(vt_codes: numpy.ndarray, vt_labels: list, fields: dict):
+    """
+    Tests the association of the variant types with every metadata field.
+
+    Parameters
+    ----------
+    vt_codes : numpy.ndarray
+        The VT code of every sequence (an index into vt_labels, -1 if none)
+
+    vt_labels : list
+        The VT ids
+
+    fields : dict
+        Field names to (value codes of every sequence, value labels)
+
+    Returns
+    -------
+    A tuple of two dataframes: the per field tests (field, sequences, chi2, dof, p_value, cramers_v,
+    q_value) and the per VT and value tests (field, value, VT, count, vt_total, value_total,
+    odds_ratio, p_value, test, q_value); q-values are computed over all tests of the dataframe
+    """
+
+    import pandas
+
+    names = list(fields)
+    tables = contingency_tables(vt_codes, len(vt_labels), [fields[name][0] for name in names],
+                                [len(fields[name][1]) for name in names])
+
+    field_rows = []
+    cell_frames = []
+
+    for name, table in zip(names, tables):
+
+        field_rows.append(dict(field=name, **field_statistics(table)))
+
+        cells = cell_statistics(table)
+        values = list(fields[name][1])
+
+        cell_frames.append(pandas.DataFrame({
+            "field": name,
+            "value": numpy.tile(numpy.asarray(values, dtype=object), len(vt_labels)),
+            "VT": numpy.repeat(numpy.asarray(vt_labels, dtype=object), len(values)),
+            "count": table.ravel(),
+            **{column: numpy.asarray(array).ravel() for column, array in cells.items()}}))
+
+    df_fields = pandas.DataFrame(field_rows, columns=["field", "sequences", "chi2", "dof", "p_value", "cramers_v"])
+    df_fields["q_value"] = benjamini_hochberg(df_fields["p_value"].to_numpy())
+
+    columns = ["field", "value", "VT", "count", "vt_total", "value_total", "odds_ratio", "p_value", "test"]
+    df_cells = pandas.concat(cell_frames, ignore_index=True) if cell_frames else pandas.DataFrame(columns=columns)
+    df_cells["q_value"] = benjamini_hochberg(df_cells["p_value"].to_numpy(dtype=float))
+
+    return df_fields, df_cells
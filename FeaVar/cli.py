@@ -1,18 +1,371 @@
 # -*- coding: utf-8 -*-
 
-"""Console script for FeaVar."""
+"""
+Console script for FeaVar.
+
+    feavar run -a alignment.clw -r CY021716 -p "124-142" -m metadata.tsv
+    feavar batch -a alignment.clw -r CY021716 -F features.tsv
+    feavar scan -a alignment.clw -r CY021716 -k 9
+    feavar check -p "H25, H45, V46" -F features.tsv
+    feavar convert alignment.clw
+    feavar cache info
+    feavar serve alignments.tsv --port 8765
+
+The command starts fast: only click and the standard library are imported to parse and check the
+arguments, and numpy, pandas, Biopython and matplotlib are imported by the subcommands that use
+them, so `feavar --help`, `feavar check` and argument errors cost no more than starting Python.
+Run it as `python -m FeaVar` when the package is not installed. `python FeaVar/FeaVar.py` takes the
+arguments of run, batch (-F) or scan (-k) without the subcommand (see script_main).
+"""
+import argparse
 import sys
+
 import click
 
+# columnar and instrumentation only import the standard library
+try:
+    from FeaVar.columnar import DERIVED_TABLES, OUTPUT_FORMATS
+    from FeaVar.instrumentation import REPORT_FILE
+except ImportError:  # run as a script from inside the package directory
+    from columnar import DERIVED_TABLES, OUTPUT_FORMATS
+    from instrumentation import REPORT_FILE
+
+ENGINES = ["numpy", "python", "stream"]
+
+# the arguments of FeaVar.main that a subcommand does not set
+_DEFAULTS = {"positions": None, "cds_start": None, "features_file": None, "scan_window": None, "step": 1,
+             "binary_cache": False, "engine": "numpy", "processes": 1, "state_file": None, "cache_dir": None,
+             "cache_size": 1024, "output_format": "csv", "tables": "", "metadata_file": None, "fields": None,
+             "statistics": False, "top": 10, "report": None, "progress": False, "trace_memory": False,
+             "log_level": "debug"}
+
+
+def _check_tables(ctx, param, value):
+
+    tables = [table.strip() for table in value.split(",") if table.strip()]
+
+    unknown_tables = set(tables) - set(DERIVED_TABLES)
+    if unknown_tables:
+        raise click.BadParameter("unknown tables: {}".format(", ".join(sorted(unknown_tables))))
+
+    return value
+
+
+def _alignment_options(command):
+
+    options = [
+        click.option("-a", "--alignment", required=True, type=click.Path(exists=True, dir_okay=False),
+                     help="The alignment file."),
+        click.option("-f", "--alignment_format", default="clustal", show_default=True,
+                     help="The alignment file format; fvaln for a FeaVar binary alignment."),
+        click.option("-r", "--reference_identifier", required=True,
+                     help="The reference sequence identifier; an accession or gid: AB01223."),
+        click.option("-b", "--binary_cache", is_flag=True,
+                     help="Convert the alignment to a binary .fvaln file next to it on first use and memory map it "
+                          "on later runs."),
+    ]
+
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+def _run_options(command):
+
+    options = [
+        click.option("-o", "--output_format", type=click.Choice(OUTPUT_FORMATS), default="csv", show_default=True,
+                     help="Write the tables as CSV files or as one compressed, per feature partitioned parquet or "
+                          "feather dataset (needs pyarrow)."),
+        click.option("--tables", default="", callback=_check_tables,
+                     help="The derived tables to write in parquet or feather output, comma separated: "
+                          "{} (default: none).".format(", ".join(DERIVED_TABLES))),
+        click.option("--report", type=click.Path(dir_okay=False),
+                     help="The file path of the JSON run report; default = output/{}.".format(REPORT_FILE)),
+        click.option("--progress", is_flag=True, help="Report the progress of long running stages on stderr."),
+        click.option("--trace_memory", is_flag=True,
+                     help="Measure the peak Python memory allocations of every stage with tracemalloc (slower)."),
+        click.option("-log", "--log_level", default="debug", show_default=True,
+                     type=click.Choice(["debug", "info", "warning", "error"], case_sensitive=False),
+                     help="The level of the log file in logs/."),
+    ]
+
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+def _metadata_options(command):
 
-@click.command()
+    options = [
+        click.option("-m", "--metadata_file", type=click.Path(exists=True, dir_okay=False),
+                     help="The metadata file (tab delimited)."),
+        click.option("--fields", help="The metadata fields to load, comma separated (default: every column)."),
+        click.option("--statistics", is_flag=True,
+                     help="Test the association of the variant types with every metadata field."),
+    ]
+
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+def _run_feavar(**options):
+    """
+    Runs FeaVar.main with the arguments of a subcommand; FeaVar (and with it pandas and Biopython)
+    is only imported here.
+    """
+
+    try:
+        from FeaVar import FeaVar
+    except ImportError:  # run as a script from inside the package directory
+        import FeaVar
+
+    arguments = argparse.Namespace(**dict(_DEFAULTS, **options))
+
+    try:
+        FeaVar.configure_run(arguments)
+    except (ValueError, ImportError) as err:
+        raise click.UsageError(str(err))
+
+    if FeaVar.main(arguments) != "complete":
+        raise click.ClickException("the pre-flight check failed, see the log")
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
 def main(args=None):
-    """Console script for FeaVar."""
-    click.echo("Replace this message by putting your code into "
-               "FeaVar.cli.main")
-    click.echo("See click documentation at http://click.pocoo.org/")
-    return 0
+    """Compute the variant types of sequence features in a multiple sequence alignment."""
+
+
+@main.command()
+@_alignment_options
+@click.option("-p", "--positions", required=True,
+              help="The position(s) of the sequence feature, comma separated, dashes for ranges, or IEDB style "
+                   "residues. Example: '100-110,120,130' or 'H25, H45, V46'.")
+@click.option("--cds_start", type=click.IntRange(min=1),
+              help="Read the positions as protein positions of the coding sequence starting at this (ungapped) "
+                   "reference position of a nucleotide alignment, and type the sequences by their translated codons.")
+@click.option("-e", "--engine", type=click.Choice(ENGINES), default="numpy", show_default=True,
+              help="The feature extraction engine; stream reads fasta or clustal alignments record by record.")
+@click.option("-j", "--processes", type=click.IntRange(min=1), default=1, show_default=True,
+              help="The number of worker processes for the numpy engine and for rendering plots.")
+@click.option("-u", "--state_file", type=click.Path(dir_okay=False),
+              help="Keep the assignments and counts in this state file and only type sequences appended since.")
+@click.option("-C", "--cache_dir", type=click.Path(file_okay=False),
+              help="Reuse results of earlier runs with the same inputs from this cache directory.")
+@click.option("--cache_size", type=click.IntRange(min=1), default=1024, show_default=True,
+              help="The size limit of the result cache in MB.")
+@_metadata_options
+@click.option("-t", "--top", type=click.IntRange(min=1), default=10, show_default=True,
+              help="The number (top) of variant types to plot.")
+@_run_options
+def run(**options):
+    """Type the sequences by one sequence feature.
+
+    Writes the variant type tables and, with metadata, plots the variant types by metadata field.
+    """
+
+    _run_feavar(**options)
+
+
+@main.command()
+@_alignment_options
+@click.option("-F", "--features_file", required=True, type=click.Path(exists=True, dir_okay=False),
+              help="A file of sequence features (name, tab, positions per line).")
+@click.option("-e", "--engine", type=click.Choice(["numpy", "python"]), default="numpy", show_default=True,
+              help="The feature extraction engine.")
+@_metadata_options
+@_run_options
+def batch(**options):
+    """Type the sequences by every feature of a features file.
+
+    The features are all extracted in one pass over the alignment. A metadata file is only used
+    for the association statistics, so --metadata_file needs --statistics.
+    """
+
+    if options["metadata_file"] is not None and not options["statistics"]:
+        raise click.UsageError("--metadata_file is only used by batch with --statistics.")
+
+    _run_feavar(**options)
+
+
+@main.command()
+@_alignment_options
+@click.option("-k", "--scan_window", required=True, type=click.IntRange(min=1),
+              help="The number of reference positions of every window.")
+@click.option("-s", "--step", type=click.IntRange(min=1), default=1, show_default=True,
+              help="The step between windows.")
+@_run_options
+def scan(**options):
+    """Scan the variant type diversity along the reference.
+
+    Reports the variant type diversity of every window of positions along the reference.
+    """
+
+    _run_feavar(**options)
+
+
+@main.command()
+@click.option("-p", "--positions", multiple=True, help="A sequence feature to check; may be repeated.")
+@click.option("-F", "--features_file", type=click.Path(exists=True, dir_okay=False),
+              help="A file of sequence features (name, tab, positions per line) to check.")
+def check(positions, features_file):
+    """Check the syntax of sequence features.
+
+    Parses the features without reading an alignment and lists the positions of every feature.
+    """
+
+    try:
+        from FeaVar import epitope
+    except ImportError:  # run as a script from inside the package directory
+        import epitope
+
+    features = {raw_positions: raw_positions for raw_positions in positions}
+
+    try:
+        if features_file is not None:
+            features.update(epitope.read_features_file(features_file))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    if not features:
+        raise click.UsageError("Nothing to check: give --positions or --features_file.")
+
+    errors = 0
+
+    for name, raw_positions in features.items():
+
+        try:
+            residues = epitope.parse_epitope(raw_positions)
+        except ValueError as err:
+            click.echo("{}\tinvalid: {}".format(name, err))
+            errors += 1
+            continue
+
+        click.echo("{}\t{} positions: {}".format(name, len(residues), ",".join(
+            sorted(set(str(residue.position) for residue in residues), key=int))))
+
+    if errors:
+        raise click.ClickException("{} of {} features are invalid".format(errors, len(features)))
+
+
+@main.command()
+@click.argument("alignment", type=click.Path(exists=True, dir_okay=False))
+@click.option("-f", "--alignment_format", default="clustal", show_default=True, help="The alignment file format.")
+@click.option("-O", "--output", type=click.Path(dir_okay=False),
+              help="The .fvaln file to write; default is next to the alignment.")
+def convert(alignment, alignment_format, output):
+    """Convert an alignment to a .fvaln binary alignment.
+
+    The FeaVar binary alignment is memory mapped by later runs instead of being parsed.
+    """
+
+    try:
+        from FeaVar import fvaln
+    except ImportError:  # run as a script from inside the package directory
+        import fvaln
+
+    click.echo(fvaln.convert_alignment(alignment, alignment_format, output))
+
+
+@main.command()
+@click.argument("config", type=click.Path(exists=True, dir_okay=False))
+@click.option("--host", default="127.0.0.1", show_default=True, help="The address to listen on.")
+@click.option("--port", type=click.IntRange(min=0, max=65535), default=8765, show_default=True,
+              help="The port to listen on.")
+@click.option("--socket", "socket_path", type=click.Path(dir_okay=False),
+              help="Listen on this Unix socket instead of TCP.")
+@click.option("--batch_window", type=click.FloatRange(min=0), default=0.005, show_default=True,
+              help="The seconds queries are collected for to be answered with one pass over the alignment.")
+@click.option("--cache_size", type=click.IntRange(min=0), default=4096, show_default=True,
+              help="The number of feature results kept in memory.")
+@click.option("-j", "--max_concurrency", type=click.IntRange(min=1),
+              help="The number of batches computed at the same time (default: the number of CPUs, up to 4).")
+@click.option("-log", "--log_level", default="warning", show_default=True,
+              type=click.Choice(["debug", "info", "warning", "error"], case_sensitive=False),
+              help="The level of the log on stderr.")
+def serve(config, host, port, socket_path, batch_window, cache_size, max_concurrency, log_level):
+    """Serve variant type queries on preloaded alignments.
+
+    CONFIG lists the alignments, one per line: name, alignment file, format and reference identifier,
+    tab separated. Queries are answered as JSON over HTTP, e.g.
+    GET /variant_types?alignment=HA&positions=124-142&top=10.
+    """
+
+    import logging
+
+    try:
+        from FeaVar import server
+    except ImportError:  # run as a script from inside the package directory
+        import server
+
+    logging.basicConfig(level=log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        server.serve(config, host, port, socket_path, batch_window=batch_window, cache_size=cache_size,
+                     max_concurrency=max_concurrency)
+    except (OSError, ValueError) as err:
+        raise click.ClickException(str(err))
+    except KeyboardInterrupt:
+        pass
+
+
+@main.group()
+def cache():
+    """Inspect or clear the result cache."""
+
+
+@cache.command()
+@click.option("--cache_dir", envvar="FEAVAR_CACHE_DIR", type=click.Path(file_okay=False),
+              help="The cache directory (default: $FEAVAR_CACHE_DIR or ~/.cache/feavar).")
+def info(cache_dir):
+    """List the cached results, most recently used first."""
+
+    _cache_command("info", cache_dir)
+
+
+@cache.command()
+@click.option("--cache_dir", envvar="FEAVAR_CACHE_DIR", type=click.Path(file_okay=False),
+              help="The cache directory (default: $FEAVAR_CACHE_DIR or ~/.cache/feavar).")
+def clear(cache_dir):
+    """Remove every cached result."""
+
+    _cache_command("clear", cache_dir)
+
+
+def _cache_command(command: str, cache_dir: str):
+
+    try:
+        from FeaVar import result_cache
+    except ImportError:  # run as a script from inside the package directory
+        import result_cache
+
+    result_cache.main([command] + (["--cache_dir", cache_dir] if cache_dir else []))
 
 
 if __name__ == "__main__":
     sys.exit(main())  # pragma: no cover
+
+
+def script_main(argv: list = None):
+    """
+    The command line of FeaVar.py: the arguments of run, or of batch with -F or scan with -k, without
+    the subcommand, e.g. python FeaVar/FeaVar.py -a alignment.clw -r CY021716 -p "124-142".
+    """
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+
+    if not argv or argv[0] not in main.commands:
+
+        options = {argument.split("=", 1)[0] for argument in argv}
+
+        if options & {"-F", "--features_file"}:
+            argv.insert(0, "batch")
+        elif options & {"-k", "--scan_window"}:
+            argv.insert(0, "scan")
+        else:
+            argv.insert(0, "run")
+
+    return main(args=argv, prog_name="FeaVar.py")
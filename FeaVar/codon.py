@@ -0,0 +1,228 @@
+"""
+FeaVar codon translation
+
+This module types sequences by amino acid sequence features on a nucleotide alignment: the
+protein positions of a feature are mapped to the alignment columns of their codons through the
+reference coordinate map, and the codons of all sequences are translated at once.
+
+    columns = codon_columns(CoordinateMap(reference_sequence), [124, 125, 126], cds_start=33)
+    variant_types, inverse, counts = codon_variant_types(alignment_matrix, columns)
+
+cds_start is the ungapped reference position of the first base of the first codon, so protein
+position p is read from reference positions cds_start + 3 (p - 1) .. cds_start + 3 (p - 1) + 2.
+Columns where the reference has a gap (insertions in other sequences) are not part of any codon.
+
+Translation looks every codon up in a table of all 16 x 16 x 16 combinations of IUPAC nucleotide
+codes, built once per genetic code:
+
+    - a codon of A, C, G and T (or U) translates as usual, stop codons to *
+    - a codon with ambiguous bases (N, R, Y, ...) translates to its amino acid if every codon it
+      stands for gives the same one (GCN -> A, TAR -> *), and to X otherwise
+    - a codon of three gaps translates to - (a deletion in the sequence)
+    - a codon with one or two gaps (a frameshift or a partial sequence) translates to X
+    - any other character counts as N
+
+"""
+
+import functools
+
+import numpy
+
+# the bits of A, C, G and T in the IUPAC nucleotide masks
+NUCLEOTIDE_BITS = {"A": 1, "C": 2, "G": 4, "T": 8}
+
+IUPAC_CODES = {"A": "A", "C": "C", "G": "G", "T": "T", "U": "T", "R": "AG", "Y": "CT", "S": "CG", "W": "AT",
+               "K": "GT", "M": "AC", "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"}
+
+GAP_CHARACTERS = "-."
+
+GAP_RESIDUE = "-"
+
+UNKNOWN_RESIDUE = "X"
+
+
+def _base_masks() -> numpy.ndarray:
+
+    # every byte not named below reads as N
+    masks = numpy.full(256, 15, dtype=numpy.uint16)
+
+    for code, bases in IUPAC_CODES.items():
+        mask = sum(NUCLEOTIDE_BITS[base] for base in bases)
+        masks[ord(code)] = masks[ord(code.lower())] = mask
+
+    for gap in GAP_CHARACTERS:
+        masks[ord(gap)] = 0
+
+    return masks
+
+
+# the nucleotide mask (0 for a gap) of every byte
+BASE_MASKS = _base_masks()
+
+
+@functools.lru_cache(maxsize=None)
+def codon_table(table_id: int = 1) -> numpy.ndarray:
+    """
+    The amino acid (as a byte) of every codon of nucleotide masks, indexed by mask1 << 8 | mask2 << 4 | mask3.
+
+    Parameters
+    ----------
+    table_id : int
+        The NCBI genetic code; 1 is the standard code
+    """
+
+    from itertools import product
+
+    from Bio.Data import CodonTable
+
+    genetic_code = CodonTable.unambiguous_dna_by_id[table_id]
+    amino_acids = dict(genetic_code.forward_table, **{codon: "*" for codon in genetic_code.stop_codons})
+
+    bases_of_mask = {mask: [base for base, bit in NUCLEOTIDE_BITS.items() if mask & bit] for mask in range(16)}
+
+    table = numpy.empty(16 ** 3, dtype=numpy.uint8)
+
+    for masks in product(range(16), repeat=3):
+
+        index = masks[0] << 8 | masks[1] << 4 | masks[2]
+
+        if not any(masks):
+            table[index] = ord(GAP_RESIDUE)
+            continue
+
+        if not all(masks):
+            table[index] = ord(UNKNOWN_RESIDUE)
+            continue
+
+        translations = {amino_acids["".join(codon)] for codon in product(*(bases_of_mask[mask] for mask in masks))}
+
+        table[index] = ord(translations.pop() if len(translations) == 1 else UNKNOWN_RESIDUE)
+
+    return table
+
+
+def translate_codons(codons: numpy.ndarray, table_id: int = 1) -> numpy.ndarray:
+    """
+    Translates an array of codons.
+
+    Parameters
+    ----------
+    codons : numpy.ndarray
+        A uint8 array of nucleotides whose last axis holds the three bases of a codon
+
+    table_id : int
+        The NCBI genetic code
+
+    Returns
+    -------
+    A uint8 array of amino acids, the shape of codons without the last axis
+    """
+
+    masks = BASE_MASKS[numpy.asarray(codons, dtype=numpy.uint8)]
+
+    return codon_table(table_id)[masks[..., 0] << 8 | masks[..., 1] << 4 | masks[..., 2]]
+
+
+def translate_reference(reference_sequence: str, cds_start: int, table_id: int = 1) -> str:
+    """
+    The protein of the reference sequence: its ungapped sequence translated from cds_start to the last whole codon.
+
+    Parameters
+    ----------
+    reference_sequence : string
+        The reference sequence as found in the alignment
+
+    cds_start : int
+        The ungapped reference position (1-based) of the first base of the coding sequence
+
+    table_id : int
+        The NCBI genetic code
+    """
+
+    cds = reference_sequence.replace("-", "").replace(".", "")[cds_start - 1:]
+    cds = cds[:len(cds) - len(cds) % 3]
+
+    codons = numpy.frombuffer(cds.encode("ascii"), dtype=numpy.uint8).reshape(-1, 3)
+
+    return translate_codons(codons, table_id).tobytes().decode("ascii")
+
+
+def codon_columns(coordinate_map, protein_positions: list, cds_start: int) -> numpy.ndarray:
+    """
+    The alignment columns (0-based) of the codon of every protein position.
+
+    Parameters
+    ----------
+    coordinate_map : CoordinateMap
+        The coordinate map of the reference sequence
+
+    protein_positions : list
+        The protein positions (1-based) of the sequence feature
+
+    cds_start : int
+        The ungapped reference position (1-based) of the first base of the coding sequence
+
+    Returns
+    -------
+    A (positions x 3) array of column indices
+
+    Raises
+    ------
+    ValueError
+        If a codon does not lie within the reference sequence
+    """
+
+    protein_positions = numpy.asarray(protein_positions, dtype=numpy.intp)
+
+    if cds_start < 1:
+        raise ValueError("The coding sequence must start at a positive reference position, not {}".format(cds_start))
+
+    if (protein_positions < 1).any():
+        raise ValueError("Protein positions start at 1: {}".format(int(protein_positions.min())))
+
+    nucleotide_positions = cds_start + 3 * (protein_positions[:, None] - 1) + numpy.arange(3)
+
+    # the same 0-based columns the nucleotide features are read at (see FeaVar.feature_columns)
+    try:
+        columns = coordinate_map.to_columns(nucleotide_positions.ravel())
+    except KeyError as err:
+        raise ValueError("The codon of protein position {} lies beyond the reference sequence".format(
+            (err.args[0] - cds_start) // 3 + 1))
+
+    return columns.reshape(-1, 3)
+
+
+def codon_variant_types(alignment_matrix, columns, table_id: int = 1):
+    """
+    Groups the sequences by the amino acids their codons at the sequence feature translate to.
+
+    Parameters
+    ----------
+    alignment_matrix : AlignmentMatrix
+        The nucleotide alignment
+
+    columns :
+        The codon columns (see codon_columns), as a (positions x 3) array or flattened
+
+    table_id : int
+        The NCBI genetic code
+
+    Returns
+    -------
+    A tuple of the distinct variant types (as amino acid strings), the index of the variant type of every
+    sequence and the number of sequences per variant type (see group_feature_rows).
+    """
+
+    try:
+        from FeaVar.alignment_matrix import group_feature_rows
+    except ImportError:  # run as a script from inside the package directory
+        from alignment_matrix import group_feature_rows
+
+    columns = numpy.asarray(columns, dtype=numpy.intp).ravel()
+
+    if len(columns) % 3:
+        raise ValueError("Codon columns come in threes, not {}".format(len(columns)))
+
+    codons = alignment_matrix.feature_matrix(columns).reshape(len(alignment_matrix), -1, 3)
+
+    return group_feature_rows(translate_codons(codons, table_id))
@@ -0,0 +1,235 @@
+"""
+FeaVar columnar output
+
+This module writes the tables of a run into one compressed columnar dataset (Parquet or Feather)
+instead of a set of full-size CSV files. The dataset is a directory with one sub-directory per
+table; every table is partitioned by sequence feature, so a features file run writes one
+partition per feature:
+
+    feavar_dataset/
+        assignments/feature=HA_epitope_1/part-0.parquet     accession, variant_type, VT
+        assignments/feature=HA_epitope_2/part-0.parquet
+        variant_types/feature=HA_epitope_1/part-0.parquet   variant_type, count, VT
+        ...
+
+The variant_type and VT columns are stored as categoricals, so a million sequences of a few
+hundred variant types take a few MB. The derived metadata tables (all_data, top, ...) are only
+written when asked for. Parquet partitions use hive naming and read back with
+pandas.read_parquet("feavar_dataset/assignments"); read_table reads either format.
+
+Writing requires pyarrow.
+
+"""
+
+import os
+import shutil
+from urllib.parse import quote, unquote
+
+DATASET_NAME = "feavar_dataset"
+
+OUTPUT_FORMATS = ["csv", "parquet", "feather"]
+
+# the derived tables that are only written when requested
+DERIVED_TABLES = ["metadata", "all_data", "all_data_with_variant_type", "top", "by_field"]
+
+_EXTENSIONS = {"parquet": ".parquet", "feather": ".feather"}
+
+
+def require_pyarrow():
+    """
+    Raises an ImportError with installation advice if pyarrow is not installed.
+    """
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Parquet and Feather output need pyarrow: pip install pyarrow") from None
+
+
+def positions_label(positions: list) -> str:
+    """
+    A compact label of a list of positions, runs of consecutive positions as ranges ([1, 2, 3, 7] -> "1-3_7").
+    """
+
+    runs = []
+
+    for position in sorted(int(position) for position in positions):
+
+        if runs and position == runs[-1][1] + 1:
+            runs[-1][1] = position
+        else:
+            runs.append([position, position])
+
+    return "_".join(str(first) if first == last else "{}-{}".format(first, last) for first, last in runs)
+
+
+def categorical_variant_types(df):
+    """
+    Returns a copy of a table with its variant_type and VT columns (where present) as categoricals;
+    the VT categories are ordered by VT id.
+
+    Parameters
+    ----------
+    df : dataframe
+        A FeaVar table
+    """
+
+    import pandas
+
+    df = df.copy()
+
+    if "variant_type" in df.columns:
+        df["variant_type"] = df["variant_type"].astype("category")
+
+    if "VT" in df.columns:
+        df["VT"] = pandas.Categorical(df["VT"], categories=sorted(df["VT"].dropna().unique()), ordered=True)
+
+    return df
+
+
+def assignment_table(df_starter, df_by_variant_type):
+    """
+    The accession to variant type assignments with the VT id of every sequence, as categoricals.
+
+    Parameters
+    ----------
+    df_starter : dataframe
+        The accession, variant_type table of the run
+
+    df_by_variant_type : dataframe
+        The variant type count table of the run (variant_type, count, VT)
+    """
+
+    vt_ids = dict(zip(df_by_variant_type["variant_type"], df_by_variant_type["VT"]))
+
+    df = df_starter[["accession", "variant_type"]].reset_index(drop=True)
+    df["VT"] = df["variant_type"].map(vt_ids)
+
+    return categorical_variant_types(df)
+
+
+def table_path(dataset_dir: str, table: str, output_format: str, feature: str = None) -> str:
+    """
+    The file path of one table (partition) of a dataset.
+
+    Parameters
+    ----------
+    dataset_dir : string
+        The directory of the dataset
+
+    table : string
+        The table name
+
+    output_format : string
+        parquet or feather
+
+    feature : string
+        The sequence feature of the partition, or None for an unpartitioned table
+    """
+
+    extension = _EXTENSIONS[output_format]
+
+    if feature is None:
+        return os.path.join(dataset_dir, table + extension)
+
+    partition = "feature=" + quote(str(feature), safe="")
+
+    if output_format == "parquet":
+        return os.path.join(dataset_dir, table, partition, "part-0" + extension)
+
+    return os.path.join(dataset_dir, table, partition + extension)
+
+
+def write_table(df, dataset_dir: str, table: str, output_format: str, feature: str = None) -> str:
+    """
+    Writes a table (partition) into a dataset, replacing an earlier version of it; zstd compressed.
+
+    Parameters
+    ----------
+    df : dataframe
+        The table; its index is not stored
+
+    dataset_dir : string
+        The directory of the dataset, created if missing
+
+    table : string
+        The table name
+
+    output_format : string
+        parquet or feather
+
+    feature : string
+        The sequence feature the table belongs to, or None
+
+    Returns
+    -------
+    The file path written
+    """
+
+    require_pyarrow()
+
+    if output_format not in _EXTENSIONS:
+        raise ValueError("Unknown columnar output format: {}".format(output_format))
+
+    path = table_path(dataset_dir, table, output_format, feature)
+
+    if feature is not None and output_format == "parquet":
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    df = categorical_variant_types(df).reset_index(drop=True)
+    df.columns = [str(column) for column in df.columns]
+
+    if output_format == "parquet":
+        df.to_parquet(path, compression="zstd", index=False)
+    else:
+        df.to_feather(path, compression="zstd")
+
+    return path
+
+
+def read_table(dataset_dir: str, table: str, output_format: str):
+    """
+    Reads a table of a dataset; a partitioned table gets a feature column.
+
+    Parameters
+    ----------
+    dataset_dir : string
+        The directory of the dataset
+
+    table : string
+        The table name
+
+    output_format : string
+        parquet or feather
+    """
+
+    import pandas
+
+    single_path = table_path(dataset_dir, table, output_format)
+
+    if os.path.exists(single_path):
+        return pandas.read_parquet(single_path) if output_format == "parquet" else pandas.read_feather(single_path)
+
+    table_dir = os.path.join(dataset_dir, table)
+
+    if output_format == "parquet":
+        return pandas.read_parquet(table_dir)
+
+    extension = _EXTENSIONS[output_format]
+    partitions = []
+
+    for file_name in sorted(os.listdir(table_dir)):
+
+        if not file_name.startswith("feature=") or not file_name.endswith(extension):
+            continue
+
+        partition = pandas.read_feather(os.path.join(table_dir, file_name))
+        partition["feature"] = unquote(file_name[len("feature="):-len(extension)])
+        partitions.append(partition)
+
+    df = pandas.concat(partitions, ignore_index=True)
+    df["feature"] = df["feature"].astype("category")
+
+    return df
@@ -0,0 +1,156 @@
+"""
+FeaVar coordinate map
+
+This module maps between positions in the ungapped reference sequence and positions (columns)
+of the alignment. The map is built once per reference with prefix sums over the gap mask and
+answers lookups for whole arrays of positions at once, in both directions.
+
+All positions are 1-based, like the sequence feature positions given by the user; to_columns
+gives the 0-based alignment column indices every extraction engine reads.
+
+"""
+
+import numpy
+
+GAP = ord("-")
+
+
+class CoordinateMap:
+    """
+    The mapping between ungapped reference positions and aligned positions of one reference sequence.
+
+    Parameters
+    ----------
+    ref_seq : string
+        The reference sequence as found in the alignment, with insertion dashes
+    """
+
+    def __init__(self, ref_seq: str):
+
+        residues = numpy.frombuffer(ref_seq.encode("ascii"), dtype=numpy.uint8)
+
+        self.gap_mask = residues == GAP
+
+        # aligned position of every reference residue: index i holds the column of ungapped position i + 1
+        self.aligned_positions = numpy.flatnonzero(~self.gap_mask) + 1
+
+        # number of reference residues up to and including every column (ungapped position, if not a gap)
+        self.residue_counts = numpy.cumsum(~self.gap_mask)
+
+    def __len__(self) -> int:
+        """
+        The length of the ungapped reference sequence.
+        """
+
+        return len(self.aligned_positions)
+
+    @property
+    def alignment_length(self) -> int:
+
+        return len(self.gap_mask)
+
+    def gap_offsets(self) -> numpy.ndarray:
+        """
+        The number of reference gaps up to and including every column (see create_index_offset_list).
+        """
+
+        return numpy.cumsum(self.gap_mask)
+
+    def to_aligned(self, positions) -> numpy.ndarray:
+        """
+        Maps ungapped reference positions to aligned positions.
+
+        Parameters
+        ----------
+        positions :
+            Ungapped reference positions (1-based)
+
+        Raises
+        ------
+        KeyError if a position is not in the reference sequence
+        """
+
+        positions = numpy.asarray(positions, dtype=numpy.intp)
+
+        outside = (positions < 1) | (positions > len(self))
+        if outside.any():
+            raise KeyError(int(positions[outside][0]))
+
+        return self.aligned_positions[positions - 1]
+
+    def to_columns(self, positions) -> numpy.ndarray:
+        """
+        Maps ungapped reference positions to the alignment columns (0-based indices) holding their residues.
+
+        Parameters
+        ----------
+        positions :
+            Ungapped reference positions (1-based)
+
+        Raises
+        ------
+        KeyError if a position is not in the reference sequence
+        """
+
+        return self.to_aligned(positions) - 1
+
+    def to_ungapped(self, aligned_positions) -> numpy.ndarray:
+        """
+        Maps aligned positions to ungapped reference positions; columns where the reference has a gap map to 0.
+
+        Parameters
+        ----------
+        aligned_positions :
+            Aligned positions (1-based)
+
+        Raises
+        ------
+        KeyError if a position is not in the alignment
+        """
+
+        aligned_positions = numpy.asarray(aligned_positions, dtype=numpy.intp)
+
+        outside = (aligned_positions < 1) | (aligned_positions > self.alignment_length)
+        if outside.any():
+            raise KeyError(int(aligned_positions[outside][0]))
+
+        columns = aligned_positions - 1
+
+        return numpy.where(self.gap_mask[columns], 0, self.residue_counts[columns])
+
+    def is_gap(self, aligned_positions) -> numpy.ndarray:
+        """
+        Tests which aligned positions (1-based) are gaps in the reference sequence.
+        """
+
+        return self.gap_mask[numpy.asarray(aligned_positions, dtype=numpy.intp) - 1]
+
+    def aligned_range(self, start: int, stop: int) -> tuple:
+        """
+        The first and last aligned position spanned by the ungapped reference range start..stop (inclusive).
+        """
+
+        first, last = self.to_aligned([start, stop])
+
+        return int(first), int(last)
+
+    def ungapped_range(self, aligned_start: int, aligned_stop: int) -> tuple:
+        """
+        The first and last ungapped reference position within the aligned range aligned_start..aligned_stop
+        (inclusive), or None if the reference only has gaps there.
+        """
+
+        first = int(numpy.searchsorted(self.aligned_positions, aligned_start, side="left"))
+        last = int(numpy.searchsorted(self.aligned_positions, aligned_stop, side="right"))
+
+        if first >= last:
+            return None
+
+        return first + 1, last
+
+    def as_dict(self) -> dict:
+        """
+        The mapping as a dictionary of ungapped positions to aligned positions (see correct_index_dict).
+        """
+
+        return dict(zip(range(1, len(self) + 1), self.aligned_positions.tolist()))
@@ -0,0 +1,340 @@
+"""
+FeaVar epitope notation
+
+This module parses sequence features written in the native IEDB notation and validates the
+residues they name against the reference sequence.
+
+An epitope is a list of comma separated residues, each an optional one letter residue code and a
+position in the ungapped reference sequence; ranges of positions and plain numbers are accepted
+too. Residues of other chains are preceded by the chain identifier and a colon; a chain applies
+to every following residue, and chain groups are usually separated by semicolons:
+
+    H25, H45, V46, N47, L496, S306, L307, P308, T333; B: D363, G364, W365
+    A:H25, A:H45, B:D363
+    100-110, 120
+
+Validation looks up every residue of every epitope in one vectorized pass over numpy arrays, so
+thousands of epitopes exported from IEDB are checked in well under a second. Parsing needs only
+the standard library (numpy and pandas are imported by validation), so the command line can check
+feature definitions without paying for them.
+
+"""
+
+import collections
+import re
+
+EpitopeResidue = collections.namedtuple("EpitopeResidue", ["chain", "residue", "position"])
+EpitopeResidue.__doc__ = """
+One residue of an epitope: the chain identifier ('' if not given), the expected one letter
+residue code ('' if not given) and the 1-based position in the ungapped reference sequence.
+"""
+
+_CHAIN = re.compile(r"^\s*([A-Za-z0-9]+)\s*:\s*")
+_RESIDUE = re.compile(r"^\s*([A-Za-z*]?)\s*(\d+)\s*(?:-\s*([A-Za-z*]?)\s*(\d+)\s*)?$")
+
+GAP = ord("-")
+
+
+def parse_epitope(epitope: str) -> list:
+    """
+    Parses an epitope in IEDB notation.
+
+    Parameters
+    ----------
+    epitope : string
+        The epitope, e.g. "H25, H45, V46; B: D363, G364"
+
+    Returns
+    -------
+    A list of EpitopeResidue, in the order given; ranges are expanded to every position
+
+    Raises
+    ------
+    ValueError if a residue can not be parsed
+    """
+
+    residues = []
+    chain = ""
+
+    for group in epitope.split(";"):
+
+        for token in group.split(","):
+
+            if not token.strip():
+                continue
+
+            chain_match = _CHAIN.match(token)
+
+            if chain_match:
+                chain = chain_match.group(1)
+                token = token[chain_match.end():]
+
+            residue_match = _RESIDUE.match(token)
+
+            if residue_match is None:
+                raise ValueError("Can not parse epitope residue '{}' in: {}".format(token.strip(), epitope))
+
+            first_residue, first, last_residue, last = residue_match.groups()
+
+            if last is None:
+                residues.append(EpitopeResidue(chain, first_residue.upper(), int(first)))
+                continue
+
+            first, last = int(first), int(last)
+
+            if last < first:
+                raise ValueError("Descending range '{}' in: {}".format(token.strip(), epitope))
+
+            residues.append(EpitopeResidue(chain, first_residue.upper(), first))
+            residues.extend(EpitopeResidue(chain, "", position) for position in range(first + 1, last))
+            residues.append(EpitopeResidue(chain, last_residue.upper(), last))
+
+    return residues
+
+
+def epitope_chains(residues: list) -> list:
+    """
+    The chain identifiers of a parsed epitope, in order of appearance.
+    """
+
+    return list(dict.fromkeys(residue.chain for residue in residues))
+
+
+def _residue_codes(residues):
+
+    import numpy
+
+    return numpy.frombuffer("".join(residue or "\0" for residue in residues).encode("ascii"), dtype=numpy.uint8)
+
+
+def validate_epitopes(reference_sequences, epitopes: dict):
+    """
+    Validates many epitopes against the reference sequence(s) in one pass.
+
+    Every residue position must lie within the ungapped reference sequence of its chain and,
+    when the epitope names the residue, the reference must have that residue there.
+
+    Parameters
+    ----------
+    reference_sequences :
+        The reference sequence as found in the alignment (gaps are ignored), or a dictionary of
+        chain identifiers to reference sequences for multi-chain epitopes (residues without a
+        chain identifier are checked against the first one)
+
+    epitopes : dict
+        Epitope identifiers to epitopes, either in IEDB notation or already parsed (see parse_epitope)
+
+    Returns
+    -------
+    A dataframe indexed by epitope identifier with the number of residues, residues outside the
+    reference, residues differing from the reference, residues of chains without a reference,
+    whether the epitope is valid and a human readable diagnostic
+    """
+
+    import numpy
+    import pandas
+
+    if isinstance(reference_sequences, str):
+        reference_sequences = {None: reference_sequences}
+
+    epitope_ids = list(epitopes)
+
+    parsed = []
+    parse_errors = {}
+
+    for epitope_id in epitope_ids:
+
+        epitope = epitopes[epitope_id]
+
+        if isinstance(epitope, str):
+            try:
+                epitope = parse_epitope(epitope)
+            except ValueError as error:
+                parse_errors[epitope_id] = str(error)
+                epitope = []
+
+        parsed.append(epitope)
+
+    # flatten the residues of every epitope into parallel arrays
+    flat = [residue for epitope in parsed for residue in epitope]
+
+    owner = numpy.repeat(numpy.arange(len(parsed)), [len(epitope) for epitope in parsed])
+    chains = [residue.chain for residue in flat]
+    expected = _residue_codes([residue.residue for residue in flat])
+    positions = numpy.fromiter((residue.position for residue in flat), dtype=numpy.int64, count=len(flat))
+
+    observed = numpy.zeros(len(owner), dtype=numpy.uint8)
+    unknown_chain = numpy.ones(len(owner), dtype=bool)
+    outside = numpy.zeros(len(owner), dtype=bool)
+
+    chain_array = numpy.asarray(chains, dtype=object)
+
+    for chain in set(chains):
+
+        reference_sequence = reference_sequences.get(chain, reference_sequences.get(None))
+
+        # residues before the first chain label belong to the first chain
+        if reference_sequence is None and chain == "" and reference_sequences:
+            reference_sequence = next(iter(reference_sequences.values()))
+
+        if reference_sequence is None:
+            continue
+
+        in_chain = chain_array == chain
+        unknown_chain[in_chain] = False
+
+        ungapped = numpy.frombuffer(reference_sequence.upper().encode("ascii"), dtype=numpy.uint8)
+        ungapped = ungapped[ungapped != GAP]
+
+        chain_positions = positions[in_chain]
+        chain_outside = (chain_positions < 1) | (chain_positions > len(ungapped))
+        outside[in_chain] = chain_outside
+
+        chain_observed = numpy.zeros(len(chain_positions), dtype=numpy.uint8)
+        chain_observed[~chain_outside] = ungapped[chain_positions[~chain_outside] - 1]
+        observed[in_chain] = chain_observed
+
+    outside &= ~unknown_chain
+    mismatch = (expected != 0) & ~outside & ~unknown_chain & (expected != observed)
+
+    def per_epitope(mask):
+        return numpy.bincount(owner[mask], minlength=len(parsed))
+
+    n_residues = numpy.bincount(owner, minlength=len(parsed))
+    n_outside = per_epitope(outside)
+    n_mismatch = per_epitope(mismatch)
+    n_unknown_chain = per_epitope(unknown_chain)
+
+    # diagnostics are only written out for the residues that failed
+    diagnostics = collections.defaultdict(list)
+
+    for index in numpy.flatnonzero(outside | mismatch | unknown_chain):
+
+        residue = flat[index]
+        label = "{}{}{}".format(residue.chain + ":" if residue.chain else "", residue.residue, residue.position)
+
+        if unknown_chain[index]:
+            diagnostics[owner[index]].append("{} no reference for chain {}".format(label, residue.chain))
+        elif outside[index]:
+            diagnostics[owner[index]].append("{} outside the reference".format(label))
+        else:
+            diagnostics[owner[index]].append("{} reference has {}".format(label, chr(observed[index])))
+
+    for index, epitope_id in enumerate(epitope_ids):
+        if epitope_id in parse_errors:
+            diagnostics[index].append(parse_errors[epitope_id])
+
+    valid = (n_residues > 0) & (n_outside == 0) & (n_mismatch == 0) & (n_unknown_chain == 0)
+    valid &= numpy.array([epitope_id not in parse_errors for epitope_id in epitope_ids], dtype=bool)
+
+    return pandas.DataFrame({"residues": n_residues,
+                             "outside_reference": n_outside,
+                             "mismatches": n_mismatch,
+                             "unknown_chain": n_unknown_chain,
+                             "valid": valid,
+                             "diagnostic": ["; ".join(diagnostics[index]) for index in range(len(parsed))]},
+                            index=pandas.Index(epitope_ids, name="epitope"))
+
+
+def validate_epitope(reference_sequence: str, epitope) -> dict:
+    """
+    Validates one epitope against the reference sequence (see validate_epitopes).
+
+    Parameters
+    ----------
+    reference_sequence : string
+        The reference sequence as found in the alignment
+
+    epitope :
+        The epitope in IEDB notation or parsed
+
+    Returns
+    -------
+    A dictionary of the validation counts, valid and diagnostic of the epitope
+    """
+
+    return validate_epitopes(reference_sequence, {"epitope": epitope}).iloc[0].to_dict()
+
+
+def read_iedb_epitopes(file_path: str, description_column: str = "Description", id_column: str = None) -> dict:
+    """
+    Reads the epitopes of an IEDB epitope export (CSV).
+
+    IEDB exports carry a two line header (the record type above the field name); both that and
+    a plain one line header are accepted.
+
+    Parameters
+    ----------
+    file_path : string
+        The file path of the export
+
+    description_column : string
+        The column holding the epitope residues
+
+    id_column : string
+        The column holding the epitope identifier; default is the row number
+
+    Returns
+    -------
+    A dictionary of epitope identifiers to epitopes in IEDB notation, in file order
+    """
+
+    import pandas
+
+    table = pandas.read_csv(file_path, dtype=str)
+
+    if description_column not in table.columns:
+
+        # two line header: the field names are the first data row
+        table.columns = table.iloc[0].tolist()
+        table = table.iloc[1:].reset_index(drop=True)
+
+    if description_column not in table.columns:
+        raise ValueError("No {} column in {}".format(description_column, file_path))
+
+    descriptions = table[description_column].fillna("")
+    identifiers = table[id_column] if id_column is not None else table.index
+
+    return dict(zip(identifiers, descriptions))
+
+
+def read_features_file(features_file_path: str) -> dict:
+    """
+    Reads a file of sequence features, one feature per line: a name, a tab (or spaces) and the positions.
+    The positions use the --positions syntax ("100-110,120") or native IEDB style ("H25, H45, V46").
+    Blank lines and lines starting with # are skipped.
+
+    Parameters
+    ----------
+    features_file_path : string
+        The file path of the features file
+
+    Returns
+    -------
+    A dictionary of feature names to their raw (unparsed) positions, in file order
+    """
+
+    features = {}
+
+    with open(features_file_path) as features_file:
+
+        for line_number, line in enumerate(features_file, 1):
+
+            line = line.strip()
+
+            if not line or line.startswith("#"):
+                continue
+
+            name, _, raw_positions = line.partition("\t") if "\t" in line else line.partition(" ")
+
+            name, raw_positions = name.strip(), raw_positions.strip()
+
+            if not raw_positions:
+                raise ValueError("No positions for feature on line {}: {}".format(line_number, line))
+
+            if name in features:
+                raise ValueError("Duplicate feature name on line {}: {}".format(line_number, name))
+
+            features[name] = raw_positions
+
+    return features
@@ -0,0 +1,255 @@
+"""
+FeaVar binary alignment cache (.fvaln)
+
+This module converts a text alignment (clustal, fasta, ...) once into a compact binary
+file that later runs memory map instead of re-parsing the text.
+
+Layout of a .fvaln file (all integers little endian):
+
+    header         128 bytes, see HEADER below
+    residues       alignment_length x n_sequences uint8, stored column by column so the
+                   columns of a sequence feature are contiguous on disk
+    id offsets     (n_sequences + 1) uint64 offsets into the id blob
+    id blob        the utf-8 encoded sequence identifiers, back to back
+
+The header holds the sha256 checksum of the residues and the id blob, and the size and
+modification time of the text alignment it was converted from.
+
+"""
+
+import hashlib
+import os
+import struct
+
+import numpy
+
+try:
+    from FeaVar.alignment_matrix import AlignmentMatrix, as_alignment_matrix
+except ImportError:  # run as a script from inside the package directory
+    from alignment_matrix import AlignmentMatrix, as_alignment_matrix
+
+MAGIC = b"FVALN\x00"
+VERSION = 1
+EXTENSION = ".fvaln"
+
+# magic, version, n_sequences, alignment_length, residues_offset, ids_offset,
+# source_size, source_mtime_ns, sha256 checksum
+HEADER = struct.Struct("<6sHQQQQQq32s")
+HEADER_SIZE = 128
+
+# number of sequences transposed and written per block while converting
+_BLOCK_ROWS = 65536
+
+
+def fvaln_path_for(alignment_file_path: str) -> str:
+    """
+    The default binary cache path of a text alignment (the alignment path plus .fvaln).
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the text alignment
+    """
+
+    return alignment_file_path + EXTENSION
+
+
+def write_fvaln(alignment, fvaln_file_path: str, source_file_path: str = None) -> str:
+    """
+    Write a loaded alignment to a .fvaln binary file.
+
+    Parameters
+    ----------
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    fvaln_file_path : string
+        The file path of the binary file to write
+
+    source_file_path : string
+        The text alignment the binary file is converted from, recorded to detect stale caches
+    """
+
+    alignment_matrix = as_alignment_matrix(alignment)
+    n_sequences, alignment_length = alignment_matrix.matrix.shape
+
+    encoded_ids = [sequence_id.encode("utf-8") for sequence_id in alignment_matrix.ids]
+    id_offsets = numpy.zeros(n_sequences + 1, dtype="<u8")
+    numpy.cumsum([len(encoded_id) for encoded_id in encoded_ids], out=id_offsets[1:])
+    id_blob = b"".join(encoded_ids)
+
+    ids_offset = HEADER_SIZE + n_sequences * alignment_length
+
+    source_size, source_mtime_ns = 0, 0
+    if source_file_path is not None:
+        source_stat = os.stat(source_file_path)
+        source_size, source_mtime_ns = source_stat.st_size, source_stat.st_mtime_ns
+
+    checksum = hashlib.sha256()
+    temp_file_path = fvaln_file_path + ".tmp"
+
+    with open(temp_file_path, "wb") as fvaln_file:
+
+        fvaln_file.write(b"\x00" * HEADER_SIZE)
+
+        # write column by column; transpose a block of rows at a time to bound memory
+        if n_sequences and alignment_length:
+
+            fvaln_file.truncate(ids_offset)
+            residues = numpy.memmap(temp_file_path, dtype=numpy.uint8, mode="r+",
+                                    offset=HEADER_SIZE, shape=(alignment_length, n_sequences))
+
+            for start in range(0, n_sequences, _BLOCK_ROWS):
+                stop = min(start + _BLOCK_ROWS, n_sequences)
+                residues[:, start:stop] = alignment_matrix.matrix[start:stop].T
+
+            residues.flush()
+            checksum.update(memoryview(residues).cast("B"))
+            del residues
+
+        fvaln_file.seek(ids_offset)
+        fvaln_file.write(id_offsets.tobytes())
+        fvaln_file.write(id_blob)
+        checksum.update(id_blob)
+
+        fvaln_file.seek(0)
+        fvaln_file.write(HEADER.pack(MAGIC, VERSION, n_sequences, alignment_length, HEADER_SIZE, ids_offset,
+                                     source_size, source_mtime_ns, checksum.digest()))
+
+    os.replace(temp_file_path, fvaln_file_path)
+
+    return fvaln_file_path
+
+
+def read_fvaln_header(fvaln_file_path: str) -> dict:
+    """
+    Read and check the header of a .fvaln binary file.
+
+    Parameters
+    ----------
+    fvaln_file_path : string
+        The file path of the binary file
+    """
+
+    with open(fvaln_file_path, "rb") as fvaln_file:
+        raw_header = fvaln_file.read(HEADER.size)
+
+    if len(raw_header) < HEADER.size:
+        raise ValueError("Not a FeaVar binary alignment: {}".format(fvaln_file_path))
+
+    (magic, version, n_sequences, alignment_length, residues_offset, ids_offset,
+     source_size, source_mtime_ns, checksum) = HEADER.unpack(raw_header)
+
+    if magic != MAGIC:
+        raise ValueError("Not a FeaVar binary alignment: {}".format(fvaln_file_path))
+
+    if version != VERSION:
+        raise ValueError("Unsupported FeaVar binary alignment version {}: {}".format(version, fvaln_file_path))
+
+    return {"n_sequences": n_sequences,
+            "alignment_length": alignment_length,
+            "residues_offset": residues_offset,
+            "ids_offset": ids_offset,
+            "source_size": source_size,
+            "source_mtime_ns": source_mtime_ns,
+            "checksum": checksum.hex()}
+
+
+def load_fvaln(fvaln_file_path: str, verify: bool = False) -> AlignmentMatrix:
+    """
+    Memory map a .fvaln binary file as an AlignmentMatrix.
+
+    Only the identifiers are read up front; residues are paged in from disk as columns are sliced.
+
+    Parameters
+    ----------
+    fvaln_file_path : string
+        The file path of the binary file
+
+    verify : bool
+        Re-compute the checksum (reads the whole file) and raise ValueError if it does not match
+    """
+
+    header = read_fvaln_header(fvaln_file_path)
+    n_sequences, alignment_length = header["n_sequences"], header["alignment_length"]
+
+    with open(fvaln_file_path, "rb") as fvaln_file:
+        fvaln_file.seek(header["ids_offset"])
+        id_offsets = numpy.frombuffer(fvaln_file.read(8 * (n_sequences + 1)), dtype="<u8")
+        id_blob = fvaln_file.read()
+
+    if len(id_offsets) != n_sequences + 1 or len(id_blob) != int(id_offsets[-1]):
+        raise ValueError("Truncated FeaVar binary alignment: {}".format(fvaln_file_path))
+
+    if n_sequences and alignment_length:
+        residues = numpy.memmap(fvaln_file_path, dtype=numpy.uint8, mode="r",
+                                offset=header["residues_offset"], shape=(alignment_length, n_sequences))
+    else:
+        residues = numpy.empty((alignment_length, n_sequences), dtype=numpy.uint8)
+
+    if verify:
+        checksum = hashlib.sha256()
+        if residues.size:
+            checksum.update(memoryview(numpy.ascontiguousarray(residues)).cast("B"))
+        checksum.update(id_blob)
+
+        if checksum.hexdigest() != header["checksum"]:
+            raise ValueError("Checksum mismatch in FeaVar binary alignment: {}".format(fvaln_file_path))
+
+    id_bounds = id_offsets.tolist()
+    ids = [id_blob[start:stop].decode("utf-8") for start, stop in zip(id_bounds[:-1], id_bounds[1:])]
+
+    # residues are stored column major; the transpose is a (sequences x columns) view without a copy
+    return AlignmentMatrix(ids, residues.T)
+
+
+def fvaln_is_current(fvaln_file_path: str, source_file_path: str) -> bool:
+    """
+    Tests whether a .fvaln binary file exists and was converted from the current version of a text alignment.
+
+    Parameters
+    ----------
+    fvaln_file_path : string
+        The file path of the binary file
+
+    source_file_path : string
+        The file path of the text alignment
+    """
+
+    if not os.path.exists(fvaln_file_path):
+        return False
+
+    try:
+        header = read_fvaln_header(fvaln_file_path)
+    except ValueError:
+        return False
+
+    source_stat = os.stat(source_file_path)
+
+    return header["source_size"] == source_stat.st_size and header["source_mtime_ns"] == source_stat.st_mtime_ns
+
+
+def convert_alignment(alignment_file_path: str, alignment_format: str = "clustal", fvaln_file_path: str = None) -> str:
+    """
+    Parse a text alignment and convert it to a .fvaln binary file.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the text alignment
+
+    alignment_format : string
+        The format of the text alignment, default is clustal
+
+    fvaln_file_path : string
+        The file path of the binary file; defaults to the alignment path plus .fvaln
+    """
+
+    from Bio import AlignIO
+
+    if fvaln_file_path is None:
+        fvaln_file_path = fvaln_path_for(alignment_file_path)
+
+    alignment = AlignIO.read(alignment_file_path, alignment_format)
+
+    return write_fvaln(alignment, fvaln_file_path, source_file_path=alignment_file_path)
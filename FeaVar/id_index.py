@@ -0,0 +1,172 @@
+"""
+FeaVar sequence identifier index
+
+This module indexes the sequence identifiers of an alignment once so reference identifiers resolve
+with dictionary lookups instead of a substring test against every record.
+
+Identifiers are matched in tiers, and the first tier with a hit wins:
+
+    exact       the whole sequence identifier                     gb:CY021716
+    accession   one '|' separated token, with or without a        CY021716 in gb:CY021716|Organism:...
+                database prefix such as 'gb:'
+    version     an accession ignoring its version suffix          CY021716 for CY021716.1, or the reverse
+    prefix      the start of an accession                         CY0217 for CY021716
+    substring   anywhere in the identifier (the historic rule)    2171 for gb:CY021716
+
+A tier that matches more than one sequence is ambiguous; the lookup reports every candidate
+instead of silently picking one.
+
+"""
+
+import bisect
+import collections
+import re
+
+_VERSION_SUFFIX = re.compile(r"\.\d+$")
+
+MATCH_TIERS = ["exact", "accession", "version", "prefix", "substring"]
+
+ReferenceMatch = collections.namedtuple("ReferenceMatch", ["row", "sequence_id", "match", "candidates"])
+ReferenceMatch.__doc__ = """
+The result of a reference identifier lookup: the row and identifier of the matched sequence
+(None when not found or ambiguous), the tier that matched and the identifiers of every
+candidate of that tier.
+"""
+
+
+def accession_tokens(sequence_id: str) -> set:
+    """
+    The accessions contained in a sequence identifier: every '|' separated token, and the
+    token without its database prefix ('gb:CY021716' -> 'CY021716').
+
+    Parameters
+    ----------
+    sequence_id : string
+        The sequence identifier
+    """
+
+    tokens = set()
+
+    for token in sequence_id.split("|"):
+
+        if not token:
+            continue
+
+        tokens.add(token)
+
+        if ":" in token:
+            tokens.add(token.rsplit(":", 1)[1])
+
+    tokens.discard("")
+
+    return tokens
+
+
+def strip_version(accession: str) -> str:
+    """
+    Removes the version suffix of an accession (CY021716.1 -> CY021716).
+    """
+
+    return _VERSION_SUFFIX.sub("", accession)
+
+
+class SequenceIdIndex:
+    """
+    An index of the sequence identifiers of one alignment.
+
+    Parameters
+    ----------
+    ids : list
+        The sequence identifiers, in alignment row order
+    """
+
+    def __init__(self, ids: list):
+
+        self.ids = ids
+
+        self._exact = collections.defaultdict(list)
+        self._accession = collections.defaultdict(set)
+        self._version = collections.defaultdict(set)
+
+        for row, sequence_id in enumerate(ids):
+
+            self._exact[sequence_id].append(row)
+
+            for token in accession_tokens(sequence_id):
+                self._accession[token].add(row)
+                self._version[strip_version(token)].add(row)
+
+        self._sorted_accessions = sorted(self._accession)
+
+    def _prefix_rows(self, identifier: str) -> set:
+
+        rows = set()
+
+        start = bisect.bisect_left(self._sorted_accessions, identifier)
+
+        for accession in self._sorted_accessions[start:]:
+
+            if not accession.startswith(identifier):
+                break
+
+            rows |= self._accession[accession]
+
+        return rows
+
+    def _tier_rows(self, identifier: str, tier: str):
+
+        if tier == "exact":
+            return set(self._exact.get(identifier, ()))
+
+        if tier == "accession":
+            return self._accession.get(identifier, set())
+
+        if tier == "version":
+            return self._version.get(strip_version(identifier), set())
+
+        if tier == "prefix":
+            return self._prefix_rows(identifier)
+
+        return {row for row, sequence_id in enumerate(self.ids) if identifier in sequence_id}
+
+    def lookup(self, identifier: str, tiers: list = None) -> ReferenceMatch:
+        """
+        Resolves a reference identifier to one alignment row.
+
+        Parameters
+        ----------
+        identifier : string
+            The identifier (accession, gid) of the reference sequence
+
+        tiers : list
+            The match tiers to try, in order; default is every tier (see MATCH_TIERS)
+
+        Returns
+        -------
+        A ReferenceMatch; row is None if nothing matched or the first matching tier is ambiguous
+        """
+
+        for tier in tiers or MATCH_TIERS:
+
+            rows = self._tier_rows(identifier, tier)
+
+            if not rows:
+                continue
+
+            candidates = [self.ids[row] for row in sorted(rows)]
+
+            if len(rows) > 1:
+                return ReferenceMatch(None, None, tier, candidates)
+
+            row = next(iter(rows))
+
+            return ReferenceMatch(row, self.ids[row], tier, candidates)
+
+        return ReferenceMatch(None, None, None, [])
+
+    def lookup_many(self, identifiers: list, tiers: list = None) -> dict:
+        """
+        Resolves many reference identifiers; returns a dictionary of identifiers to ReferenceMatch.
+        """
+
+        return {identifier: self.lookup(identifier, tiers) for identifier in identifiers}
@@ -0,0 +1,424 @@
+"""
+FeaVar incremental updates
+
+This module keeps the variant type assignments and counts of a run in a state file so a later
+run on the same alignment with sequences appended to it only types the new sequences. Variant
+type ids are stable: a variant type keeps its VT id for as long as the state file is used, new
+variant types get the next free numbers.
+
+A state file is a JSON document (the row count and digest of the typed sequences, positions,
+variant types in VT order, counts and the width of the VT numbers) with the variant type code and
+the identifier of every sequence stored next to it in .npy files. The variant type with code i is
+VT number i + 1. The width of the VT numbers is set by the run that creates the state, so VT-001
+stays VT-001 when a later run adds the 1000th variant type.
+
+An aligned FASTA file grows by appending records, so its state remembers the size and sha256
+digest of the file it typed. A later run hashes that prefix of the file, which is not parsed, and
+only reads and types the records appended after it (update_fasta_state). Other alignments are
+loaded in full; their state remembers the identifiers and the feature residues of the typed rows,
+and the feature columns are extracted once per run (update_state). Either way a realigned or
+edited alignment is typed again from scratch instead of keeping stale assignments.
+
+"""
+
+import hashlib
+import json
+import os
+
+import numpy
+
+try:
+    from FeaVar.alignment_matrix import as_alignment_matrix, group_feature_rows
+except ImportError:  # run as a script from inside the package directory
+    from alignment_matrix import as_alignment_matrix, group_feature_rows
+
+STATE_VERSION = 2
+
+# the bytes of a FASTA file hashed at a time
+_BLOCK_SIZE = 1 << 20
+
+
+def vt_width(n_variant_types: int) -> int:
+    """
+    The number of digits of the VT numbers of n variant types: at least 3 (VT-001), more past VT-999.
+    """
+
+    return max(3, len(str(n_variant_types)))
+
+
+def ids_digest(ids: list) -> str:
+    """
+    The sha256 digest of a list of sequence identifiers.
+    """
+
+    digest = hashlib.sha256()
+
+    for sequence_id in ids:
+        digest.update(sequence_id.encode("utf-8"))
+        digest.update(b"\n")
+
+    return digest.hexdigest()
+
+
+def codes_path_for(state_file_path: str) -> str:
+    """
+    The file path of the .npy file holding the per sequence variant type codes of a state file.
+    """
+
+    return os.path.splitext(state_file_path)[0] + ".codes.npy"
+
+
+def ids_path_for(state_file_path: str) -> str:
+    """
+    The file path of the .npy file holding the sequence identifiers of a state file.
+    """
+
+    return os.path.splitext(state_file_path)[0] + ".ids.npy"
+
+
+def _array_digest(array: numpy.ndarray) -> str:
+
+    return hashlib.sha256(numpy.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+def load_state(state_file_path: str):
+    """
+    Reads a state file, or returns None if there is none or it does not match its codes and identifiers.
+
+    Parameters
+    ----------
+    state_file_path : string
+        The file path of the state file
+    """
+
+    if not os.path.exists(state_file_path):
+        return None
+
+    with open(state_file_path) as state_file:
+        state = json.load(state_file)
+
+    if state.get("version") != STATE_VERSION:
+        return None
+
+    try:
+        codes = numpy.load(codes_path_for(state_file_path))
+        ids = numpy.load(ids_path_for(state_file_path))
+    except (OSError, ValueError):
+        return None
+
+    # the .npy files of another (interrupted) save
+    if state.get("codes_file_digest") != _array_digest(codes) or state.get("ids_file_digest") != _array_digest(ids):
+        return None
+
+    state["codes"] = codes
+    state["ids"] = ids.tolist()
+
+    return state
+
+
+def save_state(state_file_path: str, state: dict):
+    """
+    Writes a state file and its codes and identifiers files. Every file is written to a temporary
+    name and moved into place, the state file last, so an interrupted save leaves the previous state.
+
+    Parameters
+    ----------
+    state_file_path : string
+        The file path of the state file
+
+    state : dict
+        The state returned by update_state or update_fasta_state
+    """
+
+    codes = numpy.asarray(state["codes"], dtype=numpy.int32)
+    ids = numpy.asarray(state["ids"], dtype=str)
+
+    document = {key: value for key, value in state.items() if key not in ("codes", "ids", "n_new", "full")}
+    document["version"] = STATE_VERSION
+    document["codes_file_digest"] = _array_digest(codes)
+    document["ids_file_digest"] = _array_digest(ids)
+
+    for array, file_path in [(codes, codes_path_for(state_file_path)), (ids, ids_path_for(state_file_path))]:
+
+        # numpy.save adds .npy to a name without it
+        temp_file_path = file_path + ".tmp.npy"
+        numpy.save(temp_file_path, array)
+        os.replace(temp_file_path, file_path)
+
+    temp_file_path = state_file_path + ".tmp"
+
+    with open(temp_file_path, "w") as state_file:
+        json.dump(document, state_file)
+
+    os.replace(temp_file_path, state_file_path)
+
+
+def _new_vt_order(variant_types: list, counts) -> list:
+    """
+    Orders variant types for numbering: most sequences first, ties by variant type.
+    """
+
+    return sorted(range(len(variant_types)), key=lambda index: (-int(counts[index]), variant_types[index]))
+
+
+def _type_new_rows(state: dict, features: numpy.ndarray):
+    """
+    Types the feature residues (new sequences x feature positions) of the sequences appended since
+    the state; returns the variant types, counts and codes of every sequence.
+    """
+
+    variant_types = list(state["variant_types"])
+    counts = list(state["counts"])
+
+    new_codes = numpy.zeros(0, dtype=numpy.int32)
+
+    if len(features):
+
+        new_types, new_inverse, new_counts = group_feature_rows(features)
+
+        known = {variant_type: code for code, variant_type in enumerate(variant_types)}
+        remap = numpy.zeros(len(new_types), dtype=numpy.int32)
+
+        unseen = [index for index, variant_type in enumerate(new_types) if variant_type not in known]
+
+        for index in _new_vt_order([new_types[index] for index in unseen], [new_counts[index] for index in unseen]):
+
+            new_index = unseen[index]
+            known[new_types[new_index]] = len(variant_types)
+            variant_types.append(new_types[new_index])
+            counts.append(0)
+
+        for index, variant_type in enumerate(new_types):
+            remap[index] = known[variant_type]
+            counts[remap[index]] += int(new_counts[index])
+
+        new_codes = remap[new_inverse]
+
+    return variant_types, counts, numpy.concatenate([numpy.asarray(state["codes"], dtype=numpy.int32), new_codes])
+
+
+def _empty_state() -> dict:
+
+    return {"variant_types": [], "counts": [], "codes": numpy.zeros(0, dtype=numpy.int32), "ids": [],
+            "n_sequences": 0}
+
+
+def _updated_state(state: dict, features: numpy.ndarray, new_ids: list, alignment_length: int, positions: list,
+                   full: bool, **digests) -> dict:
+
+    variant_types, counts, codes = _type_new_rows(state, features)
+
+    # a new state sets the width by its number of variant types, later runs keep it
+    width = state.get("vt_width") or vt_width(len(variant_types))
+
+    return dict({"alignment_length": alignment_length,
+                 "positions": [int(position) for position in positions],
+                 "n_sequences": len(codes),
+                 "variant_types": variant_types,
+                 "counts": counts,
+                 "vt_width": width,
+                 "codes": codes,
+                 "ids": list(state["ids"]) + list(new_ids),
+                 "n_new": len(new_ids),
+                 "full": full}, **digests)
+
+
+def state_matches(state: dict, alignment_matrix, positions: list) -> bool:
+    """
+    Tests whether a state (of update_state) may still describe the start of the alignment: same
+    columns, same feature positions and the previously typed sequences are still the first ones, in
+    the same order. update_state also compares the feature residues of those sequences.
+
+    Parameters
+    ----------
+    state : dict
+        The state of the previous run
+
+    alignment_matrix : AlignmentMatrix
+        The current alignment
+
+    positions : list
+        The column indices of the sequence feature
+    """
+
+    if state is None or "features_digest" not in state:
+        return False
+
+    n_sequences = state["n_sequences"]
+
+    return (state["alignment_length"] == alignment_matrix.get_alignment_length() and
+            state["positions"] == [int(position) for position in positions] and
+            n_sequences <= len(alignment_matrix) and
+            state["ids_digest"] == ids_digest(alignment_matrix.ids[:n_sequences]))
+
+
+def update_state(alignment, positions: list, state: dict = None) -> dict:
+    """
+    Types the sequences of a loaded alignment that are not in the state yet and returns the updated
+    state. The feature columns are extracted once; if the state does not match the alignment (see
+    state_matches) or the residues of its sequences changed, every sequence is typed again and
+    variant types are numbered from VT-001.
+
+    Parameters
+    ----------
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    positions : list
+        The column indices of the sequence feature
+
+    state : dict
+        The state of the previous run, or None
+
+    Returns
+    -------
+    The new state; n_new is the number of sequences typed in this run and full tells whether
+    the previous state had to be discarded
+    """
+
+    alignment_matrix = as_alignment_matrix(alignment)
+    features = numpy.ascontiguousarray(alignment_matrix.feature_matrix(positions))
+
+    full = True
+    digest = hashlib.sha256()
+
+    if state_matches(state, alignment_matrix, positions):
+        digest.update(features[:state["n_sequences"]].tobytes())
+        full = digest.hexdigest() != state["features_digest"]
+
+    if full:
+        state = _empty_state()
+        digest = hashlib.sha256()
+
+    n_old = state["n_sequences"]
+
+    # the digest of the typed rows goes on with the new rows
+    digest.update(features[n_old:].tobytes())
+
+    return _updated_state(state, features[n_old:], alignment_matrix.ids[n_old:],
+                          alignment_matrix.get_alignment_length(), positions, full,
+                          ids_digest=ids_digest(alignment_matrix.ids),
+                          features_digest=digest.hexdigest())
+
+
+def _fasta_prefix_matches(state: dict, handle, file_size: int, positions: list, digest) -> bool:
+    """
+    Tests whether the FASTA file (handle, at its start) still begins with the bytes a state typed
+    followed by new records; the prefix is hashed into digest.
+    """
+
+    if state is None or "prefix_digest" not in state:
+        return False
+
+    prefix_size = state["prefix_size"]
+
+    if state["positions"] != [int(position) for position in positions] or prefix_size > file_size:
+        return False
+
+    remaining = prefix_size
+
+    while remaining:
+        block = handle.read(min(_BLOCK_SIZE, remaining))
+        digest.update(block)
+        remaining -= len(block)
+
+    if digest.hexdigest() != state["prefix_digest"]:
+        return False
+
+    # bytes appended to the last typed record instead of new records
+    next_line = handle.readline()
+    handle.seek(prefix_size)
+
+    return not next_line.strip() or next_line.startswith(b">")
+
+
+def update_fasta_state(alignment_file_path: str, positions: list, state: dict = None) -> dict:
+    """
+    Types the sequences appended to an aligned FASTA file since the state and returns the updated
+    state. Only the records after the typed prefix of the file are read; if the file does not start
+    with the bytes the state typed, every sequence is read and typed again and variant types are
+    numbered from VT-001.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the aligned FASTA file
+
+    positions : list
+        The column indices of the sequence feature
+
+    state : dict
+        The state of the previous run, or None
+
+    Returns
+    -------
+    The new state, like update_state
+
+    Raises
+    ------
+    ValueError
+        If a sequence has a different number of columns than the alignment
+    """
+
+    positions = [int(position) for position in positions]
+    file_size = os.path.getsize(alignment_file_path)
+
+    digest = hashlib.sha256()
+
+    with open(alignment_file_path, "rb") as handle:
+
+        full = not _fasta_prefix_matches(state, handle, file_size, positions, digest)
+
+        if full:
+            state = _empty_state()
+            digest = hashlib.sha256()
+            handle.seek(0)
+
+        alignment_length = state.get("alignment_length")
+
+        new_ids, residues = [], []
+        identifier, sequence_lines = None, []
+
+        def add_record():
+
+            nonlocal alignment_length
+
+            sequence = b"".join(sequence_lines)
+
+            if alignment_length is None:
+                alignment_length = len(sequence)
+
+            if len(sequence) != alignment_length:
+                raise ValueError("Sequence {} has {} columns, the alignment has {}".format(
+                    identifier, len(sequence), alignment_length))
+
+            new_ids.append(identifier)
+            residues.append(bytes(sequence[position] for position in positions))
+
+        for line in handle:
+
+            digest.update(line)
+
+            if line.startswith(b">"):
+
+                if identifier is not None:
+                    add_record()
+
+                title = line[1:].strip().decode("utf-8")
+                identifier = title.split(None, 1)[0] if title else ""
+                sequence_lines = []
+
+            elif identifier is not None:
+
+                sequence_lines.append(line.strip().replace(b" ", b""))
+
+        if identifier is not None:
+            add_record()
+
+        # the file may have grown since its size was taken
+        prefix_size = handle.tell()
+
+    features = numpy.frombuffer(b"".join(residues), dtype=numpy.uint8).reshape(len(residues), len(positions))
+
+    return _updated_state(state, features, new_ids, alignment_length, positions, full,
+                          prefix_size=prefix_size, prefix_digest=digest.hexdigest())
@@ -0,0 +1,173 @@
+"""
+FeaVar run instrumentation
+
+This module measures the stages of a run: the wall and CPU time, the peak memory and the number
+of items (sequences, features) every stage handled, and keeps them for a machine readable JSON
+run report (the inputs, the FeaVar version, the stage measurements and a summary of the results).
+
+    recorder = RunRecorder(__version__, progress=print_progress)
+
+    with recorder.stage("extraction", n_items=len(alignment)):
+        ...
+
+    recorder.write_report("feavar_run.json", inputs={...}, results={...})
+
+The peak RSS of a stage is the high-water mark of the process when the stage ends, so it only
+grows from one stage to the next; with trace_memory, the peak of the Python allocations made
+during the stage is measured with tracemalloc as well (which slows allocation heavy stages).
+
+Long running stages report their progress through the progress callback, called with the stage
+name, the number of items done and the total (None when unknown).
+
+"""
+
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+REPORT_FILE = "feavar_run.json"
+
+REPORT_VERSION = 1
+
+
+def peak_rss_mb() -> float:
+    """
+    The peak resident set size of this process so far in MB.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def print_progress(stage: str, done: int, total: int = None):
+    """
+    A progress callback that writes one line per call to stderr.
+    """
+
+    if total:
+        print("{}: {:,} of {:,} ({:.0%})".format(stage, done, total, done / total), file=sys.stderr)
+    else:
+        print("{}: {:,}".format(stage, done), file=sys.stderr)
+
+
+class RunRecorder:
+    """
+    Records the measurements of the stages of one run.
+
+    Parameters
+    ----------
+    version : string
+        The FeaVar version recorded in the report
+
+    progress : callable
+        Called with (stage, done, total) by long running stages; None for no progress reports
+
+    trace_memory : bool
+        Whether to measure the peak Python allocations of every stage with tracemalloc
+    """
+
+    def __init__(self, version: str = None, progress=None, trace_memory: bool = False):
+
+        self.version = version
+        self.progress_callback = progress
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.results = {}
+        self.started = time.time()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str, n_items: int = None):
+        """
+        Measures the stage run in the with block; the yielded dictionary is the stage record, so
+        the block can set n_items (or other counts) once it knows them.
+        """
+
+        record = {"stage": name, "n_items": n_items}
+
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+
+        try:
+            yield record
+
+        finally:
+
+            record["wall_seconds"] = time.perf_counter() - start_wall
+            record["cpu_seconds"] = time.process_time() - start_cpu
+            record["peak_rss_mb"] = peak_rss_mb()
+
+            if self.trace_memory:
+                record["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                if tracing:
+                    tracemalloc.stop()
+
+            if record["n_items"] and record["wall_seconds"] > 0:
+                record["items_per_second"] = record["n_items"] / record["wall_seconds"]
+
+            self.stages.append(record)
+
+    def progress(self, stage: str, done: int, total: int = None):
+        """
+        Reports the progress of a stage to the progress callback, if there is one.
+        """
+
+        if self.progress_callback is not None:
+            self.progress_callback(stage, done, total)
+
+    def stage_progress(self, stage: str):
+        """
+        A progress callback of (done, total) bound to one stage, or None without a progress callback.
+        """
+
+        if self.progress_callback is None:
+            return None
+
+        return lambda done, total=None: self.progress_callback(stage, done, total)
+
+    def report(self, inputs: dict = None, results: dict = None) -> dict:
+        """
+        The run report: the inputs, the versions, the stage measurements and the results summary
+        (the results recorded in self.results updated with results).
+        """
+
+        import numpy
+        import pandas
+
+        return {"report_version": REPORT_VERSION,
+                "feavar_version": self.version,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+                "wall_seconds": time.perf_counter() - self._start_wall,
+                "cpu_seconds": time.process_time() - self._start_cpu,
+                "peak_rss_mb": peak_rss_mb(),
+                "environment": {"python": platform.python_version(), "numpy": numpy.__version__,
+                                "pandas": pandas.__version__, "platform": platform.platform(),
+                                "cpus": os.cpu_count()},
+                "inputs": inputs or {},
+                "stages": self.stages,
+                "results": dict(self.results, **(results or {}))}
+
+    def write_report(self, file_path: str, inputs: dict = None, results: dict = None) -> dict:
+        """
+        Writes the run report as JSON and returns it.
+        """
+
+        report = self.report(inputs, results)
+
+        with open(file_path, "w") as report_file:
+            json.dump(report, report_file, indent=1, default=str)
+
+        return report
@@ -0,0 +1,184 @@
+"""
+FeaVar variant type distances and names
+
+This module compares the variant types of a sequence feature residue by residue: the Hamming
+distance between every pair of variant types, and names that describe every variant type by its
+residue differences from its nearest more frequent variant type (and from the reference's):
+
+    VT-004 = VT-001 + K145N
+
+The variant types are encoded once as a (variant types x positions) uint8 array. The number of
+matching residues of two variant types is the dot product of their one-hot encodings, which only
+have a column for the residues actually found at each position, so all distances come from one
+matrix product whose size grows with the residues per position rather than with the alphabet.
+The products are computed in blocks of rows, and naming only compares every variant type with the
+more frequent ones, so it never holds the whole distance matrix.
+
+"""
+
+import numpy
+
+# the variant types compared with all others at a time (the rows of the distance matrix computed at once)
+BLOCK_SIZE = 1024
+
+
+def encode_variant_types(variant_types: list) -> numpy.ndarray:
+    """
+    The residues of the variant types as a (variant types x positions) uint8 array.
+
+    Raises
+    ------
+    ValueError
+        If the variant types are not all the same length
+    """
+
+    variant_types = [str(variant_type) for variant_type in variant_types]
+
+    width = len(variant_types[0]) if variant_types else 0
+
+    if any(len(variant_type) != width for variant_type in variant_types):
+        raise ValueError("The variant types are not all the same length.")
+
+    encoded = numpy.frombuffer("".join(variant_types).encode("ascii"), dtype=numpy.uint8)
+
+    return encoded.reshape(len(variant_types), width)
+
+
+def one_hot(encoded: numpy.ndarray) -> numpy.ndarray:
+    """
+    The one-hot encoding of encoded variant types: one float32 column per (position, residue) pair found.
+    """
+
+    n_variant_types, width = encoded.shape
+
+    # one key per (position, residue) pair; only the pairs that occur get a column
+    keys = encoded.astype(numpy.intp) + 256 * numpy.arange(width)
+    _, columns = numpy.unique(keys, return_inverse=True)
+
+    encoding = numpy.zeros((n_variant_types, int(columns.max()) + 1 if columns.size else 0), dtype=numpy.float32)
+    encoding[numpy.repeat(numpy.arange(n_variant_types), width), columns.ravel()] = 1
+
+    return encoding
+
+
+def _distance_dtype(width: int):
+
+    return numpy.min_scalar_type(width) if width < 2 ** 16 else numpy.uint32
+
+
+def hamming_distances(encoded: numpy.ndarray, block_size: int = BLOCK_SIZE) -> numpy.ndarray:
+    """
+    The number of positions at which every pair of variant types differ.
+
+    Parameters
+    ----------
+    encoded : numpy.ndarray
+        The encoded variant types (see encode_variant_types)
+
+    block_size : int
+        The number of variant types compared at a time
+
+    Returns
+    -------
+    A symmetric (variant types x variant types) array of distances, of the smallest unsigned integer type
+    """
+
+    n_variant_types, width = encoded.shape
+    encoding = one_hot(encoded)
+
+    distances = numpy.empty((n_variant_types, n_variant_types), dtype=_distance_dtype(width))
+
+    for start in range(0, n_variant_types, block_size):
+
+        # float32 sums of ones are exact far beyond any feature length
+        matches = encoding[start:start + block_size] @ encoding.T
+
+        distances[start:start + block_size] = width - numpy.rint(matches)
+
+    return distances
+
+
+def nearest_more_frequent(encoded: numpy.ndarray, block_size: int = BLOCK_SIZE) -> tuple:
+    """
+    The nearest more frequent variant type of every variant type; the variant types are in frequency
+    order (row 0 is VT-001), and of equally near ones the most frequent is taken.
+
+    Parameters
+    ----------
+    encoded : numpy.ndarray
+        The encoded variant types, most frequent first
+
+    block_size : int
+        The number of variant types compared at a time
+
+    Returns
+    -------
+    A tuple of the row of the nearest more frequent variant type (-1 for the first) and the distance to it
+    """
+
+    n_variant_types, width = encoded.shape
+    encoding = one_hot(encoded)
+
+    parents = numpy.full(n_variant_types, -1, dtype=numpy.intp)
+    distances = numpy.zeros(n_variant_types, dtype=_distance_dtype(width))
+
+    for start in range(1, n_variant_types, block_size):
+
+        stop = min(start + block_size, n_variant_types)
+        rows = numpy.arange(start, stop)
+
+        # only the variant types before a row are more frequent than it
+        matches = encoding[start:stop] @ encoding[:stop].T
+        matches[numpy.arange(stop)[None, :] >= rows[:, None]] = -1
+
+        # argmax takes the first, i.e. the most frequent, of equally near variant types
+        best = numpy.argmax(matches, axis=1)
+
+        parents[start:stop] = best
+        distances[start:stop] = width - numpy.rint(matches[numpy.arange(len(rows)), best])
+
+    return parents, distances
+
+
+def mutations(encoded: numpy.ndarray, parents: numpy.ndarray, position_labels: list) -> list:
+    """
+    The residue differences of every variant type from another one, e.g. "K145N S146T".
+
+    Parameters
+    ----------
+    encoded : numpy.ndarray
+        The encoded variant types
+
+    parents : numpy.ndarray
+        The row of the variant type every variant type is compared with, -1 for none
+
+    position_labels : list
+        The label (reference position) of every position of the feature
+
+    Returns
+    -------
+    One string per variant type: the space separated differences, each the residue of the other
+    variant type, the position label and the residue of the variant type ('' for none)
+    """
+
+    parents = numpy.asarray(parents, dtype=numpy.intp)
+
+    compared = numpy.flatnonzero(parents >= 0)
+
+    differs = numpy.zeros(encoded.shape, dtype=bool)
+    differs[compared] = encoded[compared] != encoded[parents[compared]]
+
+    rows, columns = numpy.nonzero(differs)
+
+    from_residues = encoded[parents[rows], columns].tobytes().decode("ascii")
+    to_residues = encoded[rows, columns].tobytes().decode("ascii")
+
+    labels = [str(label) for label in position_labels]
+    changes = ["{}{}{}".format(from_residue, labels[column], to_residue) for from_residue, column, to_residue in
+               zip(from_residues, columns.tolist(), to_residues)]
+
+    # the differences of every row are consecutive (numpy.nonzero is in row order)
+    bounds = numpy.cumsum(numpy.bincount(rows, minlength=len(encoded)))
+
+    return [" ".join(changes[end - count:end]) for end, count in zip(bounds.tolist(),
+                                                                     numpy.diff(bounds, prepend=0).tolist())]
@@ -0,0 +1,147 @@
+"""
+FeaVar multi-core variant typing
+
+This module splits the alignment matrix into ranges of sequences (shards), extracts and groups
+the sequence feature of every shard in a pool of worker processes and merges the partial
+results. Each shard returns its distinct variant types, the variant type of each of its
+sequences and the counts; merging maps every shard's variant types onto the sorted union, so
+the merged result is exactly what group_feature_rows returns for the whole alignment.
+
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+try:
+    from FeaVar.alignment_matrix import as_alignment_matrix, group_feature_rows
+except ImportError:  # run as a script from inside the package directory
+    from alignment_matrix import as_alignment_matrix, group_feature_rows
+
+# shards per worker process, so a slow shard does not leave the other workers idle
+SHARDS_PER_PROCESS = 4
+
+_worker_matrix = None
+
+
+def _init_worker(matrix: numpy.ndarray):
+
+    global _worker_matrix
+
+    _worker_matrix = matrix
+
+
+def _group_shard(shard: tuple):
+
+    start, stop, positions = shard
+
+    return group_feature_rows(_worker_matrix[start:stop][:, positions])
+
+
+def shard_ranges(n_sequences: int, n_shards: int) -> list:
+    """
+    Splits n_sequences rows into at most n_shards contiguous (start, stop) ranges of near equal size.
+
+    Parameters
+    ----------
+    n_sequences : int
+        The number of sequences in the alignment
+
+    n_shards : int
+        The number of shards wanted
+    """
+
+    n_shards = max(1, min(n_shards, n_sequences))
+    bounds = numpy.linspace(0, n_sequences, n_shards + 1).astype(int)
+
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def merge_shard_groups(shard_groups: list):
+    """
+    Merges the (variant types, inverse, counts) results of consecutive shards.
+
+    Parameters
+    ----------
+    shard_groups : list
+        The group_feature_rows result of every shard, in row order
+
+    Returns
+    -------
+    A tuple of the distinct variant types (sorted), the index of the variant type of every
+    sequence and the number of sequences per variant type
+    """
+
+    variant_types = sorted(set().union(*(shard_types for shard_types, _, _ in shard_groups)))
+    variant_type_index = {variant_type: index for index, variant_type in enumerate(variant_types)}
+
+    inverse_parts = []
+    counts = numpy.zeros(len(variant_types), dtype=numpy.int64)
+
+    for shard_types, shard_inverse, shard_counts in shard_groups:
+
+        remap = numpy.array([variant_type_index[variant_type] for variant_type in shard_types], dtype=numpy.intp)
+
+        inverse_parts.append(remap[shard_inverse])
+        counts[remap] += shard_counts
+
+    inverse = numpy.concatenate(inverse_parts) if inverse_parts else numpy.zeros(0, dtype=numpy.intp)
+
+    return variant_types, inverse, counts
+
+
+def parallel_variant_types(alignment, positions: list, processes: int = None, progress=None):
+    """
+    Groups the sequences by their sequence feature using a pool of worker processes.
+
+    Parameters
+    ----------
+    alignment :
+        The loaded multiple sequence alignment (or an AlignmentMatrix)
+
+    positions : list
+        The column indices of the sequence feature
+
+    processes : int
+        The number of worker processes, default is the number of CPUs
+
+    progress : callable
+        Called with (shards done, number of shards) as the shards are grouped
+
+    Returns
+    -------
+    The same tuple as AlignmentMatrix.variant_types
+    """
+
+    alignment_matrix = as_alignment_matrix(alignment)
+    positions = numpy.asarray(positions, dtype=numpy.intp)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    shards = shard_ranges(len(alignment_matrix), processes * SHARDS_PER_PROCESS)
+
+    if processes <= 1 or len(shards) <= 1:
+        return alignment_matrix.variant_types(positions)
+
+    # fork lets the workers share the (possibly memory mapped) matrix instead of receiving a pickled copy
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=_init_worker, initargs=(alignment_matrix.matrix,)) as executor:
+
+        shard_groups = []
+
+        for shard_group in executor.map(_group_shard, [(start, stop, positions) for start, stop in shards]):
+
+            shard_groups.append(shard_group)
+
+            if progress is not None:
+                progress(len(shard_groups), len(shards))
+
+    return merge_shard_groups(shard_groups)
@@ -0,0 +1,189 @@
+"""
+FeaVar plots
+
+This module renders the variant type by metadata field bar charts. The VT x value count table of
+every field is aggregated once in the main process; the figures are rendered from these small
+tables in a pool of worker processes, headless (Agg, no pyplot state), and released as soon as
+they are saved.
+
+A manifest (plots.json) in the output directory keeps, for the plots of every field, the feature,
+the number of top variant types and the sha256 digest of the table they were rendered from, so a
+later run of the same feature and top whose table is unchanged keeps the existing files instead of
+rendering them again.
+
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST_FILE = "plots.json"
+
+
+def count_field(df_all_data, field: str):
+    """
+    The number of sequences per VT and value of a metadata field, as a series indexed by both.
+
+    Parameters
+    ----------
+    df_all_data : dataframe
+        The assignments with VT and metadata columns
+
+    field : string
+        The metadata field
+    """
+
+    return df_all_data.groupby(['VT', field], observed=True).size()
+
+
+def aggregate_field(df_all_data, field: str):
+    """
+    The number of sequences per VT and value of a metadata field (VTs as rows, values as columns).
+
+    Parameters
+    ----------
+    df_all_data : dataframe
+        The assignments with VT and metadata columns
+
+    field : string
+        The metadata field
+    """
+
+    return count_field(df_all_data, field).unstack(level=1)
+
+
+def table_digest(table) -> str:
+    """
+    The sha256 digest of an aggregated table (values, labels and column names).
+    """
+
+    return hashlib.sha256(table.to_csv().encode("utf-8")).hexdigest()
+
+
+def plot_file_paths(output_dir: str, field: str) -> tuple:
+    """
+    The file paths of the grouped and the stacked bar chart of a field.
+    """
+
+    return (os.path.join(output_dir, "feavar_{}.svg".format(field)),
+            os.path.join(output_dir, "feavar_stacked_{}.svg".format(field)))
+
+
+def render_field(job: tuple) -> str:
+    """
+    Renders the grouped and the stacked bar chart of one field.
+
+    Parameters
+    ----------
+    job : tuple
+        The aggregated table, the field name and the output directory
+
+    Returns
+    -------
+    The field name
+    """
+
+    from matplotlib.figure import Figure
+
+    table, field, output_dir = job
+    grouped_path, stacked_path = plot_file_paths(output_dir, field)
+
+    # figures made without pyplot use the Agg canvas and are not kept in any figure registry
+    fig = Figure()
+    table.plot(kind='bar', subplots=False, ax=fig.subplots())
+    fig.savefig(grouped_path)
+    fig.clear()
+
+    fig = Figure(figsize=(18.5, 10.5))
+    table.plot(kind='bar', stacked=True, subplots=False, ax=fig.subplots())
+    fig.savefig(stacked_path, dpi=100)
+    fig.clear()
+
+    return field
+
+
+def _read_manifest(output_dir: str) -> dict:
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(output_dir: str, manifest: dict):
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+def plot_fields(df_all_data, fields: list, output_dir: str, processes: int = 1, feature: str = None,
+                top: int = None) -> list:
+    """
+    Aggregates and plots every field, skipping fields whose plots are up to date.
+
+    Parameters
+    ----------
+    df_all_data : dataframe
+        The assignments with VT and metadata columns
+
+    fields : list
+        The metadata fields to plot
+
+    output_dir : string
+        The directory of the plots and the per field tables (df_by_<field>.csv)
+
+    processes : int
+        The number of worker processes rendering plots
+
+    feature : string
+        The label of the sequence feature the variant types are of
+
+    top : int
+        The number of top variant types in df_all_data
+
+    Returns
+    -------
+    The fields that were rendered
+    """
+
+    manifest = _read_manifest(output_dir)
+
+    jobs = []
+
+    for field in fields:
+
+        counts = count_field(df_all_data, field)
+        counts.to_csv(os.path.join(output_dir, "df_by_{}.csv".format(field)))
+
+        table = counts.unstack(level=1)
+
+        # the plot files of a field are shared by every feature and top
+        entry = {"feature": feature, "top": top, "table": table_digest(table)}
+
+        if manifest.get(field) == entry and all(os.path.exists(path) for path in plot_file_paths(output_dir, field)):
+            continue
+
+        manifest[field] = entry
+        jobs.append((table, field, output_dir))
+
+    if processes <= 1 or len(jobs) <= 1:
+        rendered = [render_field(job) for job in jobs]
+
+    else:
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+
+        with ProcessPoolExecutor(max_workers=min(processes, len(jobs)), mp_context=context) as executor:
+            rendered = list(executor.map(render_field, jobs))
+
+    _write_manifest(output_dir, manifest)
+
+    return rendered
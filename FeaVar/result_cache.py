@@ -0,0 +1,375 @@
+"""
+FeaVar result cache
+
+This module stores the assignment and count tables of a run on disk, keyed by the content of the
+alignment and the inputs that determine the result, so re-running the same feature on the same
+alignment returns the stored tables without parsing the alignment.
+
+The cache is a directory holding one sub-directory per result and an index.json with the size and
+last use of every entry. When the cache grows past its size limit the least recently used entries
+are evicted. The sha256 digest of each alignment file is remembered by path, size and modification
+time so an unchanged multi-GB alignment is only hashed once.
+
+Every update of the index holds an exclusive lock on index.lock, so concurrent runs sharing a
+cache (batches, a query server) do not lose each other's entries.
+
+Inspect or clear the cache from the command line:
+
+    python -m FeaVar.result_cache info
+    python -m FeaVar.result_cache clear
+
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = os.environ.get("FEAVAR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "feavar"))
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# part of every key; raised when the same inputs give different results (2: features read at 0-based columns,
+# 3: the expected residues of the feature)
+KEY_VERSION = 3
+
+_INDEX_FILE = "index.json"
+_LOCK_FILE = "index.lock"
+_VARIANT_TYPES_FILE = "variant_types.pkl"
+_ASSIGNMENTS_FILE = "assignments.pkl"
+
+
+def _temp_suffix() -> str:
+
+    # unique per process and thread, several threads of a server may write at once
+    return ".{}.{}.tmp".format(os.getpid(), threading.get_ident())
+
+
+def file_digest(file_path: str, block_size: int = 1 << 20) -> str:
+    """
+    The sha256 digest of the bytes of a file.
+
+    Parameters
+    ----------
+    file_path : string
+        The file path of the file to hash
+
+    block_size : int
+        The number of bytes read at a time
+    """
+
+    digest = hashlib.sha256()
+
+    with open(file_path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A size bounded, least recently used on-disk cache of FeaVar results.
+
+    Parameters
+    ----------
+    cache_dir : string
+        The directory of the cache, created if missing
+
+    max_bytes : int
+        The size the cache is trimmed to after every new entry
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """
+        Holds an exclusive lock on the index while it is read, changed and written back.
+        """
+
+        with open(os.path.join(self.cache_dir, _LOCK_FILE), "a+") as lock_file:
+
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_index(self) -> dict:
+
+        index_path = os.path.join(self.cache_dir, _INDEX_FILE)
+
+        if not os.path.exists(index_path):
+            return {"entries": {}, "digests": {}}
+
+        with open(index_path) as index_file:
+            return json.load(index_file)
+
+    def _write_index(self, index: dict):
+
+        index_path = os.path.join(self.cache_dir, _INDEX_FILE)
+        temp_path = index_path + _temp_suffix()
+
+        with open(temp_path, "w") as index_file:
+            json.dump(index, index_file, indent=1)
+
+        os.replace(temp_path, index_path)
+
+    def alignment_digest(self, alignment_file_path: str) -> str:
+        """
+        The sha256 digest of an alignment file, re-hashed only when its size or modification time changes.
+
+        Parameters
+        ----------
+        alignment_file_path : string
+            The file path of the alignment
+        """
+
+        absolute_path = os.path.abspath(alignment_file_path)
+        file_stat = os.stat(absolute_path)
+
+        index = self._read_index()
+        known = index["digests"].get(absolute_path)
+
+        if known and known["size"] == file_stat.st_size and known["mtime_ns"] == file_stat.st_mtime_ns:
+            return known["digest"]
+
+        digest = file_digest(absolute_path)
+
+        with self._index_lock():
+            index = self._read_index()
+            index["digests"][absolute_path] = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns,
+                                               "digest": digest}
+            self._write_index(index)
+
+        return digest
+
+    def key_for(self, alignment_file_path: str, alignment_format: str, reference_identifier: str,
+                positions: list, version: str, cds_start: int = None, residues: list = None) -> str:
+        """
+        The cache key of a run. A run is only stored once its feature passed validation against the
+        reference, so the key holds everything validation depends on: the alignment content, the
+        reference, the positions and the residues the feature expects at them.
+
+        Parameters
+        ----------
+        alignment_file_path : string
+            The file path of the alignment; its content, not its name, goes into the key
+
+        alignment_format : string
+            The format of the alignment
+
+        reference_identifier : string
+            The identifier of the reference sequence the positions are corrected against
+
+        positions : list
+            The parsed positions of the sequence feature
+
+        version : string
+            The FeaVar version
+
+        cds_start : int
+            The start of the coding sequence when the positions are protein positions (see codon)
+
+        residues : list
+            The parsed residues of the feature (see epitope.parse_epitope); the residue codes it
+            names are checked against the reference, so "G100-110" and "W100-110" are different keys
+        """
+
+        key_fields = {"alignment": self.alignment_digest(alignment_file_path),
+                      "alignment_format": alignment_format,
+                      "reference_identifier": reference_identifier,
+                      "positions": [int(position) for position in positions],
+                      "version": version,
+                      "key_version": KEY_VERSION}
+
+        # only protein features have a cds_start in their key
+        if cds_start is not None:
+            key_fields["cds_start"] = int(cds_start)
+
+        if residues is not None:
+            key_fields["residues"] = [[residue.chain, residue.residue, int(residue.position)] for residue in residues]
+
+        return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, expected: dict = None):
+        """
+        Returns the stored (df_by_variant_type, df_starter) of a key, or None on a cache miss.
+
+        Parameters
+        ----------
+        key : string
+            The cache key (see key_for)
+
+        expected : dict
+            Description fields (see put) the entry must have, e.g. the validated residues; any
+            difference is a cache miss
+        """
+
+        import pandas
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        index = self._read_index()
+
+        if key not in index["entries"] or not os.path.isdir(entry_dir):
+            return None
+
+        description = index["entries"][key]["description"]
+
+        if any(description.get(field) != value for field, value in (expected or {}).items()):
+            return None
+
+        try:
+            df_by_variant_type = pandas.read_pickle(os.path.join(entry_dir, _VARIANT_TYPES_FILE))
+            df_starter = pandas.read_pickle(os.path.join(entry_dir, _ASSIGNMENTS_FILE))
+        except (OSError, ValueError, EOFError):
+            return None
+
+        with self._index_lock():
+            index = self._read_index()
+            if key in index["entries"]:
+                index["entries"][key]["last_used"] = time.time()
+                self._write_index(index)
+
+        return df_by_variant_type, df_starter
+
+    def put(self, key: str, df_by_variant_type, df_starter, description: dict = None):
+        """
+        Stores the tables of a run and evicts least recently used entries beyond the size limit.
+
+        Parameters
+        ----------
+        key : string
+            The cache key (see key_for)
+
+        df_by_variant_type : dataframe
+            The variant type count table
+
+        df_starter : dataframe
+            The accession to variant type assignment table
+
+        description : dict
+            Any JSON serializable details shown by info (alignment, positions, ...)
+        """
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        temp_dir = entry_dir + _temp_suffix()
+
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+
+        df_by_variant_type.to_pickle(os.path.join(temp_dir, _VARIANT_TYPES_FILE))
+        df_starter.to_pickle(os.path.join(temp_dir, _ASSIGNMENTS_FILE))
+
+        size = sum(os.path.getsize(os.path.join(temp_dir, name)) for name in os.listdir(temp_dir))
+
+        with self._index_lock():
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(temp_dir, entry_dir)
+
+            now = time.time()
+            index = self._read_index()
+            index["entries"][key] = {"size": size, "created": now, "last_used": now,
+                                     "description": description or {}}
+
+            self._evict(index)
+            self._write_index(index)
+
+    def _evict(self, index: dict):
+
+        entries = index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+
+        for key in sorted(entries, key=lambda entry_key: entries[entry_key]["last_used"]):
+
+            if total <= self.max_bytes:
+                break
+
+            total -= entries[key]["size"]
+            del entries[key]
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def info(self) -> list:
+        """
+        The entries of the cache, most recently used first.
+        """
+
+        entries = self._read_index()["entries"]
+
+        return [dict(key=key, **entries[key]) for key in
+                sorted(entries, key=lambda entry_key: entries[entry_key]["last_used"], reverse=True)]
+
+    def clear(self) -> int:
+        """
+        Removes every entry and remembered digest; returns the number of entries removed.
+        """
+
+        with self._index_lock():
+
+            entries = self._read_index()["entries"]
+
+            for key in entries:
+                shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+            self._write_index({"entries": {}, "digests": {}})
+
+        return len(entries)
+
+
+def main(argv=None):
+    """
+    Inspect (info) or clear (clear) a FeaVar result cache.
+    """
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the FeaVar result cache.")
+    parser.add_argument("command", choices=["info", "clear"])
+    parser.add_argument("--cache_dir", default=DEFAULT_CACHE_DIR,
+                        help="The cache directory (default: $FEAVAR_CACHE_DIR or ~/.cache/feavar).")
+    arguments = parser.parse_args(argv)
+
+    cache = ResultCache(arguments.cache_dir)
+
+    if arguments.command == "clear":
+        print("Removed {} cached results from {}".format(cache.clear(), cache.cache_dir))
+        return 0
+
+    entries = cache.info()
+
+    for entry in entries:
+        print("{}  {:>12,d} bytes  last used {}  {}".format(
+            entry["key"][:12], entry["size"],
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_used"])),
+            json.dumps(entry["description"], sort_keys=True)))
+
+    print("{} cached results, {:,d} bytes in {}".format(
+        len(entries), sum(entry["size"] for entry in entries), cache.cache_dir))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
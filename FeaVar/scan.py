@@ -0,0 +1,116 @@
+"""
+FeaVar sliding window scan
+
+This module computes variant type diversity for every k residue window along the reference
+sequence. Each sequence keeps one rolling 64 bit polynomial hash of its current window; moving
+the window one residue removes the leaving column and adds the entering column, so every
+column of the alignment is read once or twice instead of once per window it belongs to.
+
+"""
+
+import numpy
+
+# FNV-1a 64 bit prime; any odd multiplier works, all arithmetic is modulo 2 ** 64
+_HASH_BASE = numpy.uint64(1099511628211)
+
+
+def _column(alignment_matrix, column: int) -> numpy.ndarray:
+
+    return alignment_matrix.matrix[:, column].astype(numpy.uint64)
+
+
+def _hash_window(alignment_matrix, columns: list) -> numpy.ndarray:
+
+    window_hash = numpy.zeros(len(alignment_matrix), dtype=numpy.uint64)
+
+    for column in columns:
+        window_hash *= _HASH_BASE
+        window_hash += _column(alignment_matrix, column)
+
+    return window_hash
+
+
+def window_statistics(variant_type_keys: numpy.ndarray) -> tuple:
+    """
+    Summarizes the variant types of one window.
+
+    Parameters
+    ----------
+    variant_type_keys : numpy.ndarray
+        One key (hash) per sequence; sequences with equal keys share a variant type
+
+    Returns
+    -------
+    A tuple of the number of distinct variant types, the count of the most frequent variant type
+    and the Shannon entropy (bits) of the variant type frequencies
+    """
+
+    counts = numpy.unique(variant_type_keys, return_counts=True)[1]
+
+    frequencies = counts / counts.sum()
+    entropy = float(-(frequencies * numpy.log2(frequencies)).sum())
+
+    return len(counts), int(counts.max()), abs(entropy)
+
+
+def scan_windows(alignment_matrix, columns: list, window_size: int, step: int = 1):
+    """
+    Yields the variant type statistics of every window of consecutive reference positions.
+
+    Parameters
+    ----------
+    alignment_matrix : AlignmentMatrix
+        The alignment
+
+    columns : list
+        The alignment column of every reference position, in reference order
+
+    window_size : int
+        The number of reference positions per window (k)
+
+    step : int
+        The number of reference positions between the starts of consecutive windows
+
+    Yields
+    ------
+    Tuples of the window start (index into columns), number of variant types, top variant type
+    count and entropy
+    """
+
+    if window_size < 1 or step < 1:
+        raise ValueError("The window size and step must be positive.")
+
+    if len(alignment_matrix) == 0 or window_size > len(columns):
+        return
+
+    # multiplier of the residue leaving the window: base ** (window_size - 1) modulo 2 ** 64
+    leaving_factor = numpy.ones(1, dtype=numpy.uint64)
+    for _ in range(window_size - 1):
+        leaving_factor *= _HASH_BASE
+    leaving_factor = leaving_factor[0]
+
+    start = 0
+    window_hash = _hash_window(alignment_matrix, columns[:window_size])
+
+    while True:
+
+        yield (start,) + window_statistics(window_hash)
+
+        next_start = start + step
+
+        if next_start + window_size > len(columns):
+            return
+
+        if step < window_size:
+
+            # roll the hash one residue at a time
+            for offset in range(start, next_start):
+                window_hash -= _column(alignment_matrix, columns[offset]) * leaving_factor
+                window_hash *= _HASH_BASE
+                window_hash += _column(alignment_matrix, columns[offset + window_size])
+
+        else:
+
+            window_hash = _hash_window(alignment_matrix, columns[next_start:next_start + window_size])
+
+        start = next_start
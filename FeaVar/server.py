@@ -0,0 +1,590 @@
+"""
+FeaVar query server
+
+A long running server that keeps alignments loaded in memory and answers sequence feature
+queries with JSON variant type tables, over HTTP on localhost or on a Unix socket.
+
+    feavar serve alignments.tsv --port 8765
+    curl 'http://127.0.0.1:8765/variant_types?alignment=HA&positions=124-142&top=5'
+
+The configuration file lists one alignment per line: its name, the alignment file (relative to the
+configuration file), the alignment format and the reference identifier, tab separated; lines
+starting with # are comments. Every alignment is loaded into a FeaVarSession (an alignment matrix,
+the reference and its coordinate map) when the server starts.
+
+Endpoints:
+
+    GET  /health           the names of the loaded alignments
+    GET  /alignments       the alignments, their sizes and reference identifiers
+    GET  /stats            the query, batch and cache counters
+    GET  /variant_types    ?alignment=HA&positions=124-142[&top=10]; alignment may be left out when
+                           only one alignment is loaded
+    POST /variant_types    {"alignment": "HA", "features": {"site_a": "124-142", ...}, "top": 10}
+
+Queries on the same alignment that arrive within batch_window seconds of each other are answered
+together with one pass over the alignment (see extract_feature_batch), identical queries share one
+computation, and the counts of the cache_size most recently queried features are kept in memory.
+Batches are computed in worker threads, at most max_concurrency at a time, so the event loop keeps
+accepting queries while a batch runs. Served sessions run with a single process: worker processes
+forked from a threaded process can deadlock.
+
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from FeaVar.session import FeaVarSession
+except ImportError:  # run as a script from inside the package directory
+    from session import FeaVarSession
+
+DEFAULT_HOST = "127.0.0.1"
+
+DEFAULT_PORT = 8765
+
+# the largest request body accepted (POST /variant_types)
+MAX_BODY_SIZE = 1024 ** 2
+
+
+class QueryError(Exception):
+    """
+    A query the server cannot answer; status is the HTTP status of the response.
+    """
+
+    def __init__(self, status: HTTPStatus, message: str):
+
+        super().__init__(message)
+        self.status = status
+
+
+def read_config(config_file_path: str) -> dict:
+    """
+    Reads a server configuration file (name, alignment file, format, reference identifier per line).
+
+    Returns
+    -------
+    A dictionary of alignment names to the FeaVarSession arguments of the alignment
+    """
+
+    config_dir = os.path.dirname(os.path.abspath(config_file_path))
+
+    alignments = {}
+
+    with open(config_file_path) as config_file:
+
+        for line_number, line in enumerate(config_file, 1):
+
+            line = line.strip()
+
+            if not line or line.startswith("#"):
+                continue
+
+            fields = [field.strip() for field in line.split("\t")]
+
+            if len(fields) != 4:
+                raise ValueError("{}, line {}: expected a name, an alignment file, a format and a reference "
+                                 "identifier, tab separated".format(config_file_path, line_number))
+
+            name, alignment_file_path, alignment_format, reference_identifier = fields
+
+            if name in alignments:
+                raise ValueError("{}, line {}: duplicate alignment name {}".format(config_file_path, line_number,
+                                                                                  name))
+
+            alignments[name] = {"alignment_file_path": os.path.join(config_dir, alignment_file_path),
+                                "alignment_format": alignment_format,
+                                "reference_identifier": reference_identifier}
+
+    if not alignments:
+        raise ValueError("{}: no alignments configured".format(config_file_path))
+
+    return alignments
+
+
+def load_sessions(alignments: dict) -> dict:
+    """
+    Loads every configured alignment, its reference sequence and coordinate map into a FeaVarSession.
+
+    Raises
+    ------
+    ValueError
+        If an alignment cannot be read or has no sequence with the reference identifier
+    """
+
+    sessions = {}
+
+    for name, session_arguments in alignments.items():
+
+        start = time.perf_counter()
+
+        session = FeaVarSession(**session_arguments)
+        session.coordinate_map
+
+        logging.info("Loaded alignment %s: %d sequences in %.1f s", name, len(session.alignment),
+                     time.perf_counter() - start)
+
+        sessions[name] = session
+
+    return sessions
+
+
+class QueryServer:
+    """
+    Answers variant type queries on loaded alignments.
+
+    Parameters
+    ----------
+    sessions : dict
+        Alignment names to their loaded FeaVarSession
+
+    batch_window : float
+        The seconds queries on one alignment are collected for before they are computed together
+
+    max_batch : int
+        The number of features that triggers a batch before the batch window ends
+
+    cache_size : int
+        The number of feature results kept in memory
+
+    max_concurrency : int
+        The number of batches computed at the same time; default is the number of CPUs, up to 4; the
+        sessions are switched to a single process
+    """
+
+    def __init__(self, sessions: dict, batch_window: float = 0.005, max_batch: int = 256, cache_size: int = 4096,
+                 max_concurrency: int = None):
+
+        # batches run in threads, and forking worker processes from a threaded process can deadlock
+        for name, session in sessions.items():
+            if session.processes != 1:
+                logging.warning("Serving alignment %s with 1 process instead of %d", name, session.processes)
+                session.processes = 1
+
+        self.sessions = sessions
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.max_concurrency = max_concurrency or min(4, os.cpu_count() or 1)
+        self.stats = collections.Counter()
+
+        self._cache = collections.OrderedDict()
+        self._pending = {}
+        self._flush_handles = {}
+        self._tasks = set()
+        self._connections = set()
+        self._semaphore = None
+        self._executor = None
+        self._server = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None):
+        """
+        Starts listening on host:port, or on the Unix socket socket_path.
+        """
+
+        # created in the running loop; before Python 3.10 a semaphore binds to the loop current when it is made
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="feavar-query")
+
+        if socket_path is not None:
+            self._server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        else:
+            self._server = await asyncio.start_server(self.handle_connection, host, port)
+
+        logging.info("Serving %s on %s", ", ".join(self.sessions), self.address)
+
+        return self._server
+
+    @property
+    def address(self):
+        """
+        The (host, port) or the socket path the server listens on.
+        """
+
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        """
+        Stops listening, closes the idle connections and waits for the running batches.
+        """
+
+        self._server.close()
+
+        for writer in list(self._connections):
+            writer.close()
+
+        await self._server.wait_closed()
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        self._executor.shutdown()
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None):
+
+        await self.start(host, port, socket_path)
+
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def describe(self) -> list:
+        """
+        The loaded alignments: name, file, number of sequences, length and reference identifier.
+        """
+
+        return [{"name": name, "alignment": session.alignment_file_path, "sequences": len(session.alignment),
+                 "length": session.alignment.get_alignment_length(), "reference": session.reference_identifier}
+                for name, session in self.sessions.items()]
+
+    async def variant_types(self, alignment: str, features: dict) -> dict:
+        """
+        The variant type counts of features (names to positions) of an alignment.
+
+        Returns
+        -------
+        A dictionary of feature names to (number of sequences, variant type records)
+        """
+
+        alignment = self._alignment_name(alignment)
+        session = self.sessions[alignment]
+
+        corrected_positions = {}
+
+        for name, positions in features.items():
+
+            if not isinstance(positions, str):
+                raise QueryError(HTTPStatus.BAD_REQUEST, "{}: positions must be a string".format(name))
+
+            try:
+                corrected_positions[name] = tuple(session.correct_positions(positions))
+            except ValueError as err:
+                raise QueryError(HTTPStatus.BAD_REQUEST, "{}: {}".format(name, err))
+
+        self.stats["features"] += len(corrected_positions)
+
+        results = await asyncio.gather(*[self._lookup(alignment, positions)
+                                         for positions in corrected_positions.values()])
+
+        return dict(zip(corrected_positions, results))
+
+    def _alignment_name(self, alignment: str) -> str:
+
+        if alignment is None and len(self.sessions) == 1:
+            return next(iter(self.sessions))
+
+        if alignment not in self.sessions:
+            raise QueryError(HTTPStatus.NOT_FOUND, "Unknown alignment: {}".format(alignment))
+
+        return alignment
+
+    def _lookup(self, alignment: str, positions: tuple) -> asyncio.Future:
+        """
+        The future result of one feature: from the cache, from a pending batch, or from a new batch entry.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        key = (alignment, positions)
+
+        if key in self._cache:
+
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+
+            future = loop.create_future()
+            future.set_result(self._cache[key])
+
+            return future
+
+        pending = self._pending.setdefault(alignment, {})
+
+        # identical queries in one batch share the computation
+        future = pending.get(positions)
+
+        if future is None:
+            future = pending[positions] = loop.create_future()
+
+        if len(pending) >= self.max_batch:
+            self._flush(alignment)
+        elif alignment not in self._flush_handles:
+            self._flush_handles[alignment] = loop.call_later(self.batch_window, self._flush, alignment)
+
+        return future
+
+    def _flush(self, alignment: str):
+
+        handle = self._flush_handles.pop(alignment, None)
+        if handle is not None:
+            handle.cancel()
+
+        pending = self._pending.pop(alignment, None)
+
+        if pending:
+            task = asyncio.ensure_future(self._compute(alignment, pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _compute(self, alignment: str, pending: dict):
+        """
+        Computes a batch of features in a worker thread and resolves their futures.
+        """
+
+        features = {str(index): list(positions) for index, positions in enumerate(pending)}
+
+        try:
+            async with self._semaphore:
+                tables = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.sessions[alignment].count_variant_types, features)
+
+        except Exception as err:
+
+            logging.exception("Batch of %d features on %s failed", len(pending), alignment)
+
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(err)
+
+            return
+
+        self.stats["batches"] += 1
+        self.stats["computed"] += len(pending)
+
+        for (positions, future), df_by_variant_type in zip(pending.items(), tables.values()):
+
+            result = (int(df_by_variant_type["count"].sum()),
+                      [{"VT": vt, "variant_type": str(variant_type), "count": int(count)}
+                       for vt, variant_type, count in df_by_variant_type[["VT", "variant_type", "count"]].itertuples(
+                          index=False)])
+
+            self._cache[(alignment, positions)] = result
+
+            if not future.done():
+                future.set_result(result)
+
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def dispatch(self, method: str, target: str, body: bytes = b"") -> tuple:
+        """
+        Answers one request.
+
+        Returns
+        -------
+        A tuple of the HTTP status and the JSON response
+        """
+
+        url = urlsplit(target)
+
+        try:
+
+            if url.path in ("/health", "/alignments", "/stats") and method != "GET":
+                raise QueryError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET for {}".format(url.path))
+
+            if url.path == "/health":
+                return HTTPStatus.OK, {"status": "ok", "alignments": list(self.sessions)}
+
+            if url.path == "/alignments":
+                return HTTPStatus.OK, {"alignments": self.describe()}
+
+            if url.path == "/stats":
+                return HTTPStatus.OK, dict(self.stats, cached=len(self._cache))
+
+            if url.path != "/variant_types":
+                raise QueryError(HTTPStatus.NOT_FOUND, "Unknown path: {}".format(url.path))
+
+            self.stats["queries"] += 1
+
+            if method == "GET":
+
+                query = parse_qs(url.query)
+
+                alignment = query.get("alignment", [None])[0]
+                positions = query.get("positions", [None])[0]
+                top = _top(query.get("top", [None])[0])
+
+                if not positions:
+                    raise QueryError(HTTPStatus.BAD_REQUEST, "No positions given")
+
+                alignment = self._alignment_name(alignment)
+                results = await self.variant_types(alignment, {"positions": positions})
+
+                return HTTPStatus.OK, dict(_feature_response(positions, results["positions"], top),
+                                           alignment=alignment)
+
+            if method == "POST":
+
+                try:
+                    request = json.loads(body or b"{}")
+                except ValueError as err:
+                    raise QueryError(HTTPStatus.BAD_REQUEST, "Invalid JSON: {}".format(err))
+
+                if not isinstance(request, dict) or not isinstance(request.get("features"), dict) \
+                        or not request["features"]:
+                    raise QueryError(HTTPStatus.BAD_REQUEST, "Expected {\"features\": {name: positions}}")
+
+                alignment = self._alignment_name(request.get("alignment"))
+                top = _top(request.get("top"))
+
+                results = await self.variant_types(alignment, request["features"])
+
+                return HTTPStatus.OK, {"alignment": alignment,
+                                       "features": {name: _feature_response(request["features"][name], result, top)
+                                                    for name, result in results.items()}}
+
+            raise QueryError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET or POST for /variant_types")
+
+        except QueryError as err:
+
+            self.stats["errors"] += 1
+
+            return err.status, {"error": str(err)}
+
+        except Exception as err:
+
+            logging.exception("Query %s %s failed", method, target)
+            self.stats["errors"] += 1
+
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "{}: {}".format(type(err).__name__, err)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves the HTTP/1.1 requests of one connection (kept alive unless the client closes it).
+        """
+
+        self._connections.add(writer)
+
+        try:
+
+            while True:
+
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                keep_alive = False
+
+                try:
+                    method, target, version, headers = await _read_head(request_line, reader)
+
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY_SIZE:
+                        raise QueryError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "The request body is too large")
+
+                    body = await reader.readexactly(length) if length else b""
+
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                    status, response = await self.dispatch(method, target, body)
+
+                except QueryError as err:
+                    status, response = err.status, {"error": str(err)}
+
+                except ValueError:
+                    status, response = HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}
+
+                payload = json.dumps(response).encode("utf-8")
+
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                             "Connection: {}\r\n\r\n".format(status.value, status.phrase, len(payload),
+                                                             "keep-alive" if keep_alive else "close")
+                             .encode("latin-1") + payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+        finally:
+
+            self._connections.discard(writer)
+            writer.close()
+
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def _read_head(request_line: bytes, reader: asyncio.StreamReader) -> tuple:
+
+    parts = request_line.decode("latin-1").split()
+
+    if len(parts) != 3:
+        raise ValueError("Malformed request line")
+
+    method, target, version = parts
+
+    headers = {}
+
+    while True:
+
+        line = await reader.readline()
+
+        if line in (b"\r\n", b"\n", b""):
+            break
+
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    return method, target, version, headers
+
+
+def _top(top):
+
+    if top is None:
+        return None
+
+    try:
+        top = int(top)
+    except (TypeError, ValueError):
+        top = 0
+
+    if top < 1:
+        raise QueryError(HTTPStatus.BAD_REQUEST, "top must be a positive number")
+
+    return top
+
+
+def _feature_response(positions: str, result: tuple, top: int = None) -> dict:
+
+    n_sequences, variant_types = result
+
+    return {"positions": positions, "n_sequences": n_sequences, "n_variant_types": len(variant_types),
+            "variant_types": variant_types[:top]}
+
+
+def serve(config_file_path: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str = None,
+          **options):
+    """
+    Loads the configured alignments and serves queries until interrupted.
+
+    Parameters
+    ----------
+    config_file_path : string
+        The server configuration file (see read_config)
+
+    host, port : string, int
+        The address to listen on; ignored with socket_path
+
+    socket_path : string
+        The Unix socket to listen on instead of TCP
+
+    options :
+        The QueryServer options (batch_window, max_batch, cache_size, max_concurrency)
+    """
+
+    sessions = load_sessions(read_config(config_file_path))
+
+    server = QueryServer(sessions, **options)
+
+    asyncio.run(server.serve_forever(host, port, socket_path))
@@ -0,0 +1,403 @@
+"""
+FeaVar sessions
+
+A FeaVarSession is the library interface of FeaVar for long running processes: it loads an
+alignment once, resolves the reference sequence and its coordinate map once, and then runs any
+number of analyses (single features, feature batches, scans, metadata associations) against them.
+
+    session = FeaVarSession("alignment.clw", reference_identifier="CY021716", output_dir="results")
+
+    df_by_variant_type, df_starter = session.variant_types("124-142")
+    results = session.batch({"site_a": "H25, H45, V46", "site_b": "100-110"})
+
+Sessions hold no module state: every analysis gets its own RunContext (its output directory and run
+recorder), so analyses can run concurrently in threads. The alignment, the reference and the
+metadata tables are loaded once under a lock and only read afterwards; the results of the most
+recently used features are kept in a small cache and handed out as copies. Every feature writes
+to its own sub-directory of the session output directory (and analyses writing to the same
+directory take turns), so concurrent analyses never overwrite each other's tables.
+
+"""
+
+import collections
+import os
+import threading
+
+try:
+    from FeaVar import FeaVar, columnar, epitope, instrumentation
+    from FeaVar.alignment_matrix import as_alignment_matrix
+    from FeaVar.coordinate_map import CoordinateMap
+except ImportError:  # run as a script from inside the package directory
+    import FeaVar
+    import columnar
+    import epitope
+    import instrumentation
+    from alignment_matrix import as_alignment_matrix
+    from coordinate_map import CoordinateMap
+
+SESSION_ENGINES = ["numpy", "python"]
+
+
+class FeaVarSession:
+    """
+    An alignment and reference loaded once, shared by thread safe analyses.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the alignment
+
+    alignment_format : string
+        The format of the alignment, default is clustal; fvaln for a FeaVar binary alignment
+
+    reference_identifier : string
+        The identifier (accession, gid) of the reference sequence; needed by every analysis of positions
+
+    output_dir : string
+        The directory the results are written to, one sub-directory per feature; default is output/
+        in the working directory
+
+    output_format : string
+        csv, or parquet or feather for a columnar dataset (see columnar)
+
+    output_tables : list
+        The derived tables written in a columnar format (see columnar.DERIVED_TABLES)
+
+    engine : string
+        The feature extraction engine, numpy (default) or python
+
+    processes : int
+        The number of worker processes of the numpy engine and of rendering plots
+
+    binary_cache : bool
+        Convert a text alignment to a .fvaln binary file next to it on first use (see load_alignment)
+
+    cache_size : int
+        The number of feature results kept in memory
+
+    log_level : string
+        debug also writes the per sequence assignment tables
+    """
+
+    def __init__(self, alignment_file_path: str, alignment_format: str = "clustal", reference_identifier: str = None,
+                 output_dir: str = None, output_format: str = "csv", output_tables: list = (), engine: str = "numpy",
+                 processes: int = 1, binary_cache: bool = False, cache_size: int = 32, log_level: str = "info"):
+
+        if engine not in SESSION_ENGINES:
+            raise ValueError("Sessions support the {} engines, not {}".format(" and ".join(SESSION_ENGINES), engine))
+
+        if output_format not in columnar.OUTPUT_FORMATS:
+            raise ValueError("Unknown output format: {}".format(output_format))
+
+        if output_format != "csv":
+            columnar.require_pyarrow()
+
+        self.alignment_file_path = alignment_file_path
+        self.alignment_format = alignment_format
+        self.reference_identifier = reference_identifier
+        self.output_dir = os.path.abspath(output_dir or os.path.join(os.getcwd(), "output"))
+        self.output_format = output_format
+        self.output_tables = list(output_tables)
+        self.engine = engine
+        self.processes = processes
+        self.binary_cache = binary_cache
+        self.cache_size = cache_size
+        self.log_level = log_level
+
+        self._lock = threading.RLock()
+        self._output_locks = collections.defaultdict(threading.Lock)
+        self._alignment = None
+        self._reference_sequence = None
+        self._coordinate_map = None
+        self._results = collections.OrderedDict()
+        self._metadata = {}
+
+    @property
+    def alignment(self):
+        """
+        The alignment, loaded on first use; an AlignmentMatrix with the numpy engine.
+        """
+
+        with self._lock:
+
+            if self._alignment is None:
+
+                alignment = FeaVar.load_alignment(self.alignment_file_path, self.alignment_format, self.binary_cache)
+
+                if self.engine == "numpy":
+                    alignment = as_alignment_matrix(alignment)
+                    # build the identifier index now, not in the first concurrent lookups
+                    alignment.id_index
+
+                self._alignment = alignment
+
+            return self._alignment
+
+    @property
+    def reference_sequence(self) -> str:
+        """
+        The aligned reference sequence; raises ValueError if the reference identifier is not in the alignment.
+        """
+
+        with self._lock:
+
+            if self._reference_sequence is None:
+
+                if self.reference_identifier is None:
+                    raise ValueError("The session has no reference identifier")
+
+                found, reference_sequence = FeaVar.check_for_ref_seq_in_alignment(self.reference_identifier,
+                                                                                  self.alignment)
+
+                if not found:
+                    raise ValueError("No reference identifier found: {}".format(self.reference_identifier))
+
+                self._reference_sequence = reference_sequence
+
+            return self._reference_sequence
+
+    @property
+    def coordinate_map(self) -> CoordinateMap:
+        """
+        The coordinate map of the reference sequence.
+        """
+
+        with self._lock:
+
+            if self._coordinate_map is None:
+                self._coordinate_map = CoordinateMap(self.reference_sequence)
+
+            return self._coordinate_map
+
+    def correct_positions(self, positions: str) -> list:
+        """
+        Validates positions (--positions or IEDB syntax) against the reference and maps them to the
+        alignment columns of the validated residues (see feature_columns).
+
+        Raises
+        ------
+        ValueError
+            If a position lies outside the reference or names a residue the reference does not have
+        """
+
+        validation = epitope.validate_epitope(self.reference_sequence, positions)
+
+        if not validation["valid"]:
+            raise ValueError("Positions do not match the reference sequence: {}".format(validation["diagnostic"]))
+
+        return FeaVar.feature_columns(self.reference_sequence, FeaVar.parse_position_input(positions),
+                                      self.coordinate_map)
+
+    def context(self, output_dir: str, progress=None) -> FeaVar.RunContext:
+        """
+        A new RunContext (own recorder) of one analysis writing to output_dir.
+        """
+
+        return FeaVar.RunContext(output_dir, self.output_format, self.output_tables,
+                                 instrumentation.RunRecorder(FeaVar.__version__, progress))
+
+    def feature_output_dir(self, feature: str) -> str:
+        """
+        The output sub-directory of a feature.
+        """
+
+        return os.path.join(self.output_dir, FeaVar.feature_file_label(feature))
+
+    def _output_lock(self, output_dir: str) -> threading.Lock:
+
+        with self._lock:
+            return self._output_locks[os.path.abspath(output_dir)]
+
+    def _cached(self, key):
+
+        with self._lock:
+
+            if key not in self._results:
+                return None
+
+            self._results.move_to_end(key)
+            df_by_variant_type, df_starter = self._results[key]
+
+        return df_by_variant_type.copy(), df_starter.copy()
+
+    def _cache(self, key, df_by_variant_type, df_starter):
+
+        with self._lock:
+
+            self._results[key] = (df_by_variant_type.copy(), df_starter.copy())
+            self._results.move_to_end(key)
+
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def variant_types(self, positions: str, feature: str = None, output_dir: str = None, progress=None) -> tuple:
+        """
+        Types every sequence by one sequence feature and writes its tables.
+
+        Parameters
+        ----------
+        positions : string
+            The positions of the feature (--positions or IEDB syntax)
+
+        feature : string
+            The name of the feature; default is a label of the positions
+
+        output_dir : string
+            The directory of the tables; default is the feature's sub-directory of the session output directory
+
+        progress : callable
+            Called with (stage, done, total) by long running stages
+
+        Returns
+        -------
+        A tuple of the variant type count table and the accession to variant type table
+        """
+
+        corrected_positions = self.correct_positions(positions)
+        feature = feature or columnar.positions_label(FeaVar.parse_position_input(positions))
+        output_dir = output_dir or self.feature_output_dir(feature)
+
+        key = (tuple(corrected_positions), output_dir)
+
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        with self._output_lock(output_dir):
+
+            df_by_variant_type, df_starter = FeaVar.compute_variant_types(self.alignment_file_path,
+                                                                          self.alignment_format, corrected_positions,
+                                                                          self.log_level, alignment=self.alignment,
+                                                                          engine=self.engine,
+                                                                          processes=self.processes, feature=feature,
+                                                                          context=self.context(output_dir, progress))
+
+        if df_by_variant_type is None:
+            raise ValueError("Could not type the sequences by {}".format(feature))
+
+        self._cache(key, df_by_variant_type, df_starter)
+
+        return df_by_variant_type.copy(), df_starter.copy()
+
+    def batch(self, features: dict, output_dir: str = None, progress=None) -> dict:
+        """
+        Types every sequence by many sequence features in one pass over the alignment.
+
+        Parameters
+        ----------
+        features : dict
+            Feature names to their positions (--positions or IEDB syntax); features that do not match the
+            reference are skipped with a warning
+
+        output_dir : string
+            The directory of the tables; default is the session output directory
+
+        progress : callable
+            Called with (stage, done, total) by long running stages
+
+        Returns
+        -------
+        A dictionary of feature names to (df_by_variant_type, df_starter)
+        """
+
+        import logging
+
+        validation = epitope.validate_epitopes(self.reference_sequence, features)
+
+        checked_features = {}
+
+        for name, positions in features.items():
+
+            if not validation.at[name, "valid"]:
+                logging.warning("Skipping feature %s: %s", name, validation.at[name, "diagnostic"] or "no positions")
+                continue
+
+            checked_features[name] = FeaVar.feature_columns(self.reference_sequence,
+                                                            FeaVar.parse_position_input(positions),
+                                                            self.coordinate_map)
+
+        output_dir = output_dir or self.output_dir
+
+        with self._output_lock(output_dir):
+
+            return FeaVar.compute_feature_batch(self.alignment_file_path, self.alignment_format, checked_features,
+                                                self.log_level, alignment=self.alignment, engine=self.engine,
+                                                context=self.context(output_dir, progress))
+
+    def count_variant_types(self, features: dict) -> dict:
+        """
+        Counts the sequences per variant type of many features in one pass over the alignment, without
+        writing anything.
+
+        Parameters
+        ----------
+        features : dict
+            Feature names to their alignment columns (see correct_positions)
+
+        Returns
+        -------
+        A dictionary of feature names to their variant type count tables (variant_type, count, VT)
+        """
+
+        feature_tables = FeaVar.extract_feature_batch(self.alignment, features, self.engine)
+
+        return {name: FeaVar.count_seqs_per_variant_type(df_feature, None) for name, df_feature in
+                feature_tables.items()}
+
+    def scan(self, window_size: int, step: int = 1):
+        """
+        The variant type diversity of every window of window_size reference positions (see scan_variant_types).
+        """
+
+        return FeaVar.scan_variant_types(self.alignment, self.reference_sequence, window_size, step)
+
+    def metadata(self, metadata_file_path: str, fields: list = None):
+        """
+        The metadata of the sequences of the alignment, read once per file (and its modification time) and fields;
+        in columnar output the metadata table is written to the session output directory when it is read.
+        """
+
+        key = (os.path.abspath(metadata_file_path), os.path.getmtime(metadata_file_path),
+               tuple(fields) if fields else None)
+
+        with self._lock:
+
+            if key not in self._metadata:
+                accessions = as_alignment_matrix(self.alignment).ids if self.engine == "numpy" else \
+                    [record.id for record in self.alignment]
+                self._metadata[key] = FeaVar.import_metadata(metadata_file_path, fields, accessions=accessions,
+                                                             context=self.context(self.output_dir))
+
+            return self._metadata[key]
+
+    def associations(self, positions: str, metadata_file_path: str, fields: list = None) -> tuple:
+        """
+        Tests the association of the variant types of a feature with the metadata fields (see compute_associations).
+
+        Returns
+        -------
+        The per field and the per VT and value test tables
+        """
+
+        df_by_variant_type, df_starter = self.variant_types(positions)
+        df_metadata = self.metadata(metadata_file_path, fields)
+        df_all_data = FeaVar.join_metadata(df_starter, df_metadata)
+
+        return FeaVar.compute_associations(df_all_data, df_by_variant_type, list(df_all_data.columns[2:]))
+
+    def process_metadata(self, positions: str, metadata_file_path: str, top: int = 10, fields: list = None,
+                         statistics: bool = False, feature: str = None, output_dir: str = None, progress=None):
+        """
+        Types the sequences by a feature, joins the metadata and plots the top variant types by every
+        field (see process_metadata) into the feature's output directory.
+        """
+
+        feature = feature or columnar.positions_label(FeaVar.parse_position_input(positions))
+        output_dir = output_dir or self.feature_output_dir(feature)
+
+        df_by_variant_type, df_starter = self.variant_types(positions, feature, output_dir, progress)
+
+        with self._output_lock(output_dir):
+
+            FeaVar.process_metadata(metadata_file_path, df_by_variant_type, df_starter, top, self.log_level, fields,
+                                    self.processes, statistics, feature, context=self.context(output_dir, progress))
@@ -0,0 +1,424 @@
+"""
+FeaVar streaming feature extraction
+
+This module extracts sequence features straight from an aligned FASTA or Clustal/MUSCLE file
+without building SeqRecords for the whole alignment.
+
+Aligned FASTA is read one record at a time, so memory is bounded by one sequence plus the
+variant type counts. Interleaved Clustal files spread every sequence over many blocks; only
+the residues of the feature columns are kept for each sequence, blocks that hold none of the
+feature columns are skipped without being split, and reading stops after the last block that
+holds a feature column.
+
+The reference sequence is resolved like in the non-streaming path (see id_index): the identifiers
+are read first, the best matching tier wins and an ambiguous reference is reported, not guessed.
+
+"""
+
+import collections
+import csv
+import logging
+import operator
+
+try:
+    from FeaVar.id_index import SequenceIdIndex
+except ImportError:  # run as a script from inside the package directory
+    from id_index import SequenceIdIndex
+
+CLUSTAL_HEADERS = ["CLUSTAL", "PROBCONS", "MUSCLE", "MSAPROBS", "Kalign", "Biopython"]
+
+STREAM_FORMATS = ["fasta", "clustal"]
+
+# the number of sequences between progress reports
+PROGRESS_INTERVAL = 100000
+
+
+def _check_columns(columns: list) -> list:
+
+    columns = [int(column) for column in columns]
+
+    if not columns:
+        raise ValueError("No sequence feature positions given.")
+
+    if min(columns) < 0:
+        raise ValueError("Streaming feature extraction needs non-negative column indices.")
+
+    return columns
+
+
+def _residue_getter(offsets: list):
+    """
+    An itemgetter that always returns a tuple, even for a single offset.
+    """
+
+    if len(offsets) == 1:
+        offset = offsets[0]
+        return lambda sequence: (sequence[offset],)
+
+    return operator.itemgetter(*offsets)
+
+
+def iter_fasta_records(alignment_file_path: str):
+    """
+    Yields (identifier, aligned sequence) pairs of a FASTA file, one record at a time.
+    The identifier is the first word of the header, as in Bio.SeqIO.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the aligned FASTA file
+    """
+
+    with open(alignment_file_path) as handle:
+
+        identifier = None
+        sequence_lines = []
+
+        for line in handle:
+
+            if line.startswith(">"):
+
+                if identifier is not None:
+                    yield identifier, "".join(sequence_lines)
+
+                title = line[1:].strip()
+                identifier = title.split(None, 1)[0] if title else ""
+                sequence_lines = []
+
+            elif identifier is not None:
+
+                sequence_lines.append(line.strip().replace(" ", ""))
+
+        if identifier is not None:
+            yield identifier, "".join(sequence_lines)
+
+
+def iter_fasta_ids(alignment_file_path: str):
+    """
+    Yields the identifiers of a FASTA file without joining any sequence.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the aligned FASTA file
+    """
+
+    with open(alignment_file_path) as handle:
+
+        for line in handle:
+
+            if line.startswith(">"):
+                title = line[1:].strip()
+                yield title.split(None, 1)[0] if title else ""
+
+
+def stream_fasta_features(alignment_file_path: str, columns: list):
+    """
+    Yields (accession, feature substring) pairs from an aligned FASTA file.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the aligned FASTA file
+
+    columns : list
+        The alignment column indices of the sequence feature
+    """
+
+    getter = _residue_getter(_check_columns(columns))
+
+    for identifier, sequence in iter_fasta_records(alignment_file_path):
+        yield identifier, "".join(getter(sequence))
+
+
+def _iter_clustal_blocks(handle):
+    """
+    Yields the sequence lines of each block of a Clustal file (header already consumed),
+    leaving out blank and consensus lines.
+    """
+
+    block = []
+
+    for line in handle:
+
+        if not line.strip() or line[0] == " ":
+
+            if block:
+                yield block
+                block = []
+
+            continue
+
+        if not block and line.split(None, 1)[0] in CLUSTAL_HEADERS:
+            # a second, concatenated alignment; like AlignIO.read only the first one is used
+            return
+
+        block.append(line)
+
+    if block:
+        yield block
+
+
+def stream_clustal_features(alignment_file_path: str, columns: list):
+    """
+    Yields (accession, feature substring) pairs from an interleaved Clustal/MUSCLE alignment.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the Clustal alignment
+
+    columns : list
+        The alignment column indices of the sequence feature
+    """
+
+    columns = _check_columns(columns)
+    last_column = max(columns)
+
+    ids = []
+    features = []
+    filled = 0
+    block_start = 0
+
+    with open(alignment_file_path) as handle:
+
+        header = handle.readline()
+
+        if not header.strip() or header.split(None, 1)[0] not in CLUSTAL_HEADERS:
+            raise ValueError("Not a Clustal alignment: {}".format(alignment_file_path))
+
+        for block in _iter_clustal_blocks(handle):
+
+            first_id, first_sequence = block[0].split()[:2]
+            width = len(first_sequence)
+            sequence_start = len(first_id) + block[0][len(first_id):].find(first_sequence)
+
+            if not ids:
+                ids = [line.split(None, 1)[0] for line in block]
+                features = [[""] * len(columns) for _ in ids]
+
+            elif len(block) != len(ids):
+                raise ValueError("Block at column {} has {} sequences, expected {}".format(
+                    block_start, len(block), len(ids)))
+
+            wanted = [(slot, sequence_start + column - block_start) for slot, column in enumerate(columns)
+                      if block_start <= column < block_start + width]
+
+            if wanted:
+
+                slots = [slot for slot, _ in wanted]
+                getter = _residue_getter([offset for _, offset in wanted])
+
+                for row, line in enumerate(block):
+
+                    if line.split(None, 1)[0] != ids[row]:
+                        raise ValueError("Identifiers out of order? Got '{}' but expected '{}'".format(
+                            line.split(None, 1)[0], ids[row]))
+
+                    feature = features[row]
+                    for slot, residue in zip(slots, getter(line)):
+                        feature[slot] = residue
+
+                filled += len(wanted)
+
+            block_start += width
+
+            if block_start > last_column:
+                break
+
+    if filled < len(columns):
+        raise IndexError("Sequence feature column {} is beyond the end of the alignment".format(last_column))
+
+    for identifier, feature in zip(ids, features):
+        yield identifier, "".join(feature)
+
+
+def stream_features(alignment_file_path: str, alignment_format: str, columns: list):
+    """
+    Yields (accession, feature substring) pairs without loading the whole alignment.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the alignment
+
+    alignment_format : string
+        The format of the alignment, fasta or clustal
+
+    columns : list
+        The alignment column indices of the sequence feature
+    """
+
+    if alignment_format == "fasta":
+        return stream_fasta_features(alignment_file_path, columns)
+
+    if alignment_format == "clustal":
+        return stream_clustal_features(alignment_file_path, columns)
+
+    raise ValueError("Streaming supports {} alignments, not {}".format(" and ".join(STREAM_FORMATS),
+                                                                         alignment_format))
+
+
+def stream_variant_type_counts(alignment_file_path: str, alignment_format: str, columns: list,
+                               assignments_handle=None, progress=None) -> collections.Counter:
+    """
+    Counts the sequences per variant type on the fly.
+
+    Parameters
+    ----------
+    alignment_file_path : string
+        The file path of the alignment
+
+    alignment_format : string
+        The format of the alignment, fasta or clustal
+
+    columns : list
+        The alignment column indices of the sequence feature
+
+    assignments_handle :
+        An open text file; when given, the variant type of every sequence is written to it as CSV
+        (index, accession, variant_type) as it is extracted
+
+    progress : callable
+        Called with the number of sequences read so far every PROGRESS_INTERVAL sequences and at the end
+
+    Returns
+    -------
+    A Counter of variant types to the number of sequences
+    """
+
+    counts = collections.Counter()
+
+    writer = None
+    if assignments_handle is not None:
+        writer = csv.writer(assignments_handle, lineterminator="\n")
+        writer.writerow(["", "accession", "variant_type"])
+
+    row = -1
+
+    for row, (accession, variant_type) in enumerate(stream_features(alignment_file_path, alignment_format, columns)):
+
+        counts[variant_type] += 1
+
+        if writer is not None:
+            writer.writerow([row, accession, variant_type])
+
+        if progress is not None and (row + 1) % PROGRESS_INTERVAL == 0:
+            progress(row + 1)
+
+    if progress is not None:
+        progress(row + 1)
+
+    return counts
+
+
+def _reference_row(reference_identifier: str, ids: list):
+    """
+    The row of the reference sequence among the identifiers, or None if it is missing or ambiguous.
+    """
+
+    match = SequenceIdIndex(ids).lookup(reference_identifier)
+
+    if match.row is None:
+
+        if match.candidates:
+            logging.error("Reference identifier %s is ambiguous (%s match), it matches: %s",
+                          reference_identifier, match.match, ", ".join(match.candidates))
+
+        return None
+
+    if match.match != "exact":
+        logging.info("Reference identifier %s resolved to %s (%s match)", reference_identifier, match.sequence_id,
+                     match.match)
+
+    return match.row
+
+
+def stream_reference_sequence(reference_identifier: str, alignment_file_path: str, alignment_format: str,
+                              n_residues: int = None):
+    """
+    Finds the reference sequence, matching its identifier like the non-streaming path (see id_index).
+
+    Parameters
+    ----------
+    reference_identifier : string
+        The identifier (accession, gid) of the reference sequence
+
+    alignment_file_path : string
+        The file path of the alignment
+
+    alignment_format : string
+        The format of the alignment, fasta or clustal
+
+    n_residues : int
+        Stop reading a Clustal file after the block holding this (ungapped) reference residue, e.g. the
+        last feature position; the reference sequence is then cut after that block. Default: read it all
+
+    Returns
+    -------
+    A tuple of whether the reference was found (and is not ambiguous) and the aligned reference sequence
+    """
+
+    if alignment_format == "fasta":
+
+        reference_row = _reference_row(reference_identifier, list(iter_fasta_ids(alignment_file_path)))
+
+        if reference_row is None:
+            return False, ""
+
+        for row, (identifier, sequence) in enumerate(iter_fasta_records(alignment_file_path)):
+            if row == reference_row:
+                return True, sequence
+
+        return False, ""
+
+    if alignment_format != "clustal":
+        raise ValueError("Streaming supports {} alignments, not {}".format(" and ".join(STREAM_FORMATS),
+                                                                             alignment_format))
+
+    ids = None
+    reference_row = None
+    pieces = []
+    block_start = 0
+    found = 0
+
+    with open(alignment_file_path) as handle:
+
+        header = handle.readline()
+
+        if not header.strip() or header.split(None, 1)[0] not in CLUSTAL_HEADERS:
+            raise ValueError("Not a Clustal alignment: {}".format(alignment_file_path))
+
+        for block in _iter_clustal_blocks(handle):
+
+            # every sequence is named in the first block
+            if ids is None:
+
+                ids = [line.split(None, 1)[0] for line in block]
+                reference_row = _reference_row(reference_identifier, ids)
+
+                if reference_row is None:
+                    return False, ""
+
+            elif len(block) != len(ids):
+                raise ValueError("Block at column {} has {} sequences, expected {}".format(
+                    block_start, len(block), len(ids)))
+
+            identifier, piece = block[reference_row].split()[:2]
+
+            if identifier != ids[reference_row]:
+                raise ValueError("Identifiers out of order? Got '{}' but expected '{}'".format(
+                    identifier, ids[reference_row]))
+
+            pieces.append(piece)
+            block_start += len(piece)
+
+            if n_residues is not None:
+
+                found += len(piece) - piece.count("-")
+
+                # the blocks after the last residue asked for are not read
+                if found >= n_residues:
+                    break
+
+    return True, "".join(pieces)
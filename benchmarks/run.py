@@ -0,0 +1,310 @@
+"""
+FeaVar benchmarks
+
+Times every stage of the pipeline on its own and the whole command line run, on synthetic
+alignments (see synthetic.py), and records the wall time and the peak resident memory of each.
+
+Every stage runs in a fresh process: the inputs of the stage are prepared (not timed), then the
+stage is timed; the peak RSS reported is that of the process, so it includes the stage inputs.
+
+    python -m benchmarks.run                              # the small preset
+    python -m benchmarks.run --preset large -o results.json
+    python -m benchmarks.run --sequences 100000 --columns 2000 --stages extraction,counting
+    python -m benchmarks.run --baseline old.json          # exit status 1 on a regression
+
+Stages:
+
+    parse           parse the FASTA alignment with Biopython and build the alignment matrix
+    parse_fvaln     memory map the binary .fvaln alignment
+    lookup          index the sequence identifiers and find the reference sequence
+    coordinate_map  build the coordinate map of the reference and map the feature positions
+    extraction      extract the sequence feature of every sequence (numpy engine)
+    counting        count and number the variant types
+    metadata_join   import the metadata and join it to the assignments
+    plotting        aggregate and render the plots of every metadata field
+    end_to_end      the FeaVar.py command line with metadata, on the FASTA alignment
+
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PRESETS = {
+    "smoke": [(1000, 300)],
+    "small": [(1000, 300), (10000, 2000), (100000, 2000)],
+    "large": [(100000, 2000), (1000000, 2000), (1000000, 20000)],
+    "huge": [(5000000, 2000), (5000000, 20000)],
+}
+
+STAGES = ["parse", "parse_fvaln", "lookup", "coordinate_map", "extraction", "counting", "metadata_join", "plotting",
+          "end_to_end"]
+
+FEAVAR_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FeaVar", "FeaVar.py")
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """
+    The peak resident set size of this process (or of its finished children) in MB.
+    """
+
+    peak = resource.getrusage(who).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def _assignments(FeaVar, paths: dict, synthetic):
+
+    from FeaVar.coordinate_map import CoordinateMap
+
+    alignment_matrix = FeaVar.load_alignment(paths["fvaln"], "fvaln")
+    columns = CoordinateMap(synthetic.reference_sequence()).to_columns(synthetic.feature_positions()).tolist()
+
+    return alignment_matrix, columns, FeaVar.extract_variant_types(alignment_matrix, columns)
+
+
+def run_stage(stage: str, paths: dict, n_sequences: int, n_columns: int, seed: int, work_dir: str) -> dict:
+    """
+    Prepares the inputs of one stage, times it and returns the seconds and the peak RSS (MB).
+    """
+
+    from benchmarks.synthetic import REFERENCE_ID, SyntheticAlignment
+    from FeaVar import FeaVar, plotting
+    from FeaVar.coordinate_map import CoordinateMap
+
+    synthetic = SyntheticAlignment(n_sequences, n_columns, seed)
+    positions = synthetic.feature_positions()
+
+    FeaVar.output_dir = work_dir
+
+    if stage == "parse":
+
+        start = time.perf_counter()
+        FeaVar.as_alignment_matrix(FeaVar.load_alignment(paths["fasta"], "fasta"))
+
+    elif stage == "parse_fvaln":
+
+        start = time.perf_counter()
+        alignment_matrix = FeaVar.load_alignment(paths["fvaln"], "fvaln")
+        # touch every page of the memory map
+        int(alignment_matrix.matrix.sum(dtype="uint64"))
+
+    elif stage == "lookup":
+
+        alignment_matrix = FeaVar.load_alignment(paths["fvaln"], "fvaln")
+
+        start = time.perf_counter()
+        FeaVar.check_for_ref_seq_in_alignment(REFERENCE_ID, alignment_matrix)
+
+    elif stage == "coordinate_map":
+
+        reference_sequence = synthetic.reference_sequence()
+
+        start = time.perf_counter()
+        CoordinateMap(reference_sequence).to_aligned(positions)
+
+    elif stage == "extraction":
+
+        alignment_matrix = FeaVar.load_alignment(paths["fvaln"], "fvaln")
+        columns = CoordinateMap(synthetic.reference_sequence()).to_columns(positions).tolist()
+
+        start = time.perf_counter()
+        FeaVar.extract_variant_types(alignment_matrix, columns)
+
+    elif stage == "counting":
+
+        _, _, df_starter = _assignments(FeaVar, paths, synthetic)
+
+        start = time.perf_counter()
+        FeaVar.count_seqs_per_variant_type(df_starter, "benchmark")
+
+    elif stage == "metadata_join":
+
+        _, _, df_starter = _assignments(FeaVar, paths, synthetic)
+
+        start = time.perf_counter()
+        FeaVar.join_metadata(df_starter, FeaVar.import_metadata(paths["metadata"], accessions=df_starter["accession"]))
+
+    elif stage == "plotting":
+
+        _, _, df_starter = _assignments(FeaVar, paths, synthetic)
+        df_by_variant_type = FeaVar.count_seqs_per_variant_type(df_starter, "benchmark")
+        df_metadata = FeaVar.import_metadata(paths["metadata"], accessions=df_starter["accession"])
+        df_all_data = FeaVar.join_variant_type_table(FeaVar.join_metadata(df_starter, df_metadata), df_by_variant_type)
+        df_top = FeaVar.select_var_types_to_plot(df_all_data, 10)
+
+        start = time.perf_counter()
+        plotting.plot_fields(df_top, list(df_metadata.columns.drop("accession")), work_dir)
+
+    elif stage == "end_to_end":
+
+        command = [sys.executable, FEAVAR_SCRIPT, "-a", paths["fasta"], "-f", "fasta", "-r", REFERENCE_ID,
+                   "-p", ",".join(str(position) for position in positions), "-m", paths["metadata"], "-log", "info"]
+
+        start = time.perf_counter()
+        subprocess.run(command, cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+
+        return {"seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+    else:
+        raise ValueError("Unknown benchmark stage: {}".format(stage))
+
+    return {"seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+
+
+def _run_stage_in_process(arguments: tuple) -> dict:
+
+    stage, paths, n_sequences, n_columns, seed = arguments
+
+    work_dir = tempfile.mkdtemp(prefix="feavar_benchmark_")
+
+    try:
+        return run_stage(stage, paths, n_sequences, n_columns, seed, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_benchmarks(sizes: list, stages: list, data_dir: str, repeat: int = 3, seed: int = 0) -> list:
+    """
+    Runs every stage for every (sequences, columns) size, each repetition in a fresh process.
+
+    Returns
+    -------
+    A list of result dictionaries: sequences, columns, stage, seconds (the median), min_seconds and peak_rss_mb
+    """
+
+    from benchmarks.synthetic import generate_files
+
+    # spawn: every stage starts from a clean interpreter, so the peak RSS is the stage's own
+    context = multiprocessing.get_context("spawn")
+
+    results = []
+
+    for n_sequences, n_columns in sizes:
+
+        print("Generating {:,} sequences x {:,} columns".format(n_sequences, n_columns), file=sys.stderr)
+        paths = generate_files(n_sequences, n_columns, data_dir, seed)
+
+        for stage in stages:
+
+            timings = []
+
+            for _ in range(repeat):
+                with context.Pool(1) as pool:
+                    timings.append(pool.apply(_run_stage_in_process, ((stage, paths, n_sequences, n_columns, seed),)))
+
+            seconds = [timing["seconds"] for timing in timings]
+
+            result = {"sequences": n_sequences, "columns": n_columns, "stage": stage,
+                      "seconds": statistics.median(seconds), "min_seconds": min(seconds),
+                      "peak_rss_mb": max(timing["peak_rss_mb"] for timing in timings)}
+            results.append(result)
+
+            print("{sequences:>9,d} x {columns:>6,d}  {stage:<15}{seconds:>10.3f} s{peak_rss_mb:>10.1f} MB".format(
+                **result), file=sys.stderr)
+
+    return results
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    The results that are slower (or use more memory) than the baseline by more than threshold (a fraction).
+    """
+
+    known = {(entry["sequences"], entry["columns"], entry["stage"]): entry for entry in baseline}
+
+    regressions = []
+
+    for result in results:
+
+        before = known.get((result["sequences"], result["columns"], result["stage"]))
+
+        if before is None:
+            continue
+
+        for measure in ["seconds", "peak_rss_mb"]:
+            if before[measure] > 0 and result[measure] > before[measure] * (1 + threshold):
+                regressions.append(dict(result, measure=measure, baseline=before[measure],
+                                        ratio=result[measure] / before[measure]))
+
+    return regressions
+
+
+def environment() -> dict:
+    """
+    The versions the benchmark ran with.
+    """
+
+    import numpy
+    import pandas
+
+    from FeaVar import FeaVar
+
+    return {"feavar": FeaVar.__version__, "python": platform.python_version(), "numpy": numpy.__version__,
+            "pandas": pandas.__version__, "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Benchmark the FeaVar pipeline on synthetic alignments.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small",
+                        help="The alignment sizes to run (default=small).")
+    parser.add_argument("--sequences", type=str,
+                        help="Comma separated numbers of sequences; overrides the preset (with --columns).")
+    parser.add_argument("--columns", type=str, default="2000",
+                        help="Comma separated alignment lengths, with --sequences (default=2000).")
+    parser.add_argument("--stages", type=str, default=",".join(STAGES),
+                        help="Comma separated stages to run (default: all).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported (default=3).")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the synthetic data (default=0).")
+    parser.add_argument("--data_dir", type=str, default=os.path.join(tempfile.gettempdir(), "feavar_benchmarks"),
+                        help="Where the synthetic alignments are written and reused.")
+    parser.add_argument("-o", "--output", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=str, help="Compare with the results JSON of an earlier run.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="The slowdown (fraction) reported as a regression (default=0.2).")
+    arguments = parser.parse_args(argv)
+
+    if arguments.sequences:
+        sizes = [(int(n_sequences), int(n_columns)) for n_sequences in arguments.sequences.split(",")
+                 for n_columns in arguments.columns.split(",")]
+    else:
+        sizes = PRESETS[arguments.preset]
+
+    stages = [stage.strip() for stage in arguments.stages.split(",") if stage.strip()]
+
+    unknown_stages = set(stages) - set(STAGES)
+    if unknown_stages:
+        parser.error("unknown stages: {}".format(", ".join(sorted(unknown_stages))))
+
+    results = run_benchmarks(sizes, stages, arguments.data_dir, arguments.repeat, arguments.seed)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump({"environment": environment(), "results": results}, output_file, indent=1)
+
+    if not arguments.baseline:
+        return 0
+
+    with open(arguments.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file)["results"], arguments.threshold)
+
+    for regression in regressions:
+        print("REGRESSION {sequences:,d} x {columns:,d} {stage} {measure}: {baseline:.3f} -> {0:.3f} ({ratio:.2f}x)"
+              .format(regression[regression["measure"]], **regression), file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,298 @@
+"""
+Synthetic alignments and metadata for the FeaVar benchmarks
+
+The generator builds an alignment that looks enough like a viral gene alignment to exercise
+every stage of the pipeline: a reference sequence with insertion columns (gaps in the
+reference), sequences descending from a few clades with a skewed (Zipf) size distribution,
+point mutations, and partial sequences with leading gaps. Metadata fields are correlated with
+the clades so the association statistics have something to find.
+
+Everything is drawn from numpy generators seeded with (seed, block), so the same seed, size and
+block size always give byte-identical files, and large alignments are written block by block
+without holding the whole alignment in memory.
+
+"""
+
+import os
+
+import numpy
+
+ALPHABETS = {"protein": b"ACDEFGHIKLMNPQRSTVWY", "nucleotide": b"ACGT"}
+
+GAP = ord("-")
+
+# sequences generated (and written) at a time
+BLOCK_SIZE = 10000
+
+REFERENCE_ID = "REF00000000"
+
+_HOSTS = ["human", "avian", "swine", "equine", "canine"]
+
+
+class SyntheticAlignment:
+    """
+    The recipe of a synthetic alignment; rows are generated on demand.
+
+    Parameters
+    ----------
+    n_sequences : int
+        The number of sequences, the reference included
+
+    n_columns : int
+        The alignment length
+
+    seed : int
+        The random seed
+
+    alphabet : string
+        protein or nucleotide
+
+    n_clades : int
+        The number of clades the sequences descend from
+
+    mutation_rate : float
+        The probability of a point mutation per residue, against the clade consensus
+
+    insertion_rate : float
+        The fraction of columns that are gaps in the reference (insertions in other sequences)
+
+    partial_rate : float
+        The fraction of sequences that start with a run of gaps
+    """
+
+    def __init__(self, n_sequences: int, n_columns: int, seed: int = 0, alphabet: str = "protein",
+                 n_clades: int = 50, mutation_rate: float = 0.002, insertion_rate: float = 0.02,
+                 partial_rate: float = 0.1):
+
+        self.n_sequences = n_sequences
+        self.n_columns = n_columns
+        self.seed = seed
+        self.alphabet = numpy.frombuffer(ALPHABETS[alphabet], dtype=numpy.uint8)
+        self.mutation_rate = mutation_rate
+        self.partial_rate = partial_rate
+
+        rng = numpy.random.default_rng([seed, 0xFEA])
+
+        reference = self.alphabet[rng.integers(0, len(self.alphabet), n_columns)]
+
+        self.insertion_columns = numpy.flatnonzero(rng.random(n_columns) < insertion_rate)
+
+        # clade consensus sequences: the reference with 1% of the residues changed
+        clades = numpy.repeat(reference[None, :], n_clades, axis=0)
+        changed = rng.random(clades.shape) < 0.01
+        clades[changed] = self.alphabet[rng.integers(0, len(self.alphabet), int(changed.sum()))]
+        clades[:, self.insertion_columns] = GAP
+        self.clades = clades
+
+        clade_weights = 1.0 / numpy.arange(1, n_clades + 1)
+        self.clade_weights = clade_weights / clade_weights.sum()
+
+        self.reference = reference.copy()
+        self.reference[self.insertion_columns] = GAP
+
+    def ids(self, start: int = 0, stop: int = None) -> list:
+        """
+        The sequence identifiers of rows start .. stop; row 0 is the reference.
+        """
+
+        stop = self.n_sequences if stop is None else stop
+
+        return [REFERENCE_ID if row == 0 else "SYN{:08d}".format(row) for row in range(start, stop)]
+
+    def clade_of(self, start: int, stop: int) -> numpy.ndarray:
+        """
+        The clade of every sequence of rows start .. stop (which must lie in one block).
+        """
+
+        rng = numpy.random.default_rng([self.seed, 1, start // BLOCK_SIZE])
+
+        clades = rng.choice(len(self.clades), BLOCK_SIZE, p=self.clade_weights)
+
+        return clades[start % BLOCK_SIZE:start % BLOCK_SIZE + stop - start]
+
+    def block(self, block_index: int) -> numpy.ndarray:
+        """
+        The residues (a sequences x columns uint8 array) of the rows of one block.
+        """
+
+        start = block_index * BLOCK_SIZE
+        stop = min(start + BLOCK_SIZE, self.n_sequences)
+
+        rng = numpy.random.default_rng([self.seed, 2, block_index])
+
+        rows = self.clades[self.clade_of(start, stop)]
+
+        mutated = rng.random(rows.shape) < self.mutation_rate
+        rows[mutated] = self.alphabet[rng.integers(0, len(self.alphabet), int(mutated.sum()))]
+
+        # a few sequences carry the inserted residues
+        inserted = rng.random((len(rows), len(self.insertion_columns))) < 0.05
+        insertion_residues = self.alphabet[rng.integers(0, len(self.alphabet), inserted.shape)]
+        rows[:, self.insertion_columns] = numpy.where(inserted, insertion_residues, GAP)
+
+        # partial sequences start with up to 5% gaps
+        partial = rng.random(len(rows)) < self.partial_rate
+        starts = numpy.where(partial, rng.integers(1, max(2, self.n_columns // 20), len(rows)), 0)
+        rows[numpy.arange(self.n_columns)[None, :] < starts[:, None]] = GAP
+
+        if start == 0:
+            rows[0] = self.reference
+
+        return rows
+
+    def blocks(self):
+        """
+        Yields (ids, residues) of every block of sequences, in row order.
+        """
+
+        for block_index in range((self.n_sequences + BLOCK_SIZE - 1) // BLOCK_SIZE):
+
+            start = block_index * BLOCK_SIZE
+            stop = min(start + BLOCK_SIZE, self.n_sequences)
+
+            yield self.ids(start, stop), self.block(block_index)
+
+    def matrix(self):
+        """
+        The whole alignment as an AlignmentMatrix.
+        """
+
+        from FeaVar.alignment_matrix import AlignmentMatrix
+
+        ids, rows = [], []
+
+        for block_ids, block_rows in self.blocks():
+            ids.extend(block_ids)
+            rows.append(block_rows)
+
+        return AlignmentMatrix(ids, numpy.concatenate(rows))
+
+    def reference_sequence(self) -> str:
+        """
+        The aligned reference sequence, with the insertion gaps.
+        """
+
+        return self.reference.tobytes().decode("ascii")
+
+    def feature_positions(self, n_positions: int = 20) -> list:
+        """
+        A sequence feature of n_positions ungapped reference positions spread over the reference.
+        """
+
+        n_residues = self.n_columns - len(self.insertion_columns)
+
+        return sorted(set(numpy.linspace(1, n_residues, n_positions + 2)[1:-1].astype(int).tolist()))
+
+
+def write_fasta(synthetic: SyntheticAlignment, file_path: str, line_length: int = 60):
+    """
+    Writes a synthetic alignment as FASTA, block by block.
+    """
+
+    with open(file_path, "wb") as fasta_file:
+
+        for ids, rows in synthetic.blocks():
+
+            for sequence_id, row in zip(ids, rows):
+
+                fasta_file.write(b">" + sequence_id.encode("ascii") + b"\n")
+
+                residues = row.tobytes()
+                for start in range(0, len(residues), line_length):
+                    fasta_file.write(residues[start:start + line_length] + b"\n")
+
+
+def write_clustal(synthetic: SyntheticAlignment, file_path: str, line_length: int = 60):
+    """
+    Writes a synthetic alignment as CLUSTAL (needs the whole alignment in memory).
+    """
+
+    alignment_matrix = synthetic.matrix()
+    width = max(len(sequence_id) for sequence_id in alignment_matrix.ids) + 6
+
+    with open(file_path, "wb") as clustal_file:
+
+        clustal_file.write(b"CLUSTAL W (1.83) multiple sequence alignment\n\n\n")
+
+        for start in range(0, synthetic.n_columns, line_length):
+
+            block = alignment_matrix.matrix[:, start:start + line_length]
+
+            for sequence_id, row in zip(alignment_matrix.ids, block):
+                clustal_file.write(sequence_id.ljust(width).encode("ascii") + row.tobytes() + b"\n")
+
+            clustal_file.write(b"\n\n")
+
+
+def write_metadata(synthetic: SyntheticAlignment, file_path: str, n_extra_fields: int = 0):
+    """
+    Writes tab delimited metadata for the sequences of a synthetic alignment: host (correlated with
+    the clade), year, country and n_extra_fields random fields. One sequence in a hundred has no
+    metadata row.
+    """
+
+    with open(file_path, "w") as metadata_file:
+
+        header = ["accession", "host", "year", "country"] + ["field_{}".format(i) for i in range(n_extra_fields)]
+        metadata_file.write("\t".join(header) + "\n")
+
+        for block_index in range((synthetic.n_sequences + BLOCK_SIZE - 1) // BLOCK_SIZE):
+
+            start = block_index * BLOCK_SIZE
+            stop = min(start + BLOCK_SIZE, synthetic.n_sequences)
+
+            rng = numpy.random.default_rng([synthetic.seed, 3, block_index])
+
+            clades = synthetic.clade_of(start, stop)
+            hosts = numpy.where(rng.random(len(clades)) < 0.8, clades % len(_HOSTS),
+                                rng.integers(0, len(_HOSTS), len(clades)))
+            years = rng.integers(1990, 2024, len(clades))
+            countries = rng.integers(0, 40, len(clades))
+            extra = rng.integers(0, 10, (len(clades), n_extra_fields))
+            present = rng.random(len(clades)) >= 0.01
+
+            for offset, sequence_id in enumerate(synthetic.ids(start, stop)):
+
+                if not present[offset]:
+                    continue
+
+                fields = [sequence_id, _HOSTS[hosts[offset]], str(years[offset]), "C{:02d}".format(countries[offset])]
+                fields.extend("v{}".format(value) for value in extra[offset])
+
+                metadata_file.write("\t".join(fields) + "\n")
+
+
+def generate_files(n_sequences: int, n_columns: int, data_dir: str, seed: int = 0, clustal: bool = False) -> dict:
+    """
+    Writes (or reuses) the FASTA alignment, the .fvaln binary alignment and the metadata of one size.
+
+    Returns
+    -------
+    A dictionary of the file paths (fasta, fvaln, metadata and, if asked for, clustal)
+    """
+
+    from FeaVar import fvaln
+
+    os.makedirs(data_dir, exist_ok=True)
+
+    stem = os.path.join(data_dir, "synthetic_n{}_l{}_s{}".format(n_sequences, n_columns, seed))
+    paths = {"fasta": stem + ".fasta", "fvaln": stem + fvaln.EXTENSION, "metadata": stem + ".tsv"}
+
+    if clustal:
+        paths["clustal"] = stem + ".clw"
+
+    synthetic = SyntheticAlignment(n_sequences, n_columns, seed)
+
+    if not os.path.exists(paths["fasta"]):
+        write_fasta(synthetic, paths["fasta"])
+
+    if not os.path.exists(paths["fvaln"]):
+        fvaln.write_fvaln(synthetic.matrix(), paths["fvaln"], paths["fasta"])
+
+    if not os.path.exists(paths["metadata"]):
+        write_metadata(synthetic, paths["metadata"])
+
+    if clustal and not os.path.exists(paths["clustal"]):
+        write_clustal(synthetic, paths["clustal"])
+
+    return paths
@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from FeaVar import FeaVar
+from FeaVar.alignment_matrix import AlignmentMatrix, group_feature_rows
+
+test_alignment = MultipleSeqAlignment([
+    SeqRecord(Seq("--TCAATTATATTC"), id="CY021716"),
+    SeqRecord(Seq("--TCAATTATATTC"), id="CY020292"),
+    SeqRecord(Seq("TCAAATATATTCAA"), id="CY083917"),
+    SeqRecord(Seq("----ATATATTGAA"), id="CY063613"),
+])
+
+
+class TestAlignmentMatrix(TestCase):
+
+    def test_from_alignment(self):
+
+        alignment_matrix = AlignmentMatrix.from_alignment(test_alignment)
+
+        assert alignment_matrix.matrix.shape == (4, 14)
+        assert alignment_matrix.ids == ["CY021716", "CY020292", "CY083917", "CY063613"]
+        assert alignment_matrix.sequence(3) == "----ATATATTGAA"
+
+    def test_feature_matrix(self):
+
+        alignment_matrix = AlignmentMatrix.from_alignment(test_alignment)
+
+        features = alignment_matrix.feature_matrix([2, 5, 11])
+
+        assert features.tobytes() == b"TATTATATC-TG"
+
+    def test_group_feature_rows(self):
+
+        alignment_matrix = AlignmentMatrix.from_alignment(test_alignment)
+
+        variant_types, inverse, counts = group_feature_rows(alignment_matrix.feature_matrix([2, 5, 11]))
+
+        assert variant_types == ["-TG", "ATC", "TAT"]
+        assert list(inverse) == [2, 2, 1, 0]
+        assert list(counts) == [1, 1, 2]
+
+    def test_unequal_lengths(self):
+
+        records = [SeqRecord(Seq("ACGT"), id="a"), SeqRecord(Seq("ACG"), id="b")]
+
+        with self.assertRaises(ValueError):
+            AlignmentMatrix.from_alignment(records)
+
+
+class TestExtractVariantTypes(TestCase):
+
+    def test_engines_agree(self):
+
+        positions = [2, 3, 9, 11, 12]
+
+        df_python = FeaVar.extract_variant_types(test_alignment, positions, engine="python")
+        df_numpy = FeaVar.extract_variant_types(test_alignment, positions, engine="numpy")
+
+        assert df_numpy.to_dict() == df_python.to_dict()
+
+    def test_unknown_engine(self):
+
+        with self.assertRaises(ValueError):
+            FeaVar.extract_variant_types(test_alignment, [1], engine="fortran")
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+import numpy
+import pandas
+
+from FeaVar import FeaVar
+from FeaVar import association
+
+
+class TestContingencyTables(TestCase):
+
+    def test_contingency_tables(self):
+
+        vt_codes = numpy.array([0, 0, 1, 1, 1, -1])
+        host_codes = numpy.array([0, 1, 1, 1, -1, 0])
+        year_codes = numpy.array([2, 2, 0, 1, 1, 1])
+
+        host_table, year_table = association.contingency_tables(vt_codes, 2, [host_codes, year_codes], [2, 3])
+
+        assert host_table.tolist() == [[1, 1], [0, 2]]
+        assert year_table.tolist() == [[0, 0, 2], [1, 2, 0]]
+
+
+class TestTests(TestCase):
+
+    def test_chi2_sf(self):
+
+        p_values = association.chi2_sf([3.84, 10, 200], [1, 3, 150])
+
+        numpy.testing.assert_allclose(p_values, [0.05004352124870519, 0.01856613546304325, 0.003973185970821635],
+                                      rtol=1e-10)
+        assert numpy.isnan(association.chi2_sf(1.0, 0))
+
+    def test_fisher_exact(self):
+
+        p_values = association.fisher_exact([8, 0, 3], [2, 5, 3], [1, 5, 3], [5, 0, 3])
+
+        numpy.testing.assert_allclose(p_values, [0.034965034965034975, 0.007936507936507938, 1.0], rtol=1e-10)
+
+    def test_benjamini_hochberg(self):
+
+        q_values = association.benjamini_hochberg([0.01, 0.04, numpy.nan, 0.03, 0.5])
+
+        numpy.testing.assert_allclose(q_values, [0.04, 0.05333333333, numpy.nan, 0.05333333333, 0.5], rtol=1e-8)
+
+    def test_field_statistics(self):
+
+        statistics = association.field_statistics(numpy.array([[20, 5, 0], [3, 22, 0], [0, 0, 0]]))
+
+        assert statistics["dof"] == 1
+        numpy.testing.assert_allclose(statistics["chi2"], 23.26892109500805)
+        numpy.testing.assert_allclose(statistics["p_value"], 1.4085783440099755e-06, rtol=1e-8)
+
+    def test_cell_statistics(self):
+
+        cells = association.cell_statistics(numpy.array([[8, 1], [2, 5]]))
+
+        assert cells["test"][0, 0] == "fisher"
+        numpy.testing.assert_allclose(cells["p_value"][0, 0], 0.034965034965034975)
+        numpy.testing.assert_allclose(cells["odds_ratio"][0, 0], 20.0)
+        assert cells["vt_total"][1, 0] == 7
+
+
+class TestComputeAssociations(TestCase):
+
+    def test_compute_associations(self):
+
+        df_all_data = pandas.DataFrame({'accession': list("abcdefgh"),
+                                        'variant_type': pandas.Categorical(list("TTTTAAAA")),
+                                        'host': pandas.Categorical(["human"] * 4 + ["avian"] * 3 + [None])})
+        df_by_variant_type = pandas.DataFrame({'variant_type': ["A", "T"], 'count': [4, 4], 'VT': ["VT-001", "VT-002"]})
+
+        df_fields, df_cells = FeaVar.compute_associations(df_all_data, df_by_variant_type, ["host"])
+
+        assert df_fields.loc[0, "sequences"] == 7
+        assert df_fields.loc[0, "dof"] == 1
+
+        cell = df_cells[(df_cells["VT"] == "VT-002") & (df_cells["value"] == "human")].iloc[0]
+
+        assert (cell["count"], cell["vt_total"], cell["value_total"], cell["test"]) == (4, 4, 4, "fisher")
+        numpy.testing.assert_allclose(cell["p_value"], 0.02857142857142857)
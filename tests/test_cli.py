@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from FeaVar import FeaVar, cli, columnar, instrumentation
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALIGNMENT = ">ref\nMKT-AIL\n>s1\nMKT-AIV\n>s2\nMRTQAIV\n>s3\nMKT-AIL\n"
+
+
+class TestCli(TestCase):
+
+    def setUp(self):
+
+        self.work_dir = tempfile.mkdtemp()
+        self.alignment_path = os.path.join(self.work_dir, "a.fasta")
+
+        with open(self.alignment_path, "w") as alignment_file:
+            alignment_file.write(ALIGNMENT)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.work_dir)
+
+    def test_constants_are_the_package_constants(self):
+
+        assert cli.OUTPUT_FORMATS is columnar.OUTPUT_FORMATS
+        assert cli.DERIVED_TABLES is columnar.DERIVED_TABLES
+        assert cli.REPORT_FILE is instrumentation.REPORT_FILE
+
+    def test_script_runs_the_cli(self):
+
+        script = os.path.join(PACKAGE_DIR, "FeaVar", "FeaVar.py")
+
+        result = subprocess.run([sys.executable, script, "-a", self.alignment_path, "-f", "fasta", "-r", "ref",
+                                 "-p", "1,6", "--tables", "bogus"], cwd=self.work_dir, capture_output=True, text=True)
+
+        # the run subcommand checked the arguments
+        assert result.returncode == 2
+        assert "unknown tables: bogus" in result.stderr
+
+        result = subprocess.run([sys.executable, script, "-a", self.alignment_path, "-f", "fasta", "-r", "ref",
+                                 "-p", "1,6", "-log", "info"], cwd=self.work_dir, capture_output=True, text=True)
+
+        assert result.returncode == 0, result.stderr
+        assert os.path.exists(os.path.join(self.work_dir, "output", "variant_types.csv"))
+
+    def test_help_does_not_import_heavy_dependencies(self):
+
+        code = ("import sys; from click.testing import CliRunner; from FeaVar import cli; "
+                "CliRunner().invoke(cli.main, ['check', '-p', 'H25, H45']); "
+                "print(sorted({'numpy', 'pandas', 'Bio', 'matplotlib'} & set(sys.modules)))")
+
+        output = subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, capture_output=True, text=True,
+                                check=True).stdout
+
+        assert output.strip() == "[]"
+
+    def test_check(self):
+
+        result = CliRunner().invoke(cli.main, ["check", "-p", "H25, H45, V46", "-p", "3-5"])
+
+        assert result.exit_code == 0
+        assert "3 positions: 25,45,46" in result.output
+        assert "3 positions: 3,4,5" in result.output
+
+        result = CliRunner().invoke(cli.main, ["check", "-p", "1-3,x"])
+
+        assert result.exit_code == 1
+        assert "invalid" in result.output
+
+    def test_invalid_tables_are_rejected(self):
+
+        result = CliRunner().invoke(cli.main, ["run", "-a", self.alignment_path, "-r", "ref", "-p", "1",
+                                               "--tables", "bogus"])
+
+        assert result.exit_code == 2
+        assert "unknown tables: bogus" in result.output
+
+    def test_batch_metadata_needs_statistics(self):
+
+        features_path = os.path.join(self.work_dir, "features.txt")
+        metadata_path = os.path.join(self.work_dir, "metadata.tsv")
+
+        with open(features_path, "w") as features_file:
+            features_file.write("first\t1-2\n")
+
+        with open(metadata_path, "w") as metadata_file:
+            metadata_file.write("accession\thost\nref\thuman\n")
+
+        result = CliRunner().invoke(cli.main, ["batch", "-a", self.alignment_path, "-r", "ref", "-F", features_path,
+                                               "-m", metadata_path])
+
+        assert result.exit_code == 2
+        assert "--metadata_file is only used by batch with --statistics" in result.output
+
+    def _invoke_in_work_dir(self, args):
+
+        cwd = os.getcwd()
+        saved = {name: getattr(FeaVar, name) for name in ["output_dir", "output_format", "output_tables"]
+                 if hasattr(FeaVar, name)}
+
+        try:
+            os.chdir(self.work_dir)
+            return CliRunner().invoke(cli.main, args)
+        finally:
+            os.chdir(cwd)
+            for name, value in saved.items():
+                setattr(FeaVar, name, value)
+
+    def test_run(self):
+
+        result = self._invoke_in_work_dir(["run", "-a", self.alignment_path, "-f", "fasta", "-r", "ref",
+                                           "-p", "1,6", "-log", "info"])
+
+        assert result.exit_code == 0, result.output
+        assert "Analysis complete" in result.output
+
+        with open(os.path.join(self.work_dir, "output", "variant_types.csv")) as variant_types_file:
+            assert len(variant_types_file.readlines()) == 3
+
+        assert os.path.exists(os.path.join(self.work_dir, "output", instrumentation.REPORT_FILE))
+
+    def test_failed_pre_flight_exits_non_zero(self):
+
+        result = self._invoke_in_work_dir(["run", "-a", self.alignment_path, "-f", "fasta", "-r", "ref",
+                                           "-p", "W1,K2", "-log", "info"])
+
+        assert result.exit_code == 1
+        assert "Analysis failed" in result.output
+        assert "the pre-flight check failed" in result.output
+
+        with open(os.path.join(self.work_dir, "output", instrumentation.REPORT_FILE)) as report_file:
+            assert json.load(report_file)["results"]["status"] == "failed"
+
+    def test_cached_run_checks_residues(self):
+
+        cache_dir = os.path.join(self.work_dir, "cache")
+        args = ["run", "-a", self.alignment_path, "-f", "fasta", "-r", "ref", "-C", cache_dir, "-log", "info"]
+
+        result = self._invoke_in_work_dir(args + ["-p", "M1,K2"])
+        assert result.exit_code == 0, result.output
+
+        # same positions, a residue the reference does not have: not served from the cache
+        with self.assertLogs(level="INFO") as logs:
+            self._invoke_in_work_dir(args + ["-p", "W1,K2"])
+
+        assert not any("Using cached result" in line for line in logs.output)
+        assert any("Positions do not match the reference sequence" in line for line in logs.output)
+
+        with self.assertLogs(level="INFO") as logs:
+            self._invoke_in_work_dir(args + ["-p", "M1,K2"])
+
+        assert any("Using cached result" in line for line in logs.output)
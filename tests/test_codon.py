@@ -0,0 +1,88 @@
+import itertools
+from unittest import TestCase
+
+import numpy
+from Bio.Seq import Seq
+
+from FeaVar import FeaVar, codon
+from FeaVar.alignment_matrix import AlignmentMatrix
+from FeaVar.coordinate_map import CoordinateMap
+
+# the reference has an insertion column (a gap) inside its second codon
+reference = "CCATGGC-AGAATAG"
+
+test_alignment = AlignmentMatrix(
+    ["ref", "insertion", "synonymous", "missense", "deletion", "frameshift", "resolved", "ambiguous"],
+    numpy.frombuffer("".join([reference,
+                              "CCATGGCTAGAATAG",
+                              "CCATGGC-GGAATAG",
+                              "CCATGGC-AGATTAG",
+                              "CCATG-------TAG",
+                              "CCATG-C-AGAATAG",
+                              "CCATGGC-NGAATAG",
+                              "CCATGGC-AGRATAG"]).encode("ascii"), dtype=numpy.uint8).reshape(8, -1))
+
+
+def as_codons(text: str) -> numpy.ndarray:
+
+    return numpy.frombuffer(text.encode("ascii"), dtype=numpy.uint8).reshape(-1, 3)
+
+
+class TestTranslateCodons(TestCase):
+
+    def test_standard_code(self):
+
+        codons = ["".join(bases) for bases in itertools.product("ACGT", repeat=3)]
+
+        translated = codon.translate_codons(as_codons("".join(codons))).tobytes().decode("ascii")
+
+        assert translated == str(Seq("".join(codons)).translate())
+
+    def test_gaps_and_ambiguity(self):
+
+        translated = codon.translate_codons(as_codons("GCNTARRAY---A-Ggcu???")).tobytes().decode("ascii")
+
+        assert translated == "A*X-XAX"
+
+    def test_translate_reference(self):
+
+        assert codon.translate_reference(reference, 3) == "MAE*"
+
+
+class TestCodonColumns(TestCase):
+
+    def test_codon_columns(self):
+
+        columns = codon.codon_columns(CoordinateMap(reference), [1, 2, 4], 3)
+
+        assert columns.tolist() == [[2, 3, 4], [5, 6, 8], [12, 13, 14]]
+
+    def test_codon_columns_are_feature_columns(self):
+
+        columns = codon.codon_columns(CoordinateMap(reference), [2], 3)
+
+        assert columns.ravel().tolist() == FeaVar.feature_columns(reference, [6, 7, 8])
+
+        df_codons = FeaVar.extract_variant_types(test_alignment, columns.ravel().tolist(), codons=True)
+        df_bases = FeaVar.extract_variant_types(test_alignment, FeaVar.feature_columns(reference, [6, 7, 8]))
+
+        assert df_bases["variant_type"].astype(str).tolist()[0] == "GCA"
+        assert df_codons["variant_type"].astype(str).tolist()[0] == "A"
+
+    def test_codon_beyond_reference(self):
+
+        with self.assertRaises(ValueError):
+            codon.codon_columns(CoordinateMap(reference), [5], 3)
+
+
+class TestCodonVariantTypes(TestCase):
+
+    def test_codon_variant_types(self):
+
+        columns = codon.codon_columns(CoordinateMap(reference), [1, 2, 3], 3)
+
+        df = FeaVar.extract_variant_types(test_alignment, columns.ravel().tolist(), codons=True)
+
+        assert df.set_index("accession")["variant_type"].to_dict() == {
+            "ref": "MAE", "insertion": "MAE", "synonymous": "MAE", "missense": "MAD", "deletion": "M--",
+            "frameshift": "MXE", "resolved": "MAE", "ambiguous": "MAX"}
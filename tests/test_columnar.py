@@ -0,0 +1,79 @@
+import importlib.util
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+
+import pandas
+
+from FeaVar import columnar
+
+has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+
+df_starter = pandas.DataFrame({'accession': ["CY021716", "CY020292", "CY083917", "CY063613"],
+                               'variant_type': ["TCA", "TCA", "AAT", "--A"]})
+
+df_by_variant_type = pandas.DataFrame({'variant_type': ["TCA", "--A", "AAT"],
+                                       'count': [2, 1, 1],
+                                       'VT': ["VT-001", "VT-002", "VT-003"]})
+
+
+class TestColumnarTables(TestCase):
+
+    def test_positions_label(self):
+
+        assert columnar.positions_label([7, 1, 2, 3, 9, 10]) == "1-3_7_9-10"
+
+    def test_assignment_table(self):
+
+        df = columnar.assignment_table(df_starter, df_by_variant_type)
+
+        assert df["VT"].tolist() == ["VT-001", "VT-001", "VT-003", "VT-002"]
+        assert isinstance(df["variant_type"].dtype, pandas.CategoricalDtype)
+        assert df["VT"].cat.ordered
+
+    def test_table_path_quotes_feature(self):
+
+        assert columnar.table_path("ds", "assignments", "parquet", "HA epitope/1") == \
+            "ds/assignments/feature=HA%20epitope%2F1/part-0.parquet"
+
+
+@skipUnless(has_pyarrow, "pyarrow is not installed")
+class TestColumnarDataset(TestCase):
+
+    def setUp(self):
+
+        self.dataset_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.dataset_dir)
+
+    def test_round_trip_partitions(self):
+
+        for output_format in ["parquet", "feather"]:
+
+            for feature in ["HA epitope/1", "124-142"]:
+                columnar.write_table(columnar.assignment_table(df_starter, df_by_variant_type), self.dataset_dir,
+                                     "assignments", output_format, feature)
+
+            # rewriting a partition replaces it
+            columnar.write_table(columnar.assignment_table(df_starter, df_by_variant_type), self.dataset_dir,
+                                 "assignments", output_format, "124-142")
+
+            df = columnar.read_table(self.dataset_dir, "assignments", output_format)
+
+            assert len(df) == 8
+            assert sorted(df["feature"].astype(str).unique()) == ["124-142", "HA epitope/1"]
+
+            single = df[df["feature"] == "124-142"]
+            assert single["accession"].tolist() == df_starter["accession"].tolist()
+            assert single["VT"].astype(str).tolist() == ["VT-001", "VT-001", "VT-003", "VT-002"]
+
+    def test_unpartitioned_table(self):
+
+        columnar.write_table(df_by_variant_type, self.dataset_dir, "top", "parquet")
+
+        df = columnar.read_table(self.dataset_dir, "top", "parquet")
+
+        assert df["variant_type"].astype(str).tolist() == ["TCA", "--A", "AAT"]
+        assert df["count"].tolist() == [2, 1, 1]
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from FeaVar import FeaVar
+from FeaVar.coordinate_map import CoordinateMap
+
+test_ref_seq = "-M---SP---QTE----TKAS-"
+
+
+class TestCoordinateMap(TestCase):
+
+    def test_to_aligned(self):
+
+        coordinate_map = CoordinateMap(test_ref_seq)
+
+        assert len(coordinate_map) == 10
+        assert coordinate_map.to_aligned([1, 2, 3, 10]).tolist() == [2, 6, 7, 21]
+
+    def test_to_columns(self):
+
+        coordinate_map = CoordinateMap(test_ref_seq)
+        columns = coordinate_map.to_columns([1, 2, 3, 10])
+
+        assert columns.tolist() == [1, 5, 6, 20]
+        assert "".join(test_ref_seq[column] for column in columns) == "MSPS"
+
+    def test_to_aligned_outside_reference(self):
+
+        coordinate_map = CoordinateMap(test_ref_seq)
+
+        with self.assertRaises(KeyError):
+            coordinate_map.to_aligned([1, 11])
+
+        with self.assertRaises(KeyError):
+            coordinate_map.to_aligned([0])
+
+    def test_to_ungapped(self):
+
+        coordinate_map = CoordinateMap(test_ref_seq)
+
+        assert coordinate_map.to_ungapped([2, 6, 7, 21]).tolist() == [1, 2, 3, 10]
+        assert coordinate_map.to_ungapped([1, 3, 22]).tolist() == [0, 0, 0]
+
+    def test_round_trip(self):
+
+        coordinate_map = CoordinateMap(test_ref_seq)
+        positions = list(range(1, len(coordinate_map) + 1))
+
+        assert coordinate_map.to_ungapped(coordinate_map.to_aligned(positions)).tolist() == positions
+        assert not coordinate_map.is_gap(coordinate_map.to_aligned(positions)).any()
+
+    def test_ranges(self):
+
+        coordinate_map = CoordinateMap(test_ref_seq)
+
+        assert coordinate_map.aligned_range(2, 4) == (6, 11)
+        assert coordinate_map.ungapped_range(3, 12) == (2, 5)
+        assert coordinate_map.ungapped_range(8, 10) is None
+
+    def test_as_dict(self):
+
+        assert CoordinateMap("-AB--C").as_dict() == {1: 2, 2: 3, 3: 6}
+
+    def test_gap_offsets(self):
+
+        assert FeaVar.create_index_offset_list("--AB-C") == [1, 2, 2, 2, 3, 3]
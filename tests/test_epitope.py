@@ -0,0 +1,101 @@
+import argparse
+import os
+import tempfile
+from unittest import TestCase
+
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from FeaVar import FeaVar
+from FeaVar.epitope import EpitopeResidue, parse_epitope, read_iedb_epitopes, validate_epitope, validate_epitopes
+
+test_ref_seq = "--MKA-ILVLL"
+
+test_alignment = MultipleSeqAlignment([
+    SeqRecord(Seq(test_ref_seq), id="CY021716"),
+    SeqRecord(Seq("MMMKA-IIVLL"), id="CY020292"),
+])
+
+
+class TestParseEpitope(TestCase):
+
+    def test_parse_iedb_residues(self):
+
+        assert parse_epitope("H25, V46") == [EpitopeResidue("", "H", 25), EpitopeResidue("", "V", 46)]
+
+    def test_parse_chains(self):
+
+        residues = parse_epitope("H25, T333; B: D363, G364")
+
+        assert [residue.chain for residue in residues] == ["", "", "B", "B"]
+        assert parse_epitope("A:H25, B:d363") == [EpitopeResidue("A", "H", 25), EpitopeResidue("B", "D", 363)]
+
+    def test_parse_ranges(self):
+
+        assert [residue.position for residue in parse_epitope("10 - 12, 20")] == [10, 11, 12, 20]
+        assert parse_epitope("M1-K3") == [EpitopeResidue("", "M", 1), EpitopeResidue("", "", 2),
+                                          EpitopeResidue("", "K", 3)]
+
+    def test_parse_errors(self):
+
+        for bad in ["10 21", "10 -", "H", "12-10"]:
+            with self.assertRaises(ValueError):
+                parse_epitope(bad)
+
+
+class TestValidateEpitopes(TestCase):
+
+    def test_validate_epitopes(self):
+
+        validation = validate_epitopes(test_ref_seq, {"ok": "M1, K2, I4-L8", "mismatch": "M1, Q2", "outside": "L8, 9",
+                                                      "unparsable": "M1 K2"})
+
+        assert validation["valid"].tolist() == [True, False, False, False]
+        assert validation.at["mismatch", "mismatches"] == 1
+        assert validation.at["mismatch", "diagnostic"] == "Q2 reference has K"
+        assert validation.at["outside", "outside_reference"] == 1
+        assert validation.at["ok", "residues"] == 7
+
+    def test_validate_chains(self):
+
+        validation = validate_epitope({"A": test_ref_seq, "B": "QQ"}, "M1; B: Q2, C: K1")
+
+        assert (validation["valid"], validation["unknown_chain"]) == (False, 1)
+        assert validate_epitope({"A": test_ref_seq, "B": "QQ"}, "M1; B: Q2")["valid"]
+
+    def test_read_iedb_epitopes(self):
+
+        handle, export_path = tempfile.mkstemp(suffix=".csv")
+
+        with os.fdopen(handle, "w") as export_file:
+            export_file.write("Epitope,Epitope\nEpitope ID,Description\n1,\"M1, K2\"\n2,\"B: Q2\"\n")
+
+        try:
+            assert read_iedb_epitopes(export_path, id_column="Epitope ID") == {"1": "M1, K2", "2": "B: Q2"}
+        finally:
+            os.remove(export_path)
+
+
+class TestPreFlightCheckResidues(TestCase):
+
+    def test_mismatched_residue_fails_pre_flight(self):
+
+        arguments = argparse.Namespace(reference_identifier="CY021716", positions="M1, K2, I4")
+
+        assert FeaVar.pre_flight_check(arguments, test_alignment) == ([2, 3, 6], [True, True, True])
+
+        arguments.positions = "M1, K2, V4"
+
+        assert FeaVar.pre_flight_check(arguments, test_alignment) == ([], [True, False, False])
+
+    def test_extracted_residues_are_the_validated_residues(self):
+
+        arguments = argparse.Namespace(reference_identifier="CY021716", positions="M1, K2, I4, L7")
+
+        columns, rules = FeaVar.pre_flight_check(arguments, test_alignment)
+        df_starter = FeaVar.extract_variant_types(test_alignment, columns)
+
+        assert all(rules)
+        assert df_starter.set_index("accession")["variant_type"].astype(str).to_dict() == {"CY021716": "MKIL",
+                                                                                         "CY020292": "MKIL"}
@@ -0,0 +1,72 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from FeaVar import FeaVar
+
+test_alignment = MultipleSeqAlignment([
+    SeqRecord(Seq("--TCAATTATATTC"), id="CY021716"),
+    SeqRecord(Seq("--TCAATTATATTC"), id="CY020292"),
+    SeqRecord(Seq("TCAAATATATTCAA"), id="CY083917"),
+    SeqRecord(Seq("----ATATATTGAA"), id="CY063613"),
+])
+
+features_example = """# name, tab, positions
+epitope_1\t2-4,9
+epitope 2\t11, 12
+iedb\tH3, H5, V10
+"""
+
+
+class TestParseFeaturesFile(TestCase):
+
+    def setUp(self):
+
+        handle, self.features_path = tempfile.mkstemp(suffix=".tsv")
+
+        with os.fdopen(handle, "w") as features_file:
+            features_file.write(features_example)
+
+    def tearDown(self):
+
+        os.remove(self.features_path)
+
+    def test_parse_features_file(self):
+
+        features = FeaVar.parse_features_file(self.features_path)
+
+        assert list(features) == ["epitope_1", "epitope 2", "iedb"]
+        assert features["epitope_1"] == [2, 3, 4, 9]
+        assert features["epitope 2"] == [11, 12]
+        assert features["iedb"] == [3, 5, 10]
+
+    def test_parse_iedb_positions(self):
+
+        assert FeaVar.parse_position_input("H25, H45, V46, N47, L496") == [25, 45, 46, 47, 496]
+
+
+class TestExtractFeatureBatch(TestCase):
+
+    def test_batch_matches_single_features(self):
+
+        features = {"epitope_1": [2, 3, 4, 9], "epitope 2": [11, 12], "iedb": [3, 5, 10]}
+
+        for engine in ["numpy", "python"]:
+
+            batch = FeaVar.extract_feature_batch(test_alignment, features, engine)
+
+            for name, positions in features.items():
+                single = FeaVar.extract_variant_types(test_alignment, positions, engine)
+
+                # the same dictionary encoded (categorical) assignment as a single feature
+                pandas.testing.assert_frame_equal(batch[name], single)
+                assert isinstance(batch[name]["variant_type"].dtype, pandas.CategoricalDtype)
+
+    def test_feature_file_label(self):
+
+        assert FeaVar.feature_file_label("HA epitope/1") == "HA_epitope_1"
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from FeaVar import FeaVar
+from FeaVar import fvaln
+
+aln_example = """CLUSTAL W (1.81) multiple sequence alignment
+
+
+CY021716      --TCAATTATATTC
+CY020292      --TCAATTATATTC
+CY083917      TCAAATATATTCAA
+CY063613      ----ATATATTGAA
+
+"""
+
+
+class TestFvaln(TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.alignment_path = os.path.join(self.temp_dir.name, "test.clw")
+
+        with open(self.alignment_path, "w") as alignment_file:
+            alignment_file.write(aln_example)
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+
+        fvaln_path = fvaln.convert_alignment(self.alignment_path, "clustal")
+
+        assert fvaln_path == self.alignment_path + ".fvaln"
+
+        alignment_matrix = fvaln.load_fvaln(fvaln_path, verify=True)
+        expected = FeaVar.as_alignment_matrix(FeaVar.load_alignment(self.alignment_path, "clustal"))
+
+        assert alignment_matrix.ids == expected.ids
+        numpy.testing.assert_array_equal(alignment_matrix.matrix, expected.matrix)
+        numpy.testing.assert_array_equal(alignment_matrix.feature_matrix([2, 5, 11]),
+                                         expected.feature_matrix([2, 5, 11]))
+
+    def test_header(self):
+
+        fvaln_path = fvaln.convert_alignment(self.alignment_path, "clustal")
+
+        header = fvaln.read_fvaln_header(fvaln_path)
+
+        assert header["n_sequences"] == 4
+        assert header["alignment_length"] == 14
+        assert header["source_size"] == os.path.getsize(self.alignment_path)
+
+    def test_checksum_mismatch(self):
+
+        fvaln_path = fvaln.convert_alignment(self.alignment_path, "clustal")
+
+        with open(fvaln_path, "r+b") as fvaln_file:
+            fvaln_file.seek(fvaln.HEADER_SIZE)
+            fvaln_file.write(b"X")
+
+        with self.assertRaises(ValueError):
+            fvaln.load_fvaln(fvaln_path, verify=True)
+
+    def test_not_fvaln(self):
+
+        with self.assertRaises(ValueError):
+            fvaln.load_fvaln(self.alignment_path)
+
+    def test_binary_cache_is_reused(self):
+
+        fvaln_path = fvaln.fvaln_path_for(self.alignment_path)
+
+        assert not fvaln.fvaln_is_current(fvaln_path, self.alignment_path)
+
+        FeaVar.load_alignment(self.alignment_path, "clustal", binary_cache=True)
+
+        assert fvaln.fvaln_is_current(fvaln_path, self.alignment_path)
+
+        test, reference_sequence = FeaVar.check_for_ref_seq_in_alignment(
+            "CY063613", FeaVar.load_alignment(fvaln_path, "fvaln"))
+
+        assert test is True
+        assert reference_sequence == "----ATATATTGAA"
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from FeaVar import FeaVar
+from FeaVar.id_index import SequenceIdIndex, accession_tokens
+
+test_ids = ["gb:CY021716|Organism:Influenza", "gb:CY020292.2|Organism:Influenza", "CY019401", "CY019402",
+            "AB753214", "AB753214"]
+
+
+class TestSequenceIdIndex(TestCase):
+
+    def test_accession_tokens(self):
+
+        assert accession_tokens("gb:CY021716|Organism:Influenza") == {"gb:CY021716", "CY021716",
+                                                                      "Organism:Influenza", "Influenza"}
+
+    def test_exact(self):
+
+        match = SequenceIdIndex(test_ids).lookup("CY019401")
+
+        assert (match.row, match.match) == (2, "exact")
+
+    def test_accession_in_composite_id(self):
+
+        match = SequenceIdIndex(test_ids).lookup("CY021716")
+
+        assert (match.row, match.sequence_id, match.match) == (0, "gb:CY021716|Organism:Influenza", "accession")
+
+    def test_version(self):
+
+        index = SequenceIdIndex(test_ids)
+
+        assert (index.lookup("CY020292").row, index.lookup("CY020292").match) == (1, "version")
+        assert (index.lookup("CY021716.1").row, index.lookup("CY021716.1").match) == (0, "version")
+
+    def test_prefix(self):
+
+        match = SequenceIdIndex(test_ids).lookup("CY02171")
+
+        assert (match.row, match.match) == (0, "prefix")
+
+    def test_ambiguous_prefix_is_reported(self):
+
+        match = SequenceIdIndex(test_ids).lookup("CY0194")
+
+        assert match.row is None
+        assert match.match == "prefix"
+        assert match.candidates == ["CY019401", "CY019402"]
+
+    def test_duplicate_ids_are_ambiguous(self):
+
+        match = SequenceIdIndex(test_ids).lookup("AB753214")
+
+        assert match.row is None
+        assert match.candidates == ["AB753214", "AB753214"]
+
+    def test_substring_and_missing(self):
+
+        index = SequenceIdIndex(test_ids)
+
+        assert (index.lookup("21716|Org").row, index.lookup("21716|Org").match) == (0, "substring")
+        assert index.lookup("XX000000") == (None, None, None, [])
+
+
+class TestCheckForRefSeqInAlignment(TestCase):
+
+    def test_ambiguous_reference_is_not_found(self):
+
+        alignment = MultipleSeqAlignment([SeqRecord(Seq("ACGT"), id=sequence_id) for sequence_id in test_ids])
+
+        assert FeaVar.check_for_ref_seq_in_alignment("CY0194", alignment) == (False, "")
+        assert FeaVar.check_for_ref_seq_in_alignment("CY019402", alignment) == (True, "ACGT")
+        assert FeaVar.check_for_ref_seq_in_alignment("CY019402", FeaVar.as_alignment_matrix(alignment)) == \
+            (True, "ACGT")
@@ -0,0 +1,159 @@
+import itertools
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from FeaVar import FeaVar, incremental
+from FeaVar.alignment_matrix import AlignmentMatrix
+
+
+def make_alignment(sequences):
+
+    ids = ["seq{}".format(row) for row in range(len(sequences))]
+    matrix = numpy.frombuffer("".join(sequences).encode("ascii"), dtype=numpy.uint8).reshape(len(sequences), -1)
+
+    return AlignmentMatrix(ids, matrix)
+
+
+first_week = ["AAAA", "AAAA", "CAAA", "AAAA", "CAAA", "GAAA"]
+second_week = first_week + ["TAAA", "TAAA", "TAAA", "TAAA", "CAAA"]
+
+
+class TestIncrementalUpdate(TestCase):
+
+    def test_new_sequences_keep_vt_numbering(self):
+
+        state = incremental.update_state(make_alignment(first_week), [0, 1])
+
+        assert state["full"] is True
+        assert state["variant_types"] == ["AA", "CA", "GA"]
+        assert state["counts"] == [3, 2, 1]
+
+        state = incremental.update_state(make_alignment(second_week), [0, 1], state)
+
+        # TA is now the most frequent variant type but existing ids are not renumbered
+        assert state["full"] is False
+        assert state["n_new"] == 5
+        assert state["variant_types"] == ["AA", "CA", "GA", "TA"]
+        assert state["counts"] == [3, 3, 1, 4]
+        assert list(state["codes"]) == [0, 0, 1, 0, 1, 2, 3, 3, 3, 3, 1]
+
+    def test_vt_width_is_kept(self):
+
+        sequences = ["".join(bases) for bases in itertools.product("ACGT", repeat=5)]
+
+        state = incremental.update_state(make_alignment(sequences[:999]), [0, 1, 2, 3, 4])
+        state = incremental.update_state(make_alignment(sequences[:1001]), [0, 1, 2, 3, 4], state)
+
+        labels = FeaVar.vt_labels(len(state["variant_types"]), state["vt_width"])
+
+        # the 1000th variant type does not rename VT-001
+        assert state["full"] is False
+        assert state["vt_width"] == 3
+        assert labels[:2] + labels[-2:] == ["VT-001", "VT-002", "VT-1000", "VT-1001"]
+
+    def test_state_round_trip(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            state_file_path = os.path.join(temp_dir, "state.json")
+
+            assert incremental.load_state(state_file_path) is None
+
+            incremental.save_state(state_file_path, incremental.update_state(make_alignment(first_week), [0, 1]))
+            state = incremental.update_state(make_alignment(second_week), [0, 1],
+                                             incremental.load_state(state_file_path))
+
+            assert state["full"] is False
+            assert state["n_new"] == 5
+
+    def test_changed_alignment_is_typed_again(self):
+
+        state = incremental.update_state(make_alignment(first_week), [0, 1])
+
+        # different feature positions
+        assert incremental.update_state(make_alignment(second_week), [0, 2], state)["full"] is True
+
+        # realigned (different number of columns)
+        realigned = [sequence + "-" for sequence in second_week]
+        assert incremental.update_state(make_alignment(realigned), [0, 1], state)["full"] is True
+
+        # sequences removed or reordered
+        reordered = make_alignment(second_week)
+        reordered.ids = list(reversed(reordered.ids))
+        assert incremental.update_state(reordered, [0, 1], state)["full"] is True
+
+        # a typed sequence edited, same length and ids
+        edited = ["AAAA", "AGAA"] + second_week[2:]
+        state = incremental.update_state(make_alignment(edited), [0, 1], state)
+        assert state["full"] is True
+        assert state["variant_types"][:3] == ["TA", "CA", "AA"]
+
+
+def write_fasta(file_path, sequences, mode="w", start=0):
+
+    with open(file_path, mode) as fasta_file:
+        for row, sequence in enumerate(sequences, start):
+            fasta_file.write(">seq{}\n{}\n".format(row, sequence))
+
+
+class TestFastaUpdate(TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.fasta_path = os.path.join(self.temp_dir.name, "weekly.fasta")
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_appended_records_are_read_alone(self):
+
+        write_fasta(self.fasta_path, first_week)
+        state = incremental.update_fasta_state(self.fasta_path, [0, 1])
+
+        assert state["full"] is True
+        assert state["variant_types"] == ["AA", "CA", "GA"]
+
+        write_fasta(self.fasta_path, second_week[len(first_week):], "a", len(first_week))
+        state = incremental.update_fasta_state(self.fasta_path, [0, 1], state)
+
+        # the same result as typing the loaded alignment
+        expected = incremental.update_state(make_alignment(first_week), [0, 1])
+        expected = incremental.update_state(make_alignment(second_week), [0, 1], expected)
+
+        assert state["full"] is False
+        assert state["n_new"] == 5
+        assert state["variant_types"] == expected["variant_types"]
+        assert state["counts"] == expected["counts"]
+        assert list(state["codes"]) == list(expected["codes"])
+        assert state["ids"] == ["seq{}".format(row) for row in range(len(second_week))]
+
+    def test_edited_file_is_typed_again(self):
+
+        write_fasta(self.fasta_path, first_week)
+        state = incremental.update_fasta_state(self.fasta_path, [0, 1])
+
+        write_fasta(self.fasta_path, ["AGAA"] + second_week[1:])
+        state = incremental.update_fasta_state(self.fasta_path, [0, 1], state)
+
+        assert state["full"] is True
+        assert state["n_new"] == len(second_week)
+
+    def test_interrupted_save_is_not_used(self):
+
+        state_file_path = os.path.join(self.temp_dir.name, "state.json")
+
+        write_fasta(self.fasta_path, first_week)
+        state = incremental.update_fasta_state(self.fasta_path, [0, 1])
+        incremental.save_state(state_file_path, state)
+
+        assert incremental.load_state(state_file_path)["ids"] == state["ids"]
+
+        # the codes of a later save, without its state file
+        numpy.save(incremental.codes_path_for(state_file_path), numpy.zeros(len(first_week), dtype=numpy.int32))
+
+        assert incremental.load_state(state_file_path) is None
@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from FeaVar import instrumentation
+
+
+class TestRunRecorder(TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.output_dir)
+
+    def test_stage_measurements(self):
+
+        recorder = instrumentation.RunRecorder("1.0.1", trace_memory=True)
+
+        with recorder.stage("extraction") as stage:
+            data = [bytes(1000) for _ in range(1000)]
+            stage["n_items"] = len(data)
+
+        record = recorder.stages[0]
+
+        assert record["stage"] == "extraction"
+        assert record["n_items"] == 1000
+        assert record["wall_seconds"] >= 0 and record["cpu_seconds"] >= 0
+        assert record["peak_rss_mb"] > 0
+        assert record["peak_traced_mb"] >= 0.9
+        assert record["items_per_second"] > 0
+
+    def test_stage_is_recorded_when_it_fails(self):
+
+        recorder = instrumentation.RunRecorder()
+
+        with self.assertRaises(ValueError):
+            with recorder.stage("parse"):
+                raise ValueError("bad alignment")
+
+        assert [stage["stage"] for stage in recorder.stages] == ["parse"]
+
+    def test_progress(self):
+
+        calls = []
+        recorder = instrumentation.RunRecorder(progress=lambda *call: calls.append(call))
+
+        recorder.progress("counting", 1, 2)
+        recorder.stage_progress("extraction")(5)
+
+        assert calls == [("counting", 1, 2), ("extraction", 5, None)]
+        assert instrumentation.RunRecorder().stage_progress("extraction") is None
+
+    def test_write_report(self):
+
+        recorder = instrumentation.RunRecorder("1.0.1")
+        recorder.results["n_variant_types"] = 3
+
+        with recorder.stage("counting", 10):
+            pass
+
+        report_path = os.path.join(self.output_dir, instrumentation.REPORT_FILE)
+        recorder.write_report(report_path, {"alignment": "a.clw"}, {"status": "complete"})
+
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+
+        assert report["feavar_version"] == "1.0.1"
+        assert report["inputs"] == {"alignment": "a.clw"}
+        assert report["results"] == {"n_variant_types": 3, "status": "complete"}
+        assert [stage["stage"] for stage in report["stages"]] == ["counting"]
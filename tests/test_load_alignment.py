@@ -0,0 +1,61 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from FeaVar import FeaVar
+
+aln_example = """CLUSTAL W (1.81) multiple sequence alignment
+
+
+CY021716      --TCAATTATATTC
+CY020292      --TCAATTATATTC
+CY083917      TCAAATATATTCAA
+CY063613      ----ATATATTGAA
+
+"""
+
+
+class TestLoadAlignment(TestCase):
+
+    def setUp(self):
+
+        handle, self.alignment_path = tempfile.mkstemp(suffix=".clw")
+
+        with os.fdopen(handle, "w") as alignment_file:
+            alignment_file.write(aln_example)
+
+    def tearDown(self):
+
+        os.remove(self.alignment_path)
+
+    def test_load_alignment(self):
+
+        alignment = FeaVar.load_alignment(self.alignment_path, "clustal")
+
+        assert len(alignment) == 4
+        assert alignment.get_alignment_length() == 14
+
+    def test_check_for_ref_seq_in_loaded_alignment(self):
+
+        alignment = FeaVar.load_alignment(self.alignment_path, "clustal")
+
+        test, reference_sequence = FeaVar.check_for_ref_seq_in_alignment("CY063613", alignment)
+
+        assert test is True
+        assert reference_sequence == "----ATATATTGAA"
+
+    def test_check_for_ref_seq_in_alignment_file(self):
+
+        test, reference_sequence = FeaVar.check_for_ref_seq_in_alignment("CY083917", self.alignment_path)
+
+        assert test is True
+        assert reference_sequence == "TCAAATATATTCAA"
+
+    def test_check_for_missing_ref_seq(self):
+
+        alignment = FeaVar.load_alignment(self.alignment_path, "clustal")
+
+        test, reference_sequence = FeaVar.check_for_ref_seq_in_alignment("AB000000", alignment)
+
+        assert test is False
+        assert reference_sequence == ""
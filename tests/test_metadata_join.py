@@ -0,0 +1,64 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas
+
+from FeaVar import FeaVar
+
+metadata_example = """accession\thost\tyear\tcountry
+CY021716\thuman\t2007\tUSA
+CY020292\tavian\t2006\tChina
+CY083917\thuman\t2009\tUSA
+XX000001\tswine\t2001\tMexico
+"""
+
+df_starter = pandas.DataFrame({'accession': ["CY021716", "CY020292", "CY083917", "CY063613"],
+                               'variant_type': pandas.Categorical(["TCA", "TCA", "AAT", "--A"])})
+
+
+class TestMetadataJoin(TestCase):
+
+    def setUp(self):
+
+        handle, self.metadata_path = tempfile.mkstemp(suffix=".tsv")
+
+        with os.fdopen(handle, "w") as metadata_file:
+            metadata_file.write(metadata_example)
+
+    def tearDown(self):
+
+        os.remove(self.metadata_path)
+
+    def test_import_selected_fields_in_chunks(self):
+
+        df_metadata = FeaVar.import_metadata(self.metadata_path, ["host", "year"], chunk_size=1)
+
+        assert list(df_metadata.columns) == ["accession", "host", "year"]
+        assert len(df_metadata) == 4
+        assert isinstance(df_metadata["host"].dtype, pandas.CategoricalDtype)
+        assert df_metadata["year"].astype(str).tolist() == ["2007", "2006", "2009", "2001"]
+
+    def test_import_only_wanted_accessions(self):
+
+        df_metadata = FeaVar.import_metadata(self.metadata_path, accessions=df_starter['accession'], chunk_size=2)
+
+        assert df_metadata["accession"].tolist() == ["CY021716", "CY020292", "CY083917"]
+        assert list(df_metadata.columns) == ["accession", "host", "year", "country"]
+
+    def test_unknown_field(self):
+
+        with self.assertRaises(ValueError):
+            FeaVar.import_metadata(self.metadata_path, ["segment"])
+
+    def test_join_metadata(self):
+
+        df_metadata = FeaVar.import_metadata(self.metadata_path, ["host"])
+
+        df_all_data = FeaVar.join_metadata(df_starter, df_metadata)
+
+        assert list(df_all_data.columns) == ["accession", "variant_type", "host"]
+        assert df_all_data["accession"].tolist() == df_starter["accession"].tolist()
+        assert df_all_data["host"].tolist()[:3] == ["human", "avian", "human"]
+        assert pandas.isna(df_all_data["host"].iloc[3])
+        assert isinstance(df_all_data["host"].dtype, pandas.CategoricalDtype)
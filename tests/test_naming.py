@@ -0,0 +1,117 @@
+import argparse
+import os
+import re
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+import pandas
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from FeaVar import FeaVar, naming
+
+# the reference has a leading gap and an insertion column, so reference positions and columns differ
+test_alignment = MultipleSeqAlignment([
+    SeqRecord(Seq("-MKA-ILVLL"), id="CY021716"),
+    SeqRecord(Seq("-MKAQIIVLL"), id="CY020292"),
+    SeqRecord(Seq("MMRA-ILVFL"), id="CY083917"),
+    SeqRecord(Seq("-MKA-ILVLL"), id="CY063613"),
+])
+
+df_by_variant_type = pandas.DataFrame({"variant_type": ["KSN", "KSD", "NSN", "NTD"],
+                                       "count": [10, 5, 3, 1],
+                                       "VT": ["VT-001", "VT-002", "VT-003", "VT-004"]})
+
+
+class TestNaming(TestCase):
+
+    def test_hamming_distances(self):
+
+        rng = numpy.random.default_rng(0)
+        encoded = rng.choice(numpy.frombuffer(b"ACGT-", dtype=numpy.uint8), (300, 25))
+
+        expected = (encoded[:, None, :] != encoded[None, :, :]).sum(axis=2)
+
+        assert (naming.hamming_distances(encoded, block_size=64) == expected).all()
+
+        parents, distances = naming.nearest_more_frequent(encoded, block_size=64)
+
+        for row in range(1, len(encoded)):
+            assert parents[row] == numpy.argmin(expected[row, :row])
+            assert distances[row] == expected[row, :row].min()
+
+    def test_mutations(self):
+
+        encoded = naming.encode_variant_types(["KSN", "KSD", "NTD"])
+
+        assert naming.mutations(encoded, numpy.array([-1, 0, 1]), [145, 146, 147]) == ["", "N147D", "K145N S146T"]
+
+    def test_unequal_variant_types(self):
+
+        with self.assertRaises(ValueError):
+            naming.encode_variant_types(["KSN", "KS"])
+
+
+class TestVariantTypeNaming(TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.output_dir)
+
+    def test_compute_variant_differences_for_naming(self):
+
+        df_names = FeaVar.compute_variant_differences_for_naming(df_by_variant_type, [145, 146, 147])
+
+        assert df_names["name"].tolist() == ["VT-001", "VT-002 = VT-001 + N147D", "VT-003 = VT-001 + K145N",
+                                             "VT-004 = VT-002 + K145N + S146T"]
+        assert df_names["nearest_distance"].tolist() == [0, 1, 1, 2]
+        assert df_names["reference_mutations"].tolist() == ["", "N147D", "K145N", "K145N S146T N147D"]
+
+    def test_reference_variant_type(self):
+
+        df_names = FeaVar.compute_variant_differences_for_naming(df_by_variant_type, [145, 146, 147], "KSD")
+
+        assert df_names["name"][0] == "VT-001 = VT-002 + D147N"
+        assert df_names["reference_distance"].tolist() == [1, 0, 2, 2]
+
+    def test_mutation_labels_name_reference_residues(self):
+
+        arguments = argparse.Namespace(reference_identifier="CY021716", positions="K2, I4, L5, L7")
+
+        columns, rules = FeaVar.pre_flight_check(arguments, test_alignment)
+        df_starter = FeaVar.extract_variant_types(test_alignment, columns)
+        df_by_variant_type = FeaVar.count_seqs_per_variant_type(df_starter, None)
+
+        df_names = FeaVar.compute_variant_differences_for_naming(
+            df_by_variant_type, FeaVar.parse_position_input(arguments.positions),
+            FeaVar.find_reference_variant_type(df_starter, "CY021716"))
+
+        reference = str(test_alignment[0].seq).replace("-", "")
+        mutations = " ".join(df_names["reference_mutations"]).split()
+
+        assert all(rules)
+        assert sorted(mutations) == ["K2R", "L5I", "L7F"]
+
+        # every label is the reference position of the residue the mutation changes
+        for mutation in mutations:
+            residue, position = re.match(r"([A-Z-])(\d+)", mutation).groups()
+            assert reference[int(position) - 1] == residue
+
+    def test_write_variant_type_naming(self):
+
+        context = FeaVar.RunContext(self.output_dir)
+
+        FeaVar.write_variant_type_naming(df_by_variant_type, [145, 146, 147], context=context)
+
+        df_distances = pandas.read_csv(os.path.join(self.output_dir, "variant_type_distances.csv"), index_col=0)
+
+        assert df_distances.loc["VT-004", "VT-001"] == 3
+        assert (df_distances.to_numpy() == df_distances.to_numpy().T).all()
+        assert os.path.isfile(os.path.join(self.output_dir, "variant_type_names.csv"))
@@ -0,0 +1,59 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pandas
+
+from FeaVar import FeaVar
+
+
+class TestNumberVariantTypes(TestCase):
+
+    def setUp(self):
+
+        self.output_dir, self.module_output_dir = tempfile.mkdtemp(), FeaVar.output_dir
+        FeaVar.output_dir = self.output_dir
+
+    def tearDown(self):
+
+        FeaVar.output_dir = self.module_output_dir
+        shutil.rmtree(self.output_dir)
+
+    def test_ties_are_numbered_lexicographically(self):
+
+        counts = pandas.Series({"TTT": 2, "CCC": 5, "AAA": 2, "GGG": 1, "ACA": 2})
+
+        for shuffled in [counts, counts.iloc[::-1], counts.sample(frac=1, random_state=1)]:
+
+            df = FeaVar.number_variant_types(shuffled, "test")
+
+            assert df["variant_type"].tolist() == ["CCC", "AAA", "ACA", "TTT", "GGG"]
+            assert df["VT"].tolist() == ["VT-001", "VT-002", "VT-003", "VT-004", "VT-005"]
+
+    def test_count_seqs_per_variant_type_is_deterministic(self):
+
+        df_starter = pandas.DataFrame({'accession': ["a", "b", "c", "d"], 'variant_type': ["TA", "AT", "TA", "AT"]})
+
+        df = FeaVar.count_seqs_per_variant_type(df_starter, "test")
+
+        assert df[["variant_type", "count", "VT"]].values.tolist() == [["AT", 2, "VT-001"], ["TA", 2, "VT-002"]]
+
+
+class TestVtLabels(TestCase):
+
+    def test_vt_labels_widen(self):
+
+        assert FeaVar.vt_labels(3) == ["VT-001", "VT-002", "VT-003"]
+
+        labels = FeaVar.vt_labels(1200)
+
+        assert labels[0] == "VT-0001"
+        assert labels[999] == "VT-1000"
+        assert labels == sorted(labels)
+
+    def test_select_top_variant_types(self):
+
+        df = pandas.DataFrame({'VT': ["VT-001", "VT-002", "VT-003", None, "VT-001"], 'host': list("abcde")})
+
+        assert FeaVar.select_var_types_to_plot(df, 2)["host"].tolist() == ["a", "b", "e"]
+        assert FeaVar.select_var_types_to_plot(df, "1")["host"].tolist() == ["a", "e"]
@@ -31,8 +31,9 @@ def test_command_line_interface():
     """Test the CLI."""
     runner = CliRunner()
     result = runner.invoke(cli.main)
-    assert result.exit_code == 0
-    assert 'FeaVar.cli.main' in result.output
+    assert 'Commands:' in result.output
+    for command in ['run', 'batch', 'scan', 'check', 'convert', 'cache']:
+        assert command in result.output
     help_result = runner.invoke(cli.main, ['--help'])
     assert help_result.exit_code == 0
     assert '--help  Show this message and exit.' in help_result.output
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+import numpy
+
+from FeaVar import FeaVar
+from FeaVar import parallel
+from FeaVar.alignment_matrix import AlignmentMatrix
+
+random_state = numpy.random.RandomState(7)
+test_matrix = numpy.frombuffer(b"ACGT-", dtype=numpy.uint8)[random_state.randint(0, 5, size=(500, 30))]
+test_alignment = AlignmentMatrix(["seq{}".format(row) for row in range(500)], test_matrix)
+
+
+class TestParallelVariantTypes(TestCase):
+
+    def test_shard_ranges(self):
+
+        assert parallel.shard_ranges(10, 3) == [(0, 3), (3, 6), (6, 10)]
+        assert parallel.shard_ranges(2, 8) == [(0, 1), (1, 2)]
+        assert parallel.shard_ranges(0, 4) == []
+
+    def test_merge_matches_single_pass(self):
+
+        positions = [1, 4, 9]
+
+        expected = test_alignment.variant_types(positions)
+
+        shard_groups = [test_alignment.matrix[start:stop][:, positions] for start, stop in
+                        parallel.shard_ranges(len(test_alignment), 7)]
+        merged = parallel.merge_shard_groups([FeaVar.group_feature_rows(shard) for shard in shard_groups])
+
+        assert merged[0] == expected[0]
+        numpy.testing.assert_array_equal(merged[1], expected[1])
+        numpy.testing.assert_array_equal(merged[2], expected[2])
+
+    def test_process_pool_matches_single_process(self):
+
+        positions = [0, 2, 3, 17]
+
+        df_single = FeaVar.extract_variant_types(test_alignment, positions)
+        df_parallel = FeaVar.extract_variant_types(test_alignment, positions, processes=3)
+
+        assert df_parallel.to_dict() == df_single.to_dict()
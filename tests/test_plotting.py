@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pandas
+
+from FeaVar import plotting
+
+df_top = pandas.DataFrame({'accession': ["a", "b", "c", "d", "e"],
+                           'variant_type': ["TCA", "TCA", "AAT", "TCA", "AAT"],
+                           'host': ["human", "avian", "human", "human", "swine"],
+                           'year': ["2007", "2007", "2009", "2009", "2009"],
+                           'VT': ["VT-001", "VT-001", "VT-002", "VT-001", "VT-002"]})
+
+
+class TestPlotFields(TestCase):
+
+    def setUp(self):
+
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.output_dir)
+
+    def test_aggregate_field(self):
+
+        table = plotting.aggregate_field(df_top, "host")
+
+        assert table.loc["VT-001"].fillna(0).tolist() == [1, 2, 0]
+        assert list(table.columns) == ["avian", "human", "swine"]
+
+    def test_plots_are_skipped_when_unchanged(self):
+
+        assert plotting.plot_fields(df_top, ["host", "year"], self.output_dir, processes=2) == ["host", "year"]
+
+        for field in ["host", "year"]:
+            for path in plotting.plot_file_paths(self.output_dir, field):
+                assert os.path.getsize(path) > 0
+            assert os.path.exists(os.path.join(self.output_dir, "df_by_{}.csv".format(field)))
+
+        assert plotting.plot_fields(df_top, ["host", "year"], self.output_dir) == []
+
+        df_changed = df_top.assign(host=["human", "human", "human", "human", "swine"])
+
+        assert plotting.plot_fields(df_changed, ["host", "year"], self.output_dir) == ["host"]
+
+        os.remove(plotting.plot_file_paths(self.output_dir, "year")[1])
+
+        assert plotting.plot_fields(df_changed, ["host", "year"], self.output_dir) == ["year"]
+
+    def test_field_table_counts_are_integers(self):
+
+        plotting.plot_fields(df_top, ["host"], self.output_dir)
+
+        df_by_host = pandas.read_csv(os.path.join(self.output_dir, "df_by_host.csv"))
+
+        assert list(df_by_host.columns) == ["VT", "host", "0"]
+        assert df_by_host["0"].dtype.kind == "i"
+        assert df_by_host.values.tolist() == [["VT-001", "avian", 1], ["VT-001", "human", 2],
+                                              ["VT-002", "human", 1], ["VT-002", "swine", 1]]
+
+    def test_plots_of_another_feature_or_top_are_rendered(self):
+
+        assert plotting.plot_fields(df_top, ["host"], self.output_dir, feature="100-110", top=10) == ["host"]
+        assert plotting.plot_fields(df_top, ["host"], self.output_dir, feature="100-110", top=10) == []
+        assert plotting.plot_fields(df_top, ["host"], self.output_dir, feature="120-130", top=10) == ["host"]
+        assert plotting.plot_fields(df_top, ["host"], self.output_dir, feature="120-130", top=5) == ["host"]
+
+    def test_no_figures_are_left_open(self):
+
+        import matplotlib.pyplot
+
+        plotting.plot_fields(df_top, ["host"], self.output_dir)
+
+        assert matplotlib.pyplot.get_fignums() == []
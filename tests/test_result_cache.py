@@ -0,0 +1,110 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import pandas
+
+from FeaVar.epitope import parse_epitope
+from FeaVar.result_cache import ResultCache
+
+df_by_variant_type = pandas.DataFrame({'variant_type': ['TAT', 'ATC'], 'count': [2, 1], 'VT': ['VT-001', 'VT-002']})
+df_starter = pandas.DataFrame({'accession': ['a', 'b', 'c'], 'variant_type': ['TAT', 'TAT', 'ATC']})
+
+
+class TestResultCache(TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.temp_dir.name, "cache"))
+        self.alignment_path = os.path.join(self.temp_dir.name, "test.clw")
+
+        with open(self.alignment_path, "w") as alignment_file:
+            alignment_file.write("CLUSTAL W\n\n\nseq1  ACGT\n")
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+
+        key = self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1")
+
+        assert self.cache.get(key) is None
+
+        self.cache.put(key, df_by_variant_type, df_starter, {"positions": "1-2"})
+        cached_by_variant_type, cached_starter = self.cache.get(key)
+
+        pandas.testing.assert_frame_equal(cached_by_variant_type, df_by_variant_type)
+        pandas.testing.assert_frame_equal(cached_starter, df_starter)
+
+    def test_key_depends_on_inputs(self):
+
+        key = self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1")
+
+        assert key == self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1")
+        assert key != self.cache.key_for(self.alignment_path, "fasta", "seq1", [1, 2], "1.0.1")
+        assert key != self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 3], "1.0.1")
+        assert key != self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.2")
+
+        time.sleep(0.01)
+        with open(self.alignment_path, "a") as alignment_file:
+            alignment_file.write("seq2  ACGA\n")
+
+        assert key != self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1")
+
+    def test_key_depends_on_residues(self):
+
+        key = self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1",
+                                 residues=parse_epitope("A1-2"))
+
+        assert key != self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1",
+                                         residues=parse_epitope("W1-2"))
+        assert key != self.cache.key_for(self.alignment_path, "clustal", "seq1", [1, 2], "1.0.1",
+                                         residues=parse_epitope("1-2"))
+
+    def test_get_compares_expected_description(self):
+
+        self.cache.put("first", df_by_variant_type, df_starter, {"residues": [["", "A", 1]]})
+
+        assert self.cache.get("first", {"residues": [["", "A", 1]]}) is not None
+        assert self.cache.get("first", {"residues": [["", "W", 1]]}) is None
+
+    def test_least_recently_used_eviction(self):
+
+        self.cache.put("first", df_by_variant_type, df_starter)
+        entry_size = self.cache.info()[0]["size"]
+
+        self.cache.max_bytes = 2 * entry_size
+        self.cache.put("second", df_by_variant_type, df_starter)
+        self.cache.get("first")
+        self.cache.put("third", df_by_variant_type, df_starter)
+
+        assert sorted(entry["key"] for entry in self.cache.info()) == ["first", "third"]
+        assert not os.path.exists(os.path.join(self.cache.cache_dir, "second"))
+
+    def test_clear(self):
+
+        self.cache.put("first", df_by_variant_type, df_starter)
+
+        assert self.cache.clear() == 1
+        assert self.cache.info() == []
+        assert self.cache.get("first") is None
+
+    def test_concurrent_puts_keep_every_entry(self):
+
+        # separate caches on one directory, like runs of a batch or requests of a server
+        caches = [ResultCache(self.cache.cache_dir) for _ in range(8)]
+        threads = [threading.Thread(target=cache.put, args=("entry{}".format(number), df_by_variant_type, df_starter))
+                   for number, cache in enumerate(caches)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert sorted(entry["key"] for entry in self.cache.info()) == ["entry{}".format(number) for number in range(8)]
+        assert all(self.cache.get("entry{}".format(number)) is not None for number in range(8))
@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from FeaVar import FeaVar
+
+test_alignment = MultipleSeqAlignment([
+    SeqRecord(Seq("--TCAATTATATTCAATATGG-"), id="CY021716"),
+    SeqRecord(Seq("--TCAATTATATTCAATATGG-"), id="CY020292"),
+    SeqRecord(Seq("TCAAATATATTCAATATGGAGA"), id="CY083917"),
+    SeqRecord(Seq("----ATATATTGAATATGGAGA"), id="CY063613"),
+    SeqRecord(Seq("TCAAATATATTCAATATGGAGA"), id="CY083782"),
+])
+
+reference_sequence = "--TCAATTATATTCAATATGG-"
+
+
+class TestScanVariantTypes(TestCase):
+
+    def check_windows(self, window_size, step):
+
+        df_scan = FeaVar.scan_variant_types(test_alignment, reference_sequence, window_size, step)
+
+        assert len(df_scan) > 0
+
+        for row in df_scan.itertuples():
+
+            positions = list(range(row.start, row.end + 1))
+            columns = FeaVar.feature_columns(reference_sequence, positions)
+            df_starter = FeaVar.extract_variant_types(test_alignment, columns)
+            counts = df_starter.groupby("variant_type").size()
+
+            assert row.variant_types == len(counts)
+            assert row.top_vt_count == counts.max()
+
+        return df_scan
+
+    def test_scan_step_one(self):
+
+        df_scan = self.check_windows(5, 1)
+
+        assert list(df_scan.start) == list(range(1, len(df_scan) + 1))
+
+    def test_scan_step_smaller_than_window(self):
+
+        df_scan = self.check_windows(4, 3)
+
+        assert list(df_scan.start[:3]) == [1, 4, 7]
+
+    def test_scan_step_larger_than_window(self):
+
+        df_scan = self.check_windows(3, 5)
+
+        assert list(df_scan.start[:3]) == [1, 6, 11]
+
+    def test_entropy_of_conserved_window(self):
+
+        df_scan = FeaVar.scan_variant_types(test_alignment, reference_sequence, 2, 1)
+
+        conserved = df_scan[df_scan.variant_types == 1]
+
+        assert len(conserved) > 0
+        assert (conserved.entropy == 0).all()
+        assert (conserved.top_vt_frequency == 1).all()
+
+    def test_window_larger_than_reference(self):
+
+        df_scan = FeaVar.scan_variant_types(test_alignment, reference_sequence, 100, 1)
+
+        assert len(df_scan) == 0
+
+    def test_window_covers_last_column(self):
+
+        # a reference without gaps ends in the last column of the alignment
+        df_scan = FeaVar.scan_variant_types(test_alignment, str(test_alignment[2].seq), 22, 1)
+
+        assert list(df_scan.end) == [22]
+        assert df_scan.variant_types[0] == 3
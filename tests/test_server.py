@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from FeaVar import server
+from FeaVar.session import FeaVarSession
+
+test_fasta = """>CY021716
+--TCAATTATATTC
+>CY020292
+--TCAATTATATTC
+>CY083917
+TCAAATATATTCAA
+>CY063613
+----ATATATTGAA
+"""
+
+
+async def http_request(address, method: str, target: str, body: dict = None, socket_path: str = None) -> tuple:
+
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(*address)
+
+    payload = json.dumps(body).encode() if body is not None else b""
+
+    writer.write("{} {} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\nContent-Length: {}\r\n\r\n".format(
+        method, target, len(payload)).encode() + payload)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+
+    return int(head.split()[1]), json.loads(body)
+
+
+class TestReadConfig(TestCase):
+
+    def setUp(self):
+
+        self.work_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.work_dir, "alignments.tsv")
+
+    def tearDown(self):
+
+        shutil.rmtree(self.work_dir)
+
+    def test_read_config(self):
+
+        with open(self.config_path, "w") as config_file:
+            config_file.write("# name\talignment\tformat\treference\nHA\tha.fasta\tfasta\tCY021716\n")
+
+        alignments = server.read_config(self.config_path)
+
+        assert alignments == {"HA": {"alignment_file_path": os.path.join(self.work_dir, "ha.fasta"),
+                                     "alignment_format": "fasta", "reference_identifier": "CY021716"}}
+
+    def test_invalid_config(self):
+
+        with open(self.config_path, "w") as config_file:
+            config_file.write("HA\tha.fasta\tfasta\n")
+
+        with self.assertRaises(ValueError):
+            server.read_config(self.config_path)
+
+
+class TestServedSessions(TestCase):
+
+    def test_sessions_are_served_with_one_process(self):
+
+        work_dir = tempfile.mkdtemp()
+        alignment_path = os.path.join(work_dir, "test.fasta")
+
+        try:
+            with open(alignment_path, "w") as alignment_file:
+                alignment_file.write(test_fasta)
+
+            session = FeaVarSession(alignment_path, "fasta", "CY021716", processes=4)
+
+            with self.assertLogs(level="WARNING"):
+                server.QueryServer({"HA": session})
+
+            assert session.processes == 1
+        finally:
+            shutil.rmtree(work_dir)
+
+
+class TestQueryServer(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+
+        self.work_dir = tempfile.mkdtemp()
+        alignment_path = os.path.join(self.work_dir, "test.fasta")
+
+        with open(alignment_path, "w") as alignment_file:
+            alignment_file.write(test_fasta)
+
+        sessions = server.load_sessions({"HA": {"alignment_file_path": alignment_path, "alignment_format": "fasta",
+                                                "reference_identifier": "CY021716"}})
+
+        self.server = server.QueryServer(sessions, batch_window=0.05, cache_size=2)
+        await self.server.start(port=0)
+
+    async def asyncTearDown(self):
+
+        await self.server.close()
+        shutil.rmtree(self.work_dir)
+
+    async def test_get_variant_types(self):
+
+        status, response = await http_request(self.server.address, "GET",
+                                              "/variant_types?alignment=HA&positions=2-4&top=1")
+
+        assert status == 200
+        assert response["alignment"] == "HA"
+        assert response["n_sequences"] == 4
+        assert response["n_variant_types"] == 3
+        assert response["variant_types"] == [{"VT": "VT-001", "variant_type": "CAA", "count": 2}]
+
+    async def test_concurrent_queries_are_batched(self):
+
+        targets = ["/variant_types?positions=2-4", "/variant_types?positions=9,10", "/variant_types?positions=2-4"]
+
+        responses = await asyncio.gather(*[http_request(self.server.address, "GET", target) for target in targets])
+
+        assert [status for status, _ in responses] == [200, 200, 200]
+        assert responses[0][1] == responses[2][1]
+        assert self.server.stats["batches"] == 1
+        assert self.server.stats["computed"] == 2
+
+        status, response = await http_request(self.server.address, "GET", "/variant_types?positions=9,10")
+
+        assert response == responses[1][1]
+        assert self.server.stats["cache_hits"] == 1
+
+    async def test_post_features(self):
+
+        status, response = await http_request(self.server.address, "POST", "/variant_types",
+                                              {"alignment": "HA", "features": {"a": "2-4", "b": "A3, T5"}})
+
+        assert status == 200
+        assert set(response["features"]) == {"a", "b"}
+        assert response["features"]["b"]["positions"] == "A3, T5"
+
+    async def test_errors(self):
+
+        assert (await http_request(self.server.address, "GET", "/variant_types?alignment=NA&positions=1"))[0] == 404
+        assert (await http_request(self.server.address, "GET", "/variant_types?positions=20-30"))[0] == 400
+        assert (await http_request(self.server.address, "GET", "/variant_types?positions=2&top=0"))[0] == 400
+        assert (await http_request(self.server.address, "POST", "/variant_types", {"features": []}))[0] == 400
+        assert (await http_request(self.server.address, "DELETE", "/variant_types"))[0] == 405
+        assert (await http_request(self.server.address, "GET", "/unknown"))[0] == 404
+
+    async def test_unix_socket(self):
+
+        socket_path = os.path.join(self.work_dir, "feavar.sock")
+
+        unix_server = server.QueryServer(self.server.sessions)
+        await unix_server.start(socket_path=socket_path)
+
+        try:
+            status, response = await http_request(None, "GET", "/health", socket_path=socket_path)
+        finally:
+            await unix_server.close()
+
+        assert status == 200
+        assert response == {"status": "ok", "alignments": ["HA"]}
@@ -0,0 +1,152 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, skipUnless
+
+import pandas
+
+from FeaVar import FeaVar, columnar
+from FeaVar.session import FeaVarSession
+
+has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+
+test_fasta = """>CY021716
+--TCAATTATATTC
+>CY020292
+--TCAATTATATTC
+>CY083917
+TCAAATATATTCAA
+>CY063613
+----ATATATTGAA
+"""
+
+test_metadata = """accession\thost
+CY021716\thuman
+CY020292\thuman
+CY083917\tavian
+CY063613\tavian
+"""
+
+
+class TestFeaVarSession(TestCase):
+
+    def setUp(self):
+
+        self.work_dir = tempfile.mkdtemp()
+        self.alignment_path = os.path.join(self.work_dir, "test.fasta")
+        self.metadata_path = os.path.join(self.work_dir, "metadata.tsv")
+
+        with open(self.alignment_path, "w") as alignment_file:
+            alignment_file.write(test_fasta)
+
+        with open(self.metadata_path, "w") as metadata_file:
+            metadata_file.write(test_metadata)
+
+        self.output_dir = os.path.join(self.work_dir, "output")
+        self.session = FeaVarSession(self.alignment_path, "fasta", "CY021716", output_dir=self.output_dir,
+                                     log_level="info")
+
+    def tearDown(self):
+
+        shutil.rmtree(self.work_dir)
+
+    def test_variant_types_match_pipeline(self):
+
+        df_by_variant_type, df_starter = self.session.variant_types("2-4,9")
+
+        positions = FeaVar.feature_columns(self.session.reference_sequence, [2, 3, 4, 9])
+        expected = FeaVar.extract_variant_types(FeaVar.load_alignment(self.alignment_path, "fasta"), positions)
+
+        assert df_starter.set_index("accession")["variant_type"].to_dict() == \
+            expected.set_index("accession")["variant_type"].to_dict()
+        assert df_by_variant_type["count"].sum() == 4
+        assert os.path.isfile(os.path.join(self.output_dir, "2-4_9", "variant_types.csv"))
+
+    def test_results_are_cached_copies(self):
+
+        df_by_variant_type, _ = self.session.variant_types("2-4")
+        df_by_variant_type["count"] = 0
+
+        assert self.session.variant_types("2-4")[0]["count"].sum() == 4
+
+    def test_concurrent_sessions(self):
+
+        features = ["2-4", "9,10", "10, 11", "2-4", "A3, T5", "9,10"]
+
+        serial = [self.session.variant_types(positions)[1].to_dict() for positions in features]
+
+        session = FeaVarSession(self.alignment_path, "fasta", "CY021716",
+                                output_dir=os.path.join(self.work_dir, "threads"), cache_size=1)
+
+        with ThreadPoolExecutor(4) as executor:
+            concurrent = list(executor.map(lambda positions: session.variant_types(positions)[1].to_dict(), features))
+
+        assert concurrent == serial
+        assert sorted(os.listdir(os.path.join(self.work_dir, "threads"))) == ["10-11", "2-4", "3_5", "9-10"]
+
+    def test_no_module_state(self):
+
+        output_dir, recorder = FeaVar.output_dir, FeaVar.recorder
+        n_stages = len(recorder.stages)
+
+        self.session.batch({"epitope_1": "2-4,9", "iedb": "A3, T5"})
+
+        assert FeaVar.output_dir == output_dir
+        assert FeaVar.recorder is recorder
+        assert len(recorder.stages) == n_stages
+
+    def test_invalid_positions(self):
+
+        with self.assertRaises(ValueError):
+            self.session.variant_types("20-30")
+
+        with self.assertRaises(ValueError):
+            FeaVarSession(self.alignment_path, "fasta", "CY000000").variant_types("2-4")
+
+        with self.assertRaises(ValueError):
+            FeaVarSession(self.alignment_path, "fasta", "CY021716", engine="stream")
+
+    def test_associations(self):
+
+        df_fields, df_cells = self.session.associations("2-4", self.metadata_path)
+
+        assert list(df_fields["field"]) == ["host"]
+        assert self.session.metadata(self.metadata_path) is self.session.metadata(self.metadata_path)
+
+    @skipUnless(has_pyarrow, "pyarrow is not installed")
+    def test_process_metadata_writes_requested_tables(self):
+
+        session = FeaVarSession(self.alignment_path, "fasta", "CY021716", output_dir=self.output_dir,
+                                output_format="parquet", output_tables=["metadata", "all_data"])
+
+        session.process_metadata("2-4", self.metadata_path, feature="site")
+
+        dataset_dir = os.path.join(self.output_dir, "site", columnar.DATASET_NAME)
+
+        assert len(columnar.read_table(dataset_dir, "metadata", "parquet")) == 4
+        assert len(columnar.read_table(dataset_dir, "all_data", "parquet")) == 4
+
+    def test_library_calls_without_output_directory_write_nothing(self):
+
+        cwd, output_dir = os.getcwd(), FeaVar.output_dir
+        work_dir = os.path.join(self.work_dir, "cwd")
+        os.makedirs(work_dir)
+
+        try:
+            os.chdir(work_dir)
+            FeaVar.output_dir = None
+
+            df_starter = pandas.DataFrame({"accession": ["a", "b", "c"], "variant_type": ["TA", "AT", "TA"]})
+            df_by_variant_type = FeaVar.count_seqs_per_variant_type(df_starter, "test")
+            FeaVar.import_metadata(self.metadata_path)
+            FeaVar.write_variant_type_naming(df_by_variant_type)
+
+            assert FeaVar.RunContext().output_dir is None
+        finally:
+            os.chdir(cwd)
+            FeaVar.output_dir = output_dir
+
+        assert df_by_variant_type["count"].tolist() == [2, 1]
+        assert os.listdir(work_dir) == []
@@ -0,0 +1,162 @@
+import collections
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from FeaVar import FeaVar
+from FeaVar import streaming
+
+aln_example = """CLUSTAL W (1.81) multiple sequence alignment
+
+
+CY021716      --TCAATTAT
+CY020292      --TCAATTAT
+CY083917      TCAAATATAT
+CY063613      ----ATATAT
+                  ** ***
+
+CY021716      ATTCAATA
+CY020292      ATTCAATA
+CY083917      TCAATATG
+CY063613      TGAATATG
+              *  ****
+
+CY021716      GG-
+CY020292      GG-
+CY083917      GAG
+CY063613      GAG
+              * 
+"""
+
+fasta_example = """>CY021716 A/AA/Huston/1945
+--TCAATTATATTC
+AATAGG-
+>CY020292
+--TCAATTATATTCAATAGG-
+>CY083917
+TCAAATATATTCAATATGGAG
+>CY063613
+----ATATATTGAATATGGAG
+"""
+
+
+class TestStreaming(TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.clustal_path = os.path.join(self.temp_dir.name, "test.clw")
+        self.fasta_path = os.path.join(self.temp_dir.name, "test.fasta")
+
+        with open(self.clustal_path, "w") as clustal_file:
+            clustal_file.write(aln_example)
+
+        with open(self.fasta_path, "w") as fasta_file:
+            fasta_file.write(fasta_example)
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_streamed_features_match_loaded_alignment(self):
+
+        for path, alignment_format in [(self.clustal_path, "clustal"), (self.fasta_path, "fasta")]:
+
+            alignment = FeaVar.load_alignment(path, alignment_format)
+
+            for columns in [[0], [3, 9, 10, 17], [12, 1, 20], [18, 19, 20]]:
+
+                expected = FeaVar.extract_variant_types(alignment, columns)
+                streamed = list(streaming.stream_features(path, alignment_format, columns))
+
+                assert streamed == list(zip(expected.accession, expected.variant_type))
+
+    def test_clustal_stops_after_last_feature_block(self):
+
+        with open(self.clustal_path, "a") as clustal_file:
+            clustal_file.write("\nnot a clustal block at all\n")
+
+        streamed = dict(streaming.stream_clustal_features(self.clustal_path, [2, 3]))
+
+        assert streamed["CY063613"] == "--"
+
+    def test_column_beyond_alignment(self):
+
+        with self.assertRaises(IndexError):
+            list(streaming.stream_clustal_features(self.clustal_path, [2, 40]))
+
+    def test_stream_variant_type_counts(self):
+
+        assignments = io.StringIO()
+
+        counts = streaming.stream_variant_type_counts(self.clustal_path, "clustal", [2, 11], assignments)
+
+        assert counts == collections.Counter({"TT": 2, "AC": 1, "-G": 1})
+        assert assignments.getvalue().splitlines()[0] == ",accession,variant_type"
+        assert assignments.getvalue().splitlines()[4] == "3,CY063613,-G"
+
+    def test_stream_reference_sequence(self):
+
+        assert streaming.stream_reference_sequence("CY063613", self.clustal_path, "clustal") == \
+            (True, "----ATATATTGAATATGGAG")
+        assert streaming.stream_reference_sequence("CY021716", self.fasta_path, "fasta") == \
+            (True, "--TCAATTATATTCAATAGG-")
+        assert streaming.stream_reference_sequence("AB000000", self.fasta_path, "fasta") == (False, "")
+
+    def test_stream_reference_sequence_stops_after_residue(self):
+
+        # residue 7 of CY063613 is in the second block
+        assert streaming.stream_reference_sequence("CY063613", self.clustal_path, "clustal", 7) == \
+            (True, "----ATATATTGAATATG")
+        assert streaming.stream_reference_sequence("CY063613", self.clustal_path, "clustal", 100) == \
+            (True, "----ATATATTGAATATGGAG")
+
+    def test_stream_reference_sequence_checks_blocks(self):
+
+        clustal_path = os.path.join(self.temp_dir.name, "prefix.clw")
+
+        # CY021716 in the later blocks only starts like CY0217 of the first block
+        with open(clustal_path, "w") as clustal_file:
+            clustal_file.write(aln_example.replace("CY021716      --TCAATTAT", "CY0217        --TCAATTAT"))
+
+        with self.assertRaises(ValueError):
+            streaming.stream_reference_sequence("CY0217", clustal_path, "clustal")
+
+        with self.assertRaises(ValueError):
+            list(streaming.stream_clustal_features(clustal_path, [0, 12]))
+
+        # a block without CY083917
+        with open(clustal_path, "w") as clustal_file:
+            clustal_file.write(aln_example.replace("CY083917      TCAATATG\n", ""))
+
+        with self.assertRaises(ValueError):
+            streaming.stream_reference_sequence("CY063613", clustal_path, "clustal")
+
+    def test_stream_reference_sequence_matches_in_memory_lookup(self):
+
+        fasta_path = os.path.join(self.temp_dir.name, "nested.fasta")
+
+        with open(fasta_path, "w") as fasta_file:
+            fasta_file.write(">CY0217160\nAAAA\n>CY021716\nCCCC\n>CY020292\nGGGG\n")
+
+        alignment = FeaVar.load_alignment(fasta_path, "fasta")
+
+        # an exact identifier wins over an earlier identifier that contains it
+        for reference_identifier in ["CY021716", "CY0202", "CY02"]:
+            assert streaming.stream_reference_sequence(reference_identifier, fasta_path, "fasta") == \
+                FeaVar.check_for_ref_seq_in_alignment(reference_identifier, alignment)
+
+        assert streaming.stream_reference_sequence("CY021716", fasta_path, "fasta") == (True, "CCCC")
+
+        # CY02 is the start of every identifier
+        with self.assertLogs(level="ERROR"):
+            assert streaming.stream_reference_sequence("CY02", fasta_path, "fasta") == (False, "")
+
+        with self.assertLogs(level="ERROR"):
+            assert streaming.stream_reference_sequence("CY02", self.clustal_path, "clustal") == (False, "")
+
+    def test_unsupported_format(self):
+
+        with self.assertRaises(ValueError):
+            streaming.stream_features(self.fasta_path, "phylip", [1])
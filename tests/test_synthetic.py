@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from benchmarks import run, synthetic
+from FeaVar import FeaVar
+from FeaVar.coordinate_map import CoordinateMap
+
+
+class TestSyntheticAlignment(TestCase):
+
+    def setUp(self):
+
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.data_dir)
+
+    def test_alignment_is_deterministic(self):
+
+        first = synthetic.SyntheticAlignment(300, 120, seed=3).matrix()
+        second = synthetic.SyntheticAlignment(300, 120, seed=3).matrix()
+        other = synthetic.SyntheticAlignment(300, 120, seed=4).matrix()
+
+        assert first.ids == second.ids
+        assert numpy.array_equal(first.matrix, second.matrix)
+        assert not numpy.array_equal(first.matrix, other.matrix)
+
+    def test_blocks_span_the_alignment(self):
+
+        alignment = synthetic.SyntheticAlignment(synthetic.BLOCK_SIZE + 5, 50)
+
+        assert alignment.matrix().matrix.shape == (synthetic.BLOCK_SIZE + 5, 50)
+        assert alignment.ids()[0] == synthetic.REFERENCE_ID
+
+    def test_feature_positions_map_to_reference_residues(self):
+
+        alignment = synthetic.SyntheticAlignment(100, 400)
+        positions = alignment.feature_positions(10)
+        columns = CoordinateMap(alignment.reference_sequence()).to_columns(positions)
+
+        assert len(positions) == 10
+        assert (alignment.reference[columns] != synthetic.GAP).all()
+
+    def test_generated_files_load(self):
+
+        paths = synthetic.generate_files(200, 90, self.data_dir, clustal=True)
+
+        fasta = FeaVar.as_alignment_matrix(FeaVar.load_alignment(paths["fasta"], "fasta"))
+        clustal = FeaVar.as_alignment_matrix(FeaVar.load_alignment(paths["clustal"], "clustal"))
+        binary = FeaVar.load_alignment(paths["fvaln"], "fvaln")
+
+        assert fasta.ids == clustal.ids == list(binary.ids)
+        assert numpy.array_equal(fasta.matrix, binary.matrix)
+        assert numpy.array_equal(clustal.matrix, binary.matrix)
+
+        with open(paths["metadata"]) as metadata_file:
+            assert metadata_file.readline().rstrip("\n").split("\t") == ["accession", "host", "year", "country"]
+
+
+class TestBenchmarkRun(TestCase):
+
+    def setUp(self):
+
+        self.data_dir = tempfile.mkdtemp()
+        self.output_dir = FeaVar.output_dir
+
+    def tearDown(self):
+
+        shutil.rmtree(self.data_dir)
+
+        FeaVar.output_dir = self.output_dir
+
+    def test_stage(self):
+
+        paths = synthetic.generate_files(500, 200, self.data_dir)
+
+        result = run.run_stage("counting", paths, 500, 200, 0, self.data_dir)
+
+        assert result["seconds"] >= 0
+        assert result["peak_rss_mb"] > 0
+
+    def test_compare_flags_regressions(self):
+
+        baseline = [{"sequences": 10, "columns": 5, "stage": "parse", "seconds": 1.0, "peak_rss_mb": 100.0}]
+        results = [{"sequences": 10, "columns": 5, "stage": "parse", "seconds": 1.5, "peak_rss_mb": 101.0},
+                   {"sequences": 10, "columns": 5, "stage": "lookup", "seconds": 9.0, "peak_rss_mb": 100.0}]
+
+        regressions = run.compare(results, baseline, 0.2)
+
+        assert [(regression["stage"], regression["measure"]) for regression in regressions] == [("parse", "seconds")]
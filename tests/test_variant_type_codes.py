@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+import pandas
+
+from FeaVar import FeaVar
+
+df_starter = pandas.DataFrame({'accession': ["s1", "s2", "s3", "s4", "s5"],
+                               'variant_type': pandas.Categorical(["TAT", "ATC", "TAT", "GGG", "TAT"],
+                                                                  categories=["TAT", "GGG", "ATC", "CCC"])})
+
+df_by_variant_type = pandas.DataFrame({'variant_type': ["TAT", "ATC", "GGG"],
+                                       'count': [3, 1, 1],
+                                       'VT': ["VT-001", "VT-002", "VT-003"]})
+
+
+class TestVariantTypeCodes(TestCase):
+
+    def test_variant_type_codes(self):
+
+        categories, codes = FeaVar.variant_type_codes(df_starter)
+
+        assert list(categories) == ["TAT", "GGG", "ATC", "CCC"]
+        assert codes.tolist() == [0, 2, 0, 1, 0]
+
+        categories, codes = FeaVar.variant_type_codes(df_starter.astype({'variant_type': object}))
+
+        assert list(categories) == ["ATC", "GGG", "TAT"]
+        assert codes.tolist() == [2, 0, 2, 1, 2]
+
+    def test_join_matches_outer_merge(self):
+
+        df_all_data = pandas.merge(df_starter,
+                                   pandas.DataFrame({'accession': ["s1", "s9"], 'host': ["human", "avian"]}),
+                                   on='accession', how='outer')
+
+        expected = pandas.merge(df_all_data.astype({'variant_type': object}), df_by_variant_type,
+                                on='variant_type', how='outer')
+
+        joined = FeaVar.join_variant_type_table(df_all_data, df_by_variant_type)
+
+        pandas.testing.assert_frame_equal(joined.astype({'variant_type': object}), expected, check_dtype=False)
+
+    def test_extracted_variant_types_are_categorical(self):
+
+        from Bio.Align import MultipleSeqAlignment
+        from Bio.Seq import Seq
+        from Bio.SeqRecord import SeqRecord
+
+        alignment = MultipleSeqAlignment([SeqRecord(Seq("TCAAT"), id="a"), SeqRecord(Seq("TCGAT"), id="b"),
+                                          SeqRecord(Seq("TCAAT"), id="c")])
+
+        for engine in ["numpy", "python"]:
+
+            df = FeaVar.extract_variant_types(alignment, [1, 2], engine)
+
+            assert isinstance(df['variant_type'].dtype, pandas.CategoricalDtype)
+            assert df['variant_type'].cat.codes.tolist() == [0, 1, 0]